@@ -21,6 +21,18 @@ class DingTalkConfig(object):
         DING_APP_KEY = ""
         DING_APP_SECRET = ""
 
+    # access_token 在过期前多少秒刷新(需大于 client 本地缓存的 60 秒)
+    DING_ACCESS_TOKEN_EARLY_REFRESH = 300
+    # 钉钉 OpenApi 共用 HTTP 连接池的大小(每个域名)
+    DING_HTTP_POOL_SIZE = 20
+    # 钉钉 OpenApi 地址, 为空使用 dingtalk-sdk 默认地址; 测试时可指向本地的模拟服务
+    DING_API_BASE_URL = env.str("DING_API_BASE_URL", "")
+
+    # 工作通知推送: 并发数, 每个微应用每秒请求数(与钉钉接口 QPS 配额一致, 由 redis 在所有进程间共享), 可重试错误的最大重试次数
+    DING_SEND_CONCURRENCY = 8
+    DING_SEND_QPS = 20
+    DING_SEND_MAX_RETRIES = 3
+
     IHCM_SURVEY_HOST = ""
     # 星集团总部部门ID
     DING_FOSUN_GROUP_HEAD_ROOT_ID = ""
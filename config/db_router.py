@@ -76,6 +76,11 @@ class DatabaseRouter(object):
     def allow_migrate(self, db, app_label, model=None, **hints):
         """ Make sure the auth app only appears in the 'auth_db' database."""
 
+        # 指定了目标库的迁移操作(如 RunPython(hints={'target_db': 'bbs_user'})), 只在该库上执行
+        target_db = hints.get('target_db')
+        if target_db is not None:
+            return db == target_db
+
         if app_label in self.apps_router_mapping:
             if settings.DEBUG:
                 logger.info("DatabaseRouter.allow_migrate() 001 => db1:{}, app_label:{}, "
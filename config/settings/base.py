@@ -373,11 +373,35 @@ COMPRESS_PRECOMPILERS = [
 ]
 
 
+# DB Connections Pool
+# ------------------------------------------------------------------------------
+# 是否开放连接池统计接口: /api/v1/circle/monitor/db/pool/stats
+DB_POOL_STATS_API = env.bool("DB_POOL_STATS_API", False)
+# 各进程发布连接池统计到 Redis 的间隔(秒), 供 manage.py db_pool_stats 读取, 0 为不发布
+DB_POOL_STATS_PUBLISH_INTERVAL = env.int("DB_POOL_STATS_PUBLISH_INTERVAL", 0)
+# 进程启动(app ready / celery 子进程初始化)时每个库预先建立的连接数, 0 为不预热, 不超过 POOL_SIZE
+DB_POOL_WARMUP = env.int("DB_POOL_WARMUP", 0)
+# 批量插入(fosun_circle.core.db.bulk.bulk_insert)每块的条数
+DB_BULK_INSERT_CHUNK_SIZE = env.int("DB_BULK_INSERT_CHUNK_SIZE", 5000)
+
+
+# Snowflake
+# ------------------------------------------------------------------------------
+# worker id 租约时长(秒): 各进程从 Redis 租用互不相同的 worker id, 每 1/3 租约时长心跳续租, 0 为不租用(随机选取)
+SNOWFLAKE_WORKER_LEASE_TTL = env.int("SNOWFLAKE_WORKER_LEASE_TTL", 30)
+
+
 # Minify-Html
 # ------------------------------------------------------------------------------
 # https://github.com/cobrateam/django-htmlmin
 HTML_MINIFY = False
-HTML_MIN_PARSER = 'html.parser'  # [html.parser, html5lib] -> 子组件的自组件无法正产展示
+# [stream, html.parser, html5lib]: stream 为不构建 DOM 的流式压缩, 原样保留标签;
+# html.parser, html5lib -> 子组件的自组件无法正产展示
+HTML_MIN_PARSER = 'stream'
+HTML_MINIFY_CACHE_SIZE = 256
+# 压缩结果缓存: 单个页面超过 MAX_LENGTH 字符不缓存, 缓存总大小不超过 MAX_BYTES(每个进程)
+HTML_MINIFY_CACHE_MAX_LENGTH = 512 * 1024
+HTML_MINIFY_CACHE_MAX_BYTES = 16 * 1024 * 1024
 EXCLUDE_FROM_MINIFYING = ('^api/', )
 KEEP_COMMENTS_ON_MINIFYING = False
 CONSERVATIVE_WHITESPACE_ON_MINIFYING = True
@@ -586,7 +610,8 @@ REST_FRAMEWORK = {
 
     "DEFAULT_RENDERER_CLASSES":
         (
-            "rest_framework.renderers.JSONRenderer",
+            # "rest_framework.renderers.JSONRenderer",
+            APP_NAME + ".contrib.drf.renderers.StandardJSONRenderer",  # 渲染时直接输出标准响应结构
         ),
 
     # EXCEPTION_HANDLER
@@ -735,6 +760,12 @@ CIRCLE_SERVICE_HOST = 'http://bms:8000'
 CIRCLE_MONITOR_API = 'api/v1/circle/monitor/robot/send'
 CIRCLE_ERROR_PAGE_URL = 'circle/monitor/devops/notification'
 
+# 星圈发帖列表: 首页缓存秒数(0 为不缓存), 游标分页总数缓存秒数
+CIRCLE_LIST_CACHE_TTL = 10
+CIRCLE_LIST_COUNT_CACHE_TTL = 60
+# 管理端标签列表(含发帖数)缓存秒数, 0 为不缓存
+CIRCLE_TAG_LIST_CACHE_TTL = 60
+
 from config.conf.awesome_ui import *
 
 # Refused to apply style from '<URL>' because its MIME type ('application/json') is not a supported stylesheet MIME
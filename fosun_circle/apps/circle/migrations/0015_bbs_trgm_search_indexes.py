@@ -0,0 +1,69 @@
+# 星圈模糊搜索(LIKE '%key%')的 pg_trgm GIN 索引
+# 表在 bbs_user 库中, 不由本项目的 Model 管理, 只在 bbs_user 库上执行(RunPython hints: target_db, 见 config/db_router.py),
+# `migrate`(default 库) 时跳过。
+#
+# 部署步骤:
+#   1. DBA(需要超级用户或有 CREATE 权限的角色)在 bbs_user 库执行: CREATE EXTENSION IF NOT EXISTS pg_trgm;
+#   2. python manage.py migrate circle 0015 --database=bbs_user
+#      (circle 的其他迁移被 router 跳过, 只在 bbs_user 的 django_migrations 中记录)
+#
+# 注意: 少于 3 个字符的关键字没有 trigram, 索引无法缩小范围, 仍然扫描全表(见 CircleBBSService.like_pattern)
+
+from django.db import migrations
+
+BBS_ALIAS = 'bbs_user'
+
+TRGM_INDEXES = [
+    ('"starCircle_starcircle"', 'content', 'starcircle_content_trgm_idx'),
+    ('"starCircle_circlecomment"', 'content', 'circlecomment_content_trgm_idx'),
+    ('users_userinfo', 'fullname', 'userinfo_fullname_trgm_idx'),
+]
+
+
+def _get_bbs_connection(schema_editor):
+    connection = schema_editor.connection
+
+    if connection.alias != BBS_ALIAS or connection.vendor != 'postgresql':
+        return None
+
+    return connection
+
+
+def create_trgm_indexes(apps, schema_editor):
+    connection = _get_bbs_connection(schema_editor)
+    if connection is None:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            raise RuntimeError("bbs_user 库未安装 pg_trgm 扩展, 请先由 DBA 执行: CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+        # CONCURRENTLY: 建索引期间不锁表写入, 不能在事务中执行
+        for table, column, index_name in TRGM_INDEXES:
+            cursor.execute(
+                'CREATE INDEX CONCURRENTLY IF NOT EXISTS %s ON %s USING gin (%s gin_trgm_ops)'
+                % (index_name, table, column)
+            )
+
+
+def drop_trgm_indexes(apps, schema_editor):
+    connection = _get_bbs_connection(schema_editor)
+    if connection is None:
+        return
+
+    with connection.cursor() as cursor:
+        for _, _, index_name in TRGM_INDEXES:
+            cursor.execute('DROP INDEX CONCURRENTLY IF EXISTS %s' % index_name)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('circle', '0014_circleannualpersonalsummarymodel_only_visitor'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trgm_indexes, drop_trgm_indexes, hints={'target_db': BBS_ALIAS}),
+    ]
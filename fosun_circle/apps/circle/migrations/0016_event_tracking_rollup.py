@@ -0,0 +1,71 @@
+# Generated by Django 3.1.14 on 2026-10-18 10:00
+
+from django.db import migrations, models
+import fosun_circle.core.db.base
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('circle', '0015_bbs_trgm_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventTrackingDailyModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creator', models.CharField(default=fosun_circle.core.db.base.AutoExecutor(), max_length=200, verbose_name='创建人')),
+                ('modifier', models.CharField(default=fosun_circle.core.db.base.AutoExecutor(), max_length=200, verbose_name='创建人')),
+                ('create_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('is_del', models.BooleanField(default=False, verbose_name='是否删除')),
+                ('day', models.DateField(unique=True, verbose_name='日期')),
+                ('dau_cnt', models.IntegerField(default=0, verbose_name='日活')),
+                ('pv_cnt', models.IntegerField(default=0, verbose_name='访问次数')),
+                ('login_cnt', models.IntegerField(default=0, verbose_name='登录次数')),
+                ('hr_dau_cnt', models.IntegerField(default=0, verbose_name='HR知乎日活')),
+                ('hr_pv_cnt', models.IntegerField(default=0, verbose_name='HR知乎访问次数')),
+            ],
+            options={
+                'db_table': 'circle_event_tracking_daily',
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupWatermarkModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creator', models.CharField(default=fosun_circle.core.db.base.AutoExecutor(), max_length=200, verbose_name='创建人')),
+                ('modifier', models.CharField(default=fosun_circle.core.db.base.AutoExecutor(), max_length=200, verbose_name='创建人')),
+                ('create_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('is_del', models.BooleanField(default=False, verbose_name='是否删除')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='汇总名称')),
+                ('last_id', models.BigIntegerField(default=0, verbose_name='已处理的最大id')),
+            ],
+            options={
+                'db_table': 'circle_rollup_watermark',
+            },
+        ),
+        migrations.CreateModel(
+            name='EventTrackingDailyUserModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creator', models.CharField(default=fosun_circle.core.db.base.AutoExecutor(), max_length=200, verbose_name='创建人')),
+                ('modifier', models.CharField(default=fosun_circle.core.db.base.AutoExecutor(), max_length=200, verbose_name='创建人')),
+                ('create_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('is_del', models.BooleanField(default=False, verbose_name='是否删除')),
+                ('day', models.DateField(verbose_name='日期')),
+                ('user_id', models.IntegerField(default=0, verbose_name='bbs用户ID(-1: 未登录)')),
+                ('mobile', models.CharField(blank=True, default='', max_length=50, verbose_name='用户手机')),
+                ('pv_cnt', models.IntegerField(default=0, verbose_name='访问次数')),
+                ('login_cnt', models.IntegerField(default=0, verbose_name='登录次数(tracking_type=1)')),
+                ('hr_pv_cnt', models.IntegerField(default=0, verbose_name='HR知乎访问次数(tracking_type=6,7)')),
+            ],
+            options={
+                'db_table': 'circle_event_tracking_daily_user',
+                'unique_together': {('day', 'user_id')},
+            },
+        ),
+    ]
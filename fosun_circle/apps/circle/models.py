@@ -210,3 +210,38 @@ class CircleAnnualPersonalSummaryModel(BaseAbstractModel):
     class Meta:
         db_table = "circle_annual_summary"
 
+
+class EventTrackingDailyUserModel(BaseAbstractModel):
+    """ 埋点按天按人汇总(由 bbs 库 event_tracking_uv 增量汇总), 用于 MAU 去重 """
+    day = models.DateField(verbose_name="日期")
+    user_id = models.IntegerField(verbose_name="bbs用户ID(-1: 未登录)", default=0)
+    mobile = models.CharField(verbose_name="用户手机", max_length=50, default="", blank=True)
+    pv_cnt = models.IntegerField(verbose_name="访问次数", default=0)
+    login_cnt = models.IntegerField(verbose_name="登录次数(tracking_type=1)", default=0)
+    hr_pv_cnt = models.IntegerField(verbose_name="HR知乎访问次数(tracking_type=6,7)", default=0)
+
+    class Meta:
+        db_table = "circle_event_tracking_daily_user"
+        unique_together = [("day", "user_id")]
+
+
+class EventTrackingDailyModel(BaseAbstractModel):
+    """ 埋点按天汇总, 统计接口只读取这张表 O(days) 行 """
+    day = models.DateField(verbose_name="日期", unique=True)
+    dau_cnt = models.IntegerField(verbose_name="日活", default=0)
+    pv_cnt = models.IntegerField(verbose_name="访问次数", default=0)
+    login_cnt = models.IntegerField(verbose_name="登录次数", default=0)
+    hr_dau_cnt = models.IntegerField(verbose_name="HR知乎日活", default=0)
+    hr_pv_cnt = models.IntegerField(verbose_name="HR知乎访问次数", default=0)
+
+    class Meta:
+        db_table = "circle_event_tracking_daily"
+
+
+class RollupWatermarkModel(BaseAbstractModel):
+    """ 增量汇总的水位线: 已处理的源表最大 id """
+    name = models.CharField(verbose_name="汇总名称", max_length=100, unique=True)
+    last_id = models.BigIntegerField(verbose_name="已处理的最大id", default=0)
+
+    class Meta:
+        db_table = "circle_rollup_watermark"
@@ -1,12 +1,19 @@
+import re
+import json
+import base64
+import hashlib
 import datetime
 import os.path
 import traceback
 import typing
 
+from django.conf import settings
+from django.core.cache import cache
 from django.db import connections, transaction
 from rest_framework.response import Response
 
 from fosun_circle.libs.log import dj_logger as logger
+from .models import EventTrackingDailyModel, EventTrackingDailyUserModel
 
 
 class CircleBBSService:
@@ -19,10 +26,18 @@ class CircleBBSService:
     IMAGE_SUFFIX_LIST = [".jpg", ".jpeg", ".png", ".svg", ".blob"]
     VIDEO_SUFFIX_LIST = [".mp4", ".avi", ".wmv", ".mpg", ".mpeg", ".mov", ".rm", ".ram"]
 
+    SORTED_FIELD_REGEX = re.compile(r"^[A-Za-z_]\w*$")
+    CIRCLE_COUNT_CACHE_PREFIX = "circle_list_count_"
+    CIRCLE_LIST_CACHE_PREFIX = "circle_list_"
+    CIRCLE_LIST_VERSION_KEY = "circle_list_version"
+    TAG_LIST_CACHE_PREFIX = "circle_tag_list_"
+    TAG_LIST_VERSION_KEY = "circle_tag_list_version"
+
     def __init__(self, request, is_esg=False):
         self._request = request
         self._is_esg = is_esg
         self._connection = connections['bbs_user']
+        self._query_params = None
 
     @property
     def query_params(self):
@@ -50,6 +65,13 @@ class CircleBBSService:
         return is_esg
 
     def get_query_params(self):
+        """ 请求参数(含按 tag_id 查询的发帖 id), 每个请求只解析一次 """
+        if self._query_params is None:
+            self._query_params = self._parse_query_params()
+
+        return self._query_params
+
+    def _parse_query_params(self):
         query_params = self.query_params
 
         is_esg = self.has_esg
@@ -78,18 +100,28 @@ class CircleBBSService:
         extra_params = {k: query_params[k] for k in query_params if k not in params}
         return dict(params, **extra_params)
 
+    @staticmethod
+    def like_pattern(keyword):
+        """ 包含 keyword 的 LIKE 参数, 转义通配符
+
+        pg_trgm GIN 索引(circle/migrations/0015)只对至少 3 个字符的 keyword 有效: 1~2 个字符(多数中文搜索)
+        没有 trigram, 仍然扫描全表或整个索引, 耗时随数据量增长
+        """
+        keyword = keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return "%" + keyword + "%"
+
     def _get_string_by_list(self, column_list):
         str_list = [isinstance(s, (str, bytes)) and s or str(s) for s in column_list]
         return ", ".join(str_list)
 
-    def _get_sql_results(self, sql, fields=None, alias=None):
+    def _get_sql_results(self, sql, fields=None, alias=None, params=None):
         if alias is None:
             conn = self._connection
         else:
             conn = connections[alias]
 
         cursor = conn.cursor()
-        cursor.execute(sql)
+        cursor.execute(sql, params)
         db_results = cursor.fetchall()
 
         if not fields:
@@ -142,10 +174,46 @@ class CircleBBSService:
         db_results = self._get_sql_results(sql, fields=fields)
         return {item['id']: item for item in db_results}
 
+    @staticmethod
+    def _encode_cursor(created_time, circle_id):
+        """ 游标: 上一页最后一条的 (created_time, id), 对调用方不透明 """
+        raw = json.dumps([created_time.isoformat(), circle_id]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            created_time, circle_id = json.loads(raw)
+            return datetime.datetime.fromisoformat(created_time), int(circle_id)
+        except (ValueError, TypeError):
+            raise AssertionError("cursor parameter is error!")
+
+    def _get_cached_count(self, where, params):
+        """ 游标分页的总数: 同一查询条件在 CIRCLE_LIST_COUNT_CACHE_TTL 秒内只 COUNT 一次 """
+        count_sql = 'SELECT COUNT(1) FROM "starCircle_starcircle" ' + where
+        digest = hashlib.md5(json.dumps([count_sql, params], default=str).encode()).hexdigest()
+        cache_key = self.CIRCLE_COUNT_CACHE_PREFIX + digest
+
+        total_count = cache.get(cache_key)
+        if total_count is None:
+            db_results = self._get_sql_results(count_sql, params=params)
+            total_count = db_results[0][0] if db_results else 0
+            cache.set(cache_key, total_count, getattr(settings, "CIRCLE_LIST_COUNT_CACHE_TTL", 60))
+
+        return total_count
+
     def _get_circle_data_from_db(
             self,
             content=None, circle_ids=None,
             visible_range=None, is_count=True, paginate=True):
+        """ 发帖列表
+
+        分页方式:
+            page/page_size: OFFSET/LIMIT, 每页都执行 COUNT
+            cursor/page_size: 按 (created_time, id) 的游标分页(cursor 为空即第一页), 翻到第 N 页与第一页开销相同;
+                返回 next_cursor(没有下一页为 None), total_count 为缓存的总数
+        """
         query_params = self.get_query_params()
 
         fields = [
@@ -159,17 +227,22 @@ class CircleBBSService:
             FROM "starCircle_starcircle" 
         """
         where = "WHERE is_delete=false"
+        params = []
 
+        # 模糊搜索走 pg_trgm GIN 索引(circle/migrations/0015), 少于 3 个字符时仍是全表扫描
         content = content or query_params.get('content')
         if content:
-            where += " AND content like '%%%s%%' " % content
+            where += " AND content LIKE %s "
+            params.append(self.like_pattern(content))
 
         if query_params.get('user_id'):
-            where += " AND user_id=%s " % query_params['user_id']
+            where += " AND user_id=%s "
+            params.append(int(query_params['user_id']))
 
         circle_ids = circle_ids or query_params.get('circle_ids')
         if circle_ids:
-            where += " AND id IN (%s) " % self._get_string_by_list(circle_ids)
+            where += " AND id = ANY(%s) "
+            params.append([int(circle_id) for circle_id in circle_ids])
 
         # ESG发帖单独逻辑
         if query_params.get('is_esg'):
@@ -178,7 +251,8 @@ class CircleBBSService:
             where += " AND is_esg=false"
             visible_range = query_params.get('visible_range') if visible_range is None else visible_range
             if visible_range:
-                where += " AND visible_range='%s'" % visible_range
+                where += " AND visible_range=%s"
+                params.append(visible_range)
 
         # 置顶帖
         is_tag_page_top = query_params.get('is_tag_page_top')
@@ -187,22 +261,50 @@ class CircleBBSService:
 
         # 排序
         order_by = ''
-        if query_params.get('sorted_field'):
-            sorted_field = query_params['sorted_field']
+        cursor = query_params.get('cursor')
+        sorted_field = query_params.get('sorted_field')
+        if sorted_field:
+            assert self.SORTED_FIELD_REGEX.match(sorted_field), "sorted_field parameter is error!"
+            # 游标只记录 (created_time, id), 不能按其他字段翻页
+            assert cursor is None or sorted_field == 'created_time', "cursor only supports sorted_field=created_time!"
+
             has_upper = any([c.isupper() for c in sorted_field])
             sorted_field = '"%s"' % sorted_field if has_upper else sorted_field
-            order_by += ' ORDER BY %s DESC ' % sorted_field
+            order_by += ' ORDER BY %s DESC, id DESC ' % sorted_field
 
         page_size = query_params['page_size']
-        offset = (query_params['page'] - 1) * page_size
+
+        # 游标分页
+        if paginate and cursor is not None:
+            keyset_where, keyset_params = where, list(params)
+
+            if cursor:
+                keyset_where += " AND (created_time, id) < (%s, %s) "
+                keyset_params.extend(self._decode_cursor(cursor))
+
+            # 多取一条判断是否存在下一页
+            keyset_sql = sql + keyset_where + ' ORDER BY created_time DESC, id DESC LIMIT %s'
+            circle_list = self._get_sql_results(keyset_sql, fields=fields, params=keyset_params + [page_size + 1])
+
+            next_cursor = None
+            if len(circle_list) > page_size:
+                circle_list = circle_list[:page_size]
+                last_item = circle_list[-1]
+                next_cursor = self._encode_cursor(last_item['created_time'], last_item['id'])
+
+            total_count = self._get_cached_count(where, params) if is_count else 0
+            return dict(circle_list=circle_list, total_count=total_count, next_cursor=next_cursor)
+
+        sql += where + order_by
 
         if paginate:
-            sql += where + order_by + " OFFSET %s LIMIT %s" % (offset, page_size)
+            offset = (query_params['page'] - 1) * page_size
+            sql += " OFFSET %s LIMIT %s" % (offset, page_size)
 
-        circle_list = self._get_sql_results(sql, fields=fields)
+        circle_list = self._get_sql_results(sql, fields=fields, params=params)
 
         if is_count:
-            db_results = self._get_sql_results('SELECT COUNT(1) FROM "starCircle_starcircle" ' + where)
+            db_results = self._get_sql_results('SELECT COUNT(1) FROM "starCircle_starcircle" ' + where, params=params)
             total_count = db_results[0][0] if db_results else 0
         else:
             total_count = 0
@@ -221,8 +323,11 @@ class CircleBBSService:
             return dict(comment_list=[], total_count=0)
 
         where = ' WHERE is_delete=false '
+        params = []
+
         if circle_ids:
-            where += "  AND circle_id IN (%s) " % self._get_string_by_list(circle_ids)
+            where += "  AND circle_id = ANY(%s) "
+            params.append([int(circle_id) for circle_id in circle_ids])
 
         if is_esg is not None:
             esg_bool = is_esg and 'true' or 'false'
@@ -230,17 +335,21 @@ class CircleBBSService:
                      ' WHERE tbb.is_esg=%s AND tbb.id=tba.circle_id)' % esg_bool
 
         if ids:
-            where += "  AND nid IN (%s) " % self._get_string_by_list(ids)
+            where += "  AND nid = ANY(%s) "
+            params.append([int(nid) for nid in ids])
 
+        # 模糊搜索走 pg_trgm GIN 索引(circle/migrations/0015), 少于 3 个字符时仍是全表扫描
         if content:
-            where += "  AND content like '%%%s%%' " % content
+            where += "  AND content LIKE %s "
+            params.append(self.like_pattern(content))
 
-        db_results = self._get_sql_results('SELECT COUNT(1) FROM "starCircle_circlecomment" tba ' + where)
+        count_sql = 'SELECT COUNT(1) FROM "starCircle_circlecomment" tba '
+        db_results = self._get_sql_results(count_sql + where, params=params)
         total_count = db_results[0][0] if db_results else 0
 
         if count:
             fields = ['circle_id', 'cnt']
-            sql = 'SELECT circle_id, COUNT(circle_id) FROM "starCircle_circlecomment" '
+            sql = 'SELECT circle_id, COUNT(circle_id) FROM "starCircle_circlecomment" tba '
             where += ' GROUP BY circle_id'
         else:
             fields = ['nid', 'created_time', 'content', 'circle_id', 'is_show',
@@ -256,56 +365,9 @@ class CircleBBSService:
             if paginate:
                 where += ' OFFSET %s LIMIT %s ' % ((page - 1) * page_size, page_size)
 
-        comment_list = self._get_sql_results(sql + where, fields=fields)
+        comment_list = self._get_sql_results(sql + where, fields=fields, params=params)
         return dict(comment_list=comment_list, total_count=total_count)
 
-    def _get_image_mapping(self, circle_ids):
-        if not circle_ids:
-            return {}
-
-        image_mapping = {}
-        circle_ids_str = self._get_string_by_list(circle_ids)
-        sql = 'SELECT id, url, circle_id FROM "starCircle_circleimage" WHERE circle_id IN (%s) ORDER BY id ASC'
-
-        for item in self._get_sql_results(sql % circle_ids_str):
-            url = item[1]
-            circle_id = item[2]
-
-            if url:
-                image_mapping.setdefault(circle_id, []).append(dict(id=item[0], url=url))
-
-        return image_mapping
-
-    def _get_tag_mapping(self, circle_ids):
-        tag_mapping = {}
-        if not circle_ids:
-            return tag_mapping
-
-        circle_ids_str = self._get_string_by_list(circle_ids)
-        sql = 'SELECT tag_id, circle_id FROM "starCircle_circle2tag" WHERE circle_id IN (%s)' % circle_ids_str
-        db_results = self._get_sql_results(sql)
-        tag_ids = [item[0] for item in db_results]
-
-        tag_dict = {}
-        tag_ids_str = self._get_string_by_list(tag_ids)
-
-        if tag_ids_str:
-            tag_sql = 'SELECT id, title FROM "starCircle_tag" ' \
-                      'WHERE is_show=true AND is_delete=false AND id IN (%s)'% tag_ids_str
-            tag_db_results = self._get_sql_results(tag_sql)
-            tag_dict = {item[0]: item[1] for item in tag_db_results}
-
-        for item in db_results:
-            tag_id = item[0]
-            circle_id = item[1]
-            tag_title = tag_dict.get(tag_id)
-            tag_list = tag_mapping.setdefault(circle_id, [])
-
-            if not any([tag_id == it['id'] for it in tag_list]):
-                tag_title and tag_list.append(dict(id=tag_id, title=tag_title))
-
-        return tag_mapping
-
     def _get_up_mapping(self, ids, user_ids=None, up_type="circle"):
         assert up_type in ['circle', 'comment'], "点赞类型错误"
 
@@ -329,41 +391,131 @@ class CircleBBSService:
 
         return {(item[1], item[2]): item[0] for item in db_results}
 
+    def _get_circle_relations(self, circle_list):
+        """ 一条 SQL 批量获取一页发帖的 发帖用户、图片视频、标签、点赞、评论条数
+
+        :return: {circle_id: dict(user=, image_list=, tag_list=, is_up=, comment_cnt=)}
+        """
+        if not circle_list:
+            return {}
+
+        sql = """
+            SELECT
+                c.id,
+                CASE WHEN u.id IS NULL THEN NULL ELSE json_build_object(
+                    'id', u.id, 'fullname', u.fullname, 'avatar', u.avatar,
+                    'real_avatar', u.real_avatar, 'position_chz', u."positionCh"
+                ) END,
+                img.image_list,
+                tag.tag_list,
+                up."isUp",
+                cm.comment_cnt
+            FROM unnest(%s::int[], %s::int[]) AS c(id, user_id)
+            LEFT JOIN users_userinfo u ON u.id = c.user_id
+            LEFT JOIN LATERAL (
+                SELECT json_agg(json_build_object('id', i.id, 'url', i.url) ORDER BY i.id) AS image_list
+                FROM "starCircle_circleimage" i
+                WHERE i.circle_id = c.id AND i.url <> ''
+            ) img ON true
+            LEFT JOIN LATERAL (
+                -- 标签按关联记录的先后顺序, 同一标签只保留第一次出现(与拆分查询时的顺序一致)
+                SELECT json_agg(json_build_object('id', x.id, 'title', x.title) ORDER BY x.link_ctid) AS tag_list
+                FROM (
+                    SELECT DISTINCT ON (t.id) t.id, t.title, ct.ctid AS link_ctid
+                    FROM "starCircle_circle2tag" ct
+                    JOIN "starCircle_tag" t ON t.id = ct.tag_id
+                    WHERE ct.circle_id = c.id AND t.is_show=true AND t.is_delete=false AND t.title <> ''
+                    ORDER BY t.id, ct.ctid
+                ) x
+            ) tag ON true
+            LEFT JOIN LATERAL (
+                SELECT cu."isUp" FROM "starCircle_circleup" cu
+                WHERE cu.circle_id = c.id AND cu.user_id = c.user_id
+                ORDER BY cu.id DESC LIMIT 1
+            ) up ON true
+            LEFT JOIN LATERAL (
+                SELECT COUNT(1) AS comment_cnt FROM "starCircle_circlecomment" cc
+                WHERE cc.circle_id = c.id AND cc.is_delete=false
+            ) cm ON true
+        """
+        params = [[item['id'] for item in circle_list], [item['user_id'] for item in circle_list]]
+
+        def _json(value, default):
+            if value is None:
+                return default
+
+            return json.loads(value) if isinstance(value, str) else value
+
+        relations = {}
+        for circle_id, user, image_list, tag_list, is_up, comment_cnt in self._get_sql_results(sql, params=params):
+            relations[circle_id] = dict(
+                user=_json(user, {}), image_list=_json(image_list, []), tag_list=_json(tag_list, []),
+                is_up=bool(is_up), comment_cnt=comment_cnt or 0,
+            )
+
+        return relations
+
+    def _get_circle_list_cache_key(self):
+        """ 热点首页的缓存 key, 发帖/标签被修改后版本号递增, 旧缓存自然失效; 非首页返回 None """
+        query_params = self.get_query_params()
+        cursor = query_params.get('cursor')
+
+        if cursor or (cursor is None and query_params['page'] != 1):
+            return None
+
+        version = cache.get(self.CIRCLE_LIST_VERSION_KEY) or 0
+        digest = hashlib.md5(json.dumps(query_params, sort_keys=True, default=str).encode()).hexdigest()
+        return "%s%s_%s" % (self.CIRCLE_LIST_CACHE_PREFIX, version, digest)
+
+    @staticmethod
+    def _bump_cache_version(version_key):
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            cache.set(version_key, 1, None)
+
+    def _bump_circle_list_version(self):
+        self._bump_cache_version(self.CIRCLE_LIST_VERSION_KEY)
+
+    def bump_tag_list_version(self):
+        """ 标签增删改、发帖显示/隐藏后调用, 使标签列表缓存失效 """
+        self._bump_cache_version(self.TAG_LIST_VERSION_KEY)
+
     def get_circle_list(self):
-        circle_list, total_count = self._get_circle_data_from_db().values()
+        cache_ttl = getattr(settings, "CIRCLE_LIST_CACHE_TTL", 10)
+        cache_key = self._get_circle_list_cache_key() if cache_ttl else None
 
-        circle_ids = [item['id'] for item in circle_list]
-        circle_user_ids = [item['user_id'] for item in circle_list]
-        circle_up_dict = self._get_up_mapping(ids=circle_ids, up_type='circle')
+        if cache_key is not None:
+            circle_ret = cache.get(cache_key)
 
-        # 评论条数
-        comment_list = self._get_comment_data_from_db(circle_ids=circle_ids, count=True)['comment_list']
-        comment_dict = {item['circle_id']: item['cnt'] for item in comment_list}
+            if circle_ret is not None:
+                return circle_ret
 
-        user_mapping = self._get_user_mapping(user_ids=circle_user_ids)  # 发帖用户信息
-        image_mapping = self._get_image_mapping(circle_ids)  # 图片、视频链接
-        tag_mapping = self._get_tag_mapping(circle_ids)  # 发帖对应的标签
+        circle_data = self._get_circle_data_from_db()
+        circle_list, total_count = circle_data['circle_list'], circle_data['total_count']
+        relations = self._get_circle_relations(circle_list)
 
         for circle_item in circle_list:
             circle_id = circle_item['id']
-            user_id = circle_item['user_id']
-            is_up = circle_up_dict.get((circle_id, user_id), False)
+            relation = relations.get(circle_id) or dict(user={}, image_list=[], tag_list=[], is_up=False, comment_cnt=0)
 
             created_time = circle_item['created_time']
             circle_item['created_time'] = created_time and created_time.strftime("%Y-%m-%d %H:%M:%S") or ''
 
-            image_list = image_mapping.get(circle_id, [])
+            image_list = relation['image_list']
             post_type, screen_style = self._get_post_screen_type(image_list)
 
-            circle_item.update(
-                is_up=is_up, image_list=image_list,
-                post_type=post_type, screen_style=screen_style,
-                user=user_mapping.get(user_id, {}),
-                tag_list=tag_mapping.get(circle_id, []),
-                comment_cnt=comment_dict.get(circle_id, 0)
-            )
+            circle_item.update(relation, post_type=post_type, screen_style=screen_style)
+
+        circle_ret = dict(list=circle_list, total_count=total_count)
+
+        if 'next_cursor' in circle_data:
+            circle_ret['next_cursor'] = circle_data['next_cursor']
+
+        if cache_key is not None:
+            cache.set(cache_key, circle_ret, cache_ttl)
 
-        return dict(list=circle_list, total_count=total_count)
+        return circle_ret
 
     def get_comment_of_circle_list(self, is_circle=True, **kwargs):
         """ 发帖对应的评论 """
@@ -423,9 +575,9 @@ class CircleBBSService:
         if circle_text:
             sql = """
                 SELECT id FROM "starCircle_starcircle" 
-                WHERE is_delete=false AND content like '%%%s%%' 
-            """ % circle_text
-            circle_ids = [v[0] for v in self._get_sql_results(sql)]
+                WHERE is_delete=false AND content LIKE %s 
+            """
+            circle_ids = [v[0] for v in self._get_sql_results(sql, params=[self.like_pattern(circle_text)])]
 
         comment_data = self.get_comment_of_circle_list(
             is_circle=False, content=comment_text,
@@ -469,6 +621,7 @@ class CircleBBSService:
         params = (is_top and 'true' or 'false', str(circle_id))
         sql = 'UPDATE "starCircle_starcircle" SET is_tag_page_top=%s WHERE id=%s'
         self._execute_sql(sql % params)
+        self._bump_circle_list_version()
 
         return dict(msg="话题标签置顶完成", is_ok=True)
 
@@ -490,6 +643,8 @@ class CircleBBSService:
 
             self._execute_sql(sql % params)
 
+        self._bump_circle_list_version()
+        self.bump_tag_list_version()
         return dict(msg="C端隐藏/显示完成", is_ok=True)
 
     def add_admin_comment(self):
@@ -514,49 +669,22 @@ class CircleBBSService:
 
         circle_sql = 'UPDATE "starCircle_starcircle" SET "commentCount" = "commentCount" + 1 WHERE id=%s'
         self._execute_sql(circle_sql % (str(circle_id), ))
+        self._bump_circle_list_version()
 
         return dict(msg="管理端评论提交成功", is_ok=True)
 
-    def _get_ev_db_mobiles(self, where: str):
-        sql = 'SELECT b."phoneNumber" FROM event_tracking_uv a JOIN users_userinfo b ON a.user_id=b.id '
-        db_ret = self._get_sql_results(sql + where, fields=['mobile'])
-        logger.info('_get_ev_mobiles -> sq: %s', sql + where)
+    def _get_ev_daily_dict(self, start_date: datetime.date, end_date: datetime.date):
+        """ 埋点按天汇总(circle_event_tracking_daily, 由 rollup_event_tracking 任务增量汇总): {date: obj} """
+        queryset = EventTrackingDailyModel.objects.filter(day__gte=start_date, day__lte=end_date)
+        return {obj.day: obj for obj in queryset}
 
-        mobile_list = list({item['mobile'] for item in db_ret if item['mobile']})
-        return mobile_list
+    def _get_ev_mau_mobiles(self, start_date: datetime.date, end_date: datetime.date, is_hr_zhihu: bool = False):
+        queryset = EventTrackingDailyUserModel.objects.filter(day__gte=start_date, day__lte=end_date).exclude(mobile="")
 
-    def _get_ev_db_dau_list(self, where: str, multiple: int = 1):
-        dau_sql = """
-            SELECT 
-                EXTRACT(YEAR FROM tracking_time) AS yy,
-                EXTRACT(MONTH FROM tracking_time) AS mm,
-                EXTRACT(DAY FROM tracking_time) AS dd,
-                COUNT(DISTINCT user_id),
-                COUNT(*) * {multiple}
-            FROM event_tracking_uv 
-            {where} 
-            GROUP BY yy, mm, dd ORDER BY yy, mm, dd
-        """.format(where=where, multiple=multiple)
-        db_dau_ret = self._get_sql_results(dau_sql, fields=["yy", "mm", "dd", "dau_cnt", "pv"])
-        logger.info('_get_ev_db_dau_list -> dau_sql: %s', dau_sql)
+        if is_hr_zhihu:
+            queryset = queryset.filter(hr_pv_cnt__gt=0)
 
-        return db_dau_ret
-
-    def _get_ev_db_login_list(self, where: str):
-        login_sql = """
-            SELECT 
-                EXTRACT(YEAR FROM tracking_time) AS yy,
-                EXTRACT(MONTH FROM tracking_time) AS mm,
-                EXTRACT(DAY FROM tracking_time) AS dd,
-                COUNT(id)
-            FROM event_tracking_uv 
-            {where} AND tracking_type=1
-            GROUP BY yy, mm, dd ORDER BY yy, mm, dd
-        """.format(where=where)
-        db_login_ret = self._get_sql_results(login_sql, fields=["yy", "mm", "dd", "login_cnt"])
-        logger.info('_get_ev_db_login_list -> login_sql: %s', login_sql)
-
-        return db_login_ret
+        return list(queryset.values_list("mobile", flat=True).distinct())
 
     def _get_ev_db_bbs_list(self, start: str, end: str, visible_range: typing.Union[None, str] = None):
         bbs_sql = """
@@ -599,34 +727,29 @@ class CircleBBSService:
 
         return biz_mau_list
 
-    def _get_one_dict(self, items: typing.List[dict], current_date: datetime.date):
-        y, m, d = current_date.year, current_date. month, current_date.day
-        item_list = [item for item in items if int(item['yy'] == y) and int(item["mm"]) == m and int(item["dd"]) == d]
-
-        return item_list and item_list[0] or {}
+    def _get_date_dict(self, items: typing.List[dict]):
+        return {datetime.date(int(item['yy']), int(item['mm']), int(item['dd'])): item for item in items}
 
     def get_event_tracking_data(self, start_date: datetime.datetime, end_date: datetime.datetime):
         start = start_date.strftime("%Y-%m-%d") + " 00:00:00"
         end = end_date.strftime("%Y-%m-%d") + " 23:59:59"
-        where = " WHERE tracking_time >= '%s' AND tracking_time <= '%s'" % (start, end)
 
-        mobile_list = self._get_ev_db_mobiles(where=where)
-        db_dau_ret = self._get_ev_db_dau_list(where=where, multiple=9)
-        db_login_ret = self._get_ev_db_login_list(where=where)
-        db_bbs_list = self._get_ev_db_bbs_list(start, end, visible_range=None)
+        mobile_list = self._get_ev_mau_mobiles(start_date.date(), end_date.date())
+        daily_dict = self._get_ev_daily_dict(start_date.date(), end_date.date())
+        bbs_dict = self._get_date_dict(self._get_ev_db_bbs_list(start, end, visible_range=None))
         biz_mau_list = self._get_ev_db_biz_mau_list(mobiles=mobile_list)
 
         result = dict(mau_cnt=len(mobile_list), dau_list=[], biz_mau_list=biz_mau_list)
 
         while end_date >= start_date:
-            dau_dict = self._get_one_dict(db_dau_ret, end_date)
-            bbs_dict = self._get_one_dict(db_bbs_list, end_date)
-            login_dict = self._get_one_dict(db_login_ret, end_date)
+            current_date = end_date.date()
+            daily_obj = daily_dict.get(current_date)
+            bbs_item = bbs_dict.get(current_date, {})
 
             result["dau_list"].append(dict(
-                date=end_date.strftime("%Y-%m-%d"), pv=dau_dict.get("pv", 0),
-                dau_cnt=dau_dict.get("dau_cnt", 0), login_cnt=login_dict.get("login_cnt", 0),
-                post_cnt=bbs_dict.get("post_cnt", 0), star_cnt=bbs_dict.get("star_cnt", 0),
+                date=end_date.strftime("%Y-%m-%d"), pv=daily_obj.pv_cnt * 9 if daily_obj else 0,
+                dau_cnt=daily_obj.dau_cnt if daily_obj else 0, login_cnt=daily_obj.login_cnt if daily_obj else 0,
+                post_cnt=bbs_item.get("post_cnt", 0), star_cnt=bbs_item.get("star_cnt", 0),
             ))
 
             end_date = end_date + datetime.timedelta(days=-1)
@@ -636,23 +759,23 @@ class CircleBBSService:
     def get_hr_zhihu_event_tracking_data(self, start_date: datetime.datetime, end_date: datetime.datetime):
         start = start_date.strftime("%Y-%m-%d") + " 00:00:00"
         end = end_date.strftime("%Y-%m-%d") + " 23:59:59"
-        where = " WHERE tracking_time >= '%s' AND tracking_time <= '%s' AND tracking_type IN (6, 7)" % (start, end)
 
-        mobile_list = self._get_ev_db_mobiles(where=where)
-        db_dau_ret = self._get_ev_db_dau_list(where=where, multiple=1)
-        db_bbs_list = self._get_ev_db_bbs_list(start, end, visible_range='oversea')
+        mobile_list = self._get_ev_mau_mobiles(start_date.date(), end_date.date(), is_hr_zhihu=True)
+        daily_dict = self._get_ev_daily_dict(start_date.date(), end_date.date())
+        bbs_dict = self._get_date_dict(self._get_ev_db_bbs_list(start, end, visible_range='oversea'))
         biz_mau_list = self._get_ev_db_biz_mau_list(mobiles=mobile_list)
 
         result = dict(mau_cnt=len(mobile_list), dau_list=[], biz_mau_list=biz_mau_list)
 
         while end_date >= start_date:
-            dau_dict = self._get_one_dict(db_dau_ret, end_date)
-            bbs_dict = self._get_one_dict(db_bbs_list, end_date)
+            current_date = end_date.date()
+            daily_obj = daily_dict.get(current_date)
+            bbs_item = bbs_dict.get(current_date, {})
 
             result["dau_list"].append(dict(
                 date=end_date.strftime("%Y-%m-%d"),
-                dau_cnt=dau_dict.get("dau_cnt", 0), pv=dau_dict.get("pv", 0),
-                post_cnt=bbs_dict.get("post_cnt", 0), star_cnt=bbs_dict.get("star_cnt", 0),
+                dau_cnt=daily_obj.hr_dau_cnt if daily_obj else 0, pv=daily_obj.hr_pv_cnt if daily_obj else 0,
+                post_cnt=bbs_item.get("post_cnt", 0), star_cnt=bbs_item.get("star_cnt", 0),
             ))
 
             end_date = end_date + datetime.timedelta(days=-1)
@@ -745,43 +868,72 @@ class CircleBBSService:
         self._execute_sql(sql.format(**self._request.data))
 
     def get_tag_list(self):
+        """ 标签列表及各标签的有效发帖数
+
+        发帖数由一次分组聚合得到(只聚合当前页的标签); 结果按版本号缓存 CIRCLE_TAG_LIST_CACHE_TTL 秒,
+        标签或发帖状态在管理端被修改时版本号递增
+        """
         query_params = self.get_query_params()
         key = query_params.get('key')
         page_size = query_params['page_size']
         offset = (query_params['page'] - 1) * page_size
 
-        fields = ['id', 'created_time', 'is_show', 'title', 'tag_desc', 'is_top', 'circle_cnt']
-        sql = """
-            SELECT 
-                aa.id, aa.created_time, aa.is_show, aa.title, aa.tag_desc, aa.is_top, 
-                (
-                    SELECT COUNT(*) FROM "starCircle_circle2tag" 
-                    WHERE tag_id=aa.id AND circle_id IN 
-                        (
-                        SELECT id FROM "starCircle_starcircle" 
-                        WHERE is_delete=FALSE AND is_show=true
-                        )
-                )
-            FROM "starCircle_tag" aa
-        """
+        cache_ttl = getattr(settings, "CIRCLE_TAG_LIST_CACHE_TTL", 60)
+        cache_key = None
+
+        if cache_ttl:
+            version = cache.get(self.TAG_LIST_VERSION_KEY) or 0
+            digest = hashlib.md5(json.dumps([key, page_size, offset]).encode()).hexdigest()
+            cache_key = "%s%s_%s" % (self.TAG_LIST_CACHE_PREFIX, version, digest)
+            tag_ret = cache.get(cache_key)
+
+            if tag_ret is not None:
+                return tag_ret
+
         where = " WHERE aa.is_delete=false "
+        params = []
 
         if key:
-            query = ["aa.title like '%%%s%%'", "aa.tag_desc like '%%%s%%'"]
-            where += " AND " + " (%s) " % ' OR '.join([q % key for q in query])
+            where += " AND (aa.title LIKE %s OR aa.tag_desc LIKE %s) "
+            params.extend([self.like_pattern(key)] * 2)
 
-        db_share_ret = self._get_sql_results('SELECT COUNT(*) FROM "starCircle_tag" aa ' + where)
+        db_share_ret = self._get_sql_results('SELECT COUNT(*) FROM "starCircle_tag" aa ' + where, params=params)
         total_count = db_share_ret[0][0]
 
-        sql += where + " ORDER BY aa.created_time DESC, aa.is_show DESC OFFSET %s LIMIT %s" % (offset, page_size)
+        fields = ['id', 'created_time', 'is_show', 'title', 'tag_desc', 'is_top', 'circle_cnt']
+        sql = """
+            WITH page_tag AS (
+                SELECT aa.id, aa.created_time, aa.is_show, aa.title, aa.tag_desc, aa.is_top
+                FROM "starCircle_tag" aa
+                {where}
+                ORDER BY aa.created_time DESC, aa.is_show DESC
+                OFFSET %s LIMIT %s
+            ), tag_cnt AS (
+                SELECT ct.tag_id, COUNT(*) AS circle_cnt
+                FROM "starCircle_circle2tag" ct
+                JOIN "starCircle_starcircle" sc ON sc.id=ct.circle_id AND sc.is_delete=false AND sc.is_show=true
+                WHERE ct.tag_id IN (SELECT id FROM page_tag)
+                GROUP BY ct.tag_id
+            )
+            SELECT 
+                pt.id, pt.created_time, pt.is_show, pt.title, pt.tag_desc, pt.is_top, COALESCE(tc.circle_cnt, 0)
+            FROM page_tag pt
+            LEFT JOIN tag_cnt tc ON tc.tag_id=pt.id
+            ORDER BY pt.created_time DESC, pt.is_show DESC
+        """.format(where=where)
 
         tag_list = []
-        for item in self._get_sql_results(sql, fields=fields):
+        for item in self._get_sql_results(sql, fields=fields, params=params + [offset, page_size]):
             created_time = item.pop('created_time')
             item['created_time'] = created_time and created_time.strftime("%Y-%m-%d %H:%M:%S") or ''
             tag_list.append(item)
 
-        return dict(list=tag_list, total_count=total_count)
+        tag_ret = dict(list=tag_list, total_count=total_count)
+
+        if cache_key is not None:
+            cache.set(cache_key, tag_ret, cache_ttl)
+
+        return tag_ret
 
     def operate_tag(self):
         data = self._request.data
@@ -804,3 +956,5 @@ class CircleBBSService:
             raise ValueError(f'action: {action}操作不允许')
 
         self._execute_sql(sql % params)
+        self._bump_circle_list_version()
+        self.bump_tag_list_version()
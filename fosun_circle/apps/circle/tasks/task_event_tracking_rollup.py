@@ -0,0 +1,112 @@
+from django.db import connections, transaction, router
+
+from config.celery import celery_app
+from circle.models import RollupWatermarkModel
+from fosun_circle.libs.log import task_logger as logger
+
+WATERMARK_NAME = "event_tracking_uv"
+
+# 埋点写入事务可能晚于更大 id 的行提交, 只汇总 SAFE_LAG 之前的数据, 避免水位线越过尚未提交的行
+SAFE_LAG = "5 minutes"
+
+# 未登录(user_id 为 NULL)的埋点汇总到 user_id=-1, 与 user_id=0 区分:
+# 原统计的 COUNT(DISTINCT user_id) 不计 NULL, 但 0 计为一人
+ANONYMOUS_USER_ID = -1
+
+# event_tracking_uv(bbs 库) 的增量: 按天按人汇总
+SOURCE_SQL = """
+    SELECT
+        a.tracking_time::date AS day,
+        COALESCE(a.user_id, %s) AS user_id,
+        COALESCE(MAX(b."phoneNumber"), '') AS mobile,
+        COUNT(*) AS pv_cnt,
+        COUNT(*) FILTER (WHERE a.tracking_type=1) AS login_cnt,
+        COUNT(*) FILTER (WHERE a.tracking_type IN (6, 7)) AS hr_pv_cnt
+    FROM event_tracking_uv a
+    LEFT JOIN users_userinfo b ON a.user_id=b.id
+    WHERE a.id > %s AND a.id <= %s
+    GROUP BY 1, 2
+"""
+
+DAILY_USER_UPSERT_SQL = """
+    INSERT INTO circle_event_tracking_daily_user AS t
+        (day, user_id, mobile, pv_cnt, login_cnt, hr_pv_cnt, creator, modifier, create_time, update_time, is_del)
+    SELECT day, user_id, mobile, pv_cnt, login_cnt, hr_pv_cnt, 'sys', 'sys', NOW(), NOW(), false
+    FROM unnest(%s::date[], %s::int[], %s::varchar[], %s::int[], %s::int[], %s::int[])
+        AS s(day, user_id, mobile, pv_cnt, login_cnt, hr_pv_cnt)
+    ON CONFLICT (day, user_id) DO UPDATE SET
+        mobile = CASE WHEN EXCLUDED.mobile <> '' THEN EXCLUDED.mobile ELSE t.mobile END,
+        pv_cnt = t.pv_cnt + EXCLUDED.pv_cnt,
+        login_cnt = t.login_cnt + EXCLUDED.login_cnt,
+        hr_pv_cnt = t.hr_pv_cnt + EXCLUDED.hr_pv_cnt,
+        update_time = NOW()
+"""
+
+# 只重算本批次涉及的日期
+DAILY_UPSERT_SQL = """
+    INSERT INTO circle_event_tracking_daily AS t
+        (day, dau_cnt, pv_cnt, login_cnt, hr_dau_cnt, hr_pv_cnt, creator, modifier, create_time, update_time, is_del)
+    SELECT
+        day,
+        COUNT(*) FILTER (WHERE user_id <> %s),
+        SUM(pv_cnt),
+        SUM(login_cnt),
+        COUNT(*) FILTER (WHERE user_id <> %s AND hr_pv_cnt > 0),
+        SUM(hr_pv_cnt),
+        'sys', 'sys', NOW(), NOW(), false
+    FROM circle_event_tracking_daily_user
+    WHERE day = ANY(%s::date[])
+    GROUP BY day
+    ON CONFLICT (day) DO UPDATE SET
+        dau_cnt = EXCLUDED.dau_cnt,
+        pv_cnt = EXCLUDED.pv_cnt,
+        login_cnt = EXCLUDED.login_cnt,
+        hr_dau_cnt = EXCLUDED.hr_dau_cnt,
+        hr_pv_cnt = EXCLUDED.hr_pv_cnt,
+        update_time = NOW()
+"""
+
+
+def _get_source_max_id(bbs_cursor):
+    bbs_cursor.execute(
+        "SELECT MAX(id) FROM event_tracking_uv WHERE tracking_time <= NOW() - INTERVAL '%s'" % SAFE_LAG
+    )
+    return bbs_cursor.fetchone()[0] or 0
+
+
+def _rollup_batch(bbs_cursor, rollup_cursor, start_id, end_id):
+    bbs_cursor.execute(SOURCE_SQL, (ANONYMOUS_USER_ID, start_id, end_id))
+    rows = bbs_cursor.fetchall()
+
+    if not rows:
+        return 0
+
+    rollup_cursor.execute(DAILY_USER_UPSERT_SQL, [list(column) for column in zip(*rows)])
+    rollup_cursor.execute(DAILY_UPSERT_SQL, [ANONYMOUS_USER_ID, ANONYMOUS_USER_ID, list({row[0] for row in rows})])
+    return len(rows)
+
+
+@celery_app.task(ignore_result=True)
+def rollup_event_tracking(batch_size=50000):
+    """ 增量汇总埋点数据: 只处理水位线之后的新数据, 每批与水位线在同一事务中提交 """
+    using = router.db_for_write(RollupWatermarkModel)
+    bbs_cursor = connections["bbs_user"].cursor()
+    max_id = _get_source_max_id(bbs_cursor)
+
+    while True:
+        with transaction.atomic(using=using):
+            # 行锁: 同一时刻只有一个任务推进水位线
+            watermark, _ = RollupWatermarkModel.objects.using(using).get_or_create(name=WATERMARK_NAME)
+            watermark = RollupWatermarkModel.objects.using(using).select_for_update().get(pk=watermark.pk)
+
+            start_id = watermark.last_id
+            if start_id >= max_id:
+                break
+
+            end_id = min(start_id + batch_size, max_id)
+            row_cnt = _rollup_batch(bbs_cursor, connections[using].cursor(), start_id, end_id)
+
+            watermark.last_id = end_id
+            watermark.save(update_fields=["last_id", "update_time"])
+
+        logger.info("rollup_event_tracking ==>> id: (%s, %s], daily users: %s", start_id, end_id, row_cnt)
@@ -100,33 +100,30 @@ class BbsFuzzySearchUserApi(APIView):
 
         cursor.execute('SELECT "parentComment_id" FROM "starCircle_circlecomment" '
                        'WHERE user_id=%s AND is_show=true', (user_id,))
-        parent_comment_ids = [str(item[0]) for item in cursor.fetchall() if item[0]]
+        parent_comment_ids = [item[0] for item in cursor.fetchall() if item[0]]
 
         if parent_comment_ids:
             cursor.execute('SELECT user_id FROM "starCircle_circlecomment" '
-                           'WHERE nid in (%s) AND is_show=true' % ','.join(parent_comment_ids))
-            related_user_ids = [str(item[0]) for item in cursor.fetchall() if item[0]]
+                           'WHERE nid = ANY(%s) AND is_show=true', (parent_comment_ids, ))
+            related_user_ids = list({item[0] for item in cursor.fetchall() if item[0]})
         else:
             related_user_ids = []
 
+        # fullname 模糊搜索走 pg_trgm GIN 索引(circle/migrations/0015), 少于 3 个字符时仍是全表扫描
         user_sql = '''
             SELECT id, real_avatar, fullname, "phoneNumber", "jobCode" FROM users_userinfo 
-            WHERE fullname like '%%%s%%' AND "isJob"=true AND "jobCode"<>'' AND "jobCode" IS NOT NULL 
-        ''' % key
+            WHERE fullname LIKE %s AND "isJob"=true AND "jobCode"<>'' AND "jobCode" IS NOT NULL 
+        '''
+        name_pattern = service.CircleBBSService.like_pattern(key)
 
         if related_user_ids:
-            _sql = user_sql + " AND id IN (%s) " % ','.join(related_user_ids)
-            cursor.execute(_sql)
+            cursor.execute(user_sql + " AND id = ANY(%s) ", (name_pattern, related_user_ids))
             db_user_results.extend(cursor.fetchall())
 
         # 其余全表查询
-        limit = 10 - len(db_user_results)
-        _sql = user_sql
-        if related_user_ids:
-            _sql += ' AND id NOT IN (%s) ' % ','.join(related_user_ids)
-
-        _sql += " ORDER BY id ASC LIMIT %s" % limit
-        cursor.execute(_sql)
+        limit = max(10 - len(db_user_results), 0)
+        _sql = user_sql + ' AND NOT (id = ANY(%s)) ORDER BY id ASC LIMIT %s'
+        cursor.execute(_sql, (name_pattern, related_user_ids, limit))
         user_list = [
             dict(user_id=it[0], avatar=it[1], fullname=it[2], mobile=it[3], job_code=it[4])
             for it in chain(db_user_results, cursor.fetchall())
@@ -193,6 +190,7 @@ class CircleTagApi(APIView):
         """
         cursor.execute(sql, (title, tag_desc))
         conn.commit()
+        service.CircleBBSService(request).bump_tag_list_version()
 
         return Response()
 
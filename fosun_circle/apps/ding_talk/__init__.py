@@ -0,0 +1 @@
+default_app_config = 'ding_talk.apps.DingTalkConfig'
@@ -1,5 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class DingTalkConfig(AppConfig):
     name = 'ding_talk'
+
+    def ready(self):
+        lease_ttl = getattr(settings, "SNOWFLAKE_WORKER_LEASE_TTL", 30)
+
+        # 消息 msg_uid 等由 Snowflake 生成: 各 gunicorn/celery 进程从 Redis 租用互不相同的 worker id
+        if lease_ttl:
+            from django_redis import get_redis_connection
+            from fosun_circle.libs.utils.snow_flake import Snowflake, RedisWorkerIdCoordinator
+
+            Snowflake.set_coordinator(RedisWorkerIdCoordinator(get_redis_connection), ttl=lease_ttl)
@@ -18,6 +18,7 @@ from .models import DingAppTokenModel, DingMsgPushLogModel, DingMessageModel
 from .models import DingAppMediaModel, DingMsgRecallLogModel, DingPeriodicTaskModel
 from users.models import CircleUsersModel
 from fosun_circle.core.globals import local_user
+from fosun_circle.core.db.bulk import bulk_insert
 from fosun_circle.libs.exception import PhoneValidateError
 from fosun_circle.libs.log import dj_logger as logger
 from fosun_circle.libs.utils.snow_flake import Snowflake
@@ -141,12 +142,13 @@ class ListPushDingMsgLogSerializer(serializers.ListSerializer):
         user_queryset = CircleUsersModel.objects.filter(**user_query_kwargs).values("phone_number", "ding_job_code")
         mobile_jobCode_dict = {user_item["phone_number"]: user_item["ding_job_code"] for user_item in user_queryset}
 
-        # 微应用信息
-        app_token_list = [item["app_token"] for item in self.initial_data]
-        plain_token_list = [DingAppTokenModel.decipher_text(_app_token) for _app_token in app_token_list]
-        agent_id_list = [int(_plain_token.split(":", 1)[0]) for _plain_token in plain_token_list]
+        # 微应用信息: 每个不同的 app_token 只解密一次
+        token_agent_dict = {
+            app_token: int(DingAppTokenModel.decipher_text(app_token).split(":", 1)[0])
+            for app_token in {item["app_token"] for item in self.initial_data}
+        }
 
-        app_query_kwargs = dict(agent_id__in=agent_id_list, is_del=False)
+        app_query_kwargs = dict(agent_id__in=list(token_agent_dict.values()), is_del=False)
         app_queryset = DingAppTokenModel.objects.filter(**app_query_kwargs).values("id", "agent_id")
         app_agent_dict = {app_item["agent_id"]: app_item["id"] for app_item in app_queryset}
 
@@ -158,30 +160,38 @@ class ListPushDingMsgLogSerializer(serializers.ListSerializer):
         ding_message_log_mapping = {}
         start_parse_time = time.time()
 
+        new_validated_data_list = []
+        msg_uid_list = Snowflake().next_ids(len(self.initial_data))
+
         for index, data in enumerate(self.initial_data):
             message_data = dict(data, **validated_data[index])
-            new_validated_data = self.child.derive_value(message_data)
-
-            plain_token = DingAppTokenModel.decipher_text(new_validated_data["app_token"])
-            agent_id = int(plain_token.split(":", 1)[0])
+            new_validated_data = self.child.derive_value(message_data, msg_uid=msg_uid_list[index])
 
-            # 消息主体指纹
-            app_id = app_agent_dict.get(agent_id)
-            new_validated_data["app_id"] = app_id
+            agent_id = token_agent_dict[new_validated_data["app_token"]]
+            new_validated_data["app_id"] = app_agent_dict.get(agent_id)
+            new_validated_data_list.append(new_validated_data)
 
-            # 消息主体指纹获取消息id
-            ding_msg_id = self.child.get_or_create_message_id(new_validated_data, ding_message_body_mapping)
-            is_cached = new_validated_data.pop("is_cached", True)  # 消息是否需要缓存，默认缓存
+        # 消息主体指纹获取消息id(整批一次查询/一次 MGET)
+        ding_msg_ids = self.child.get_or_create_message_ids(new_validated_data_list, ding_message_body_mapping)
 
-            # 补充消息记录信息并过滤消息记录指纹
+        # 补充消息记录信息并计算消息记录指纹
+        log_fingerprint_items = []
+        for new_validated_data, ding_msg_id in zip(new_validated_data_list, ding_msg_ids):
             mobile = new_validated_data["receiver_mobile"]
             new_validated_data.update(ding_msg_id=ding_msg_id, receiver_job_code=mobile_jobCode_dict.get(mobile, ""))
 
             log_fingerprint = self.child.get_log_fingerprint(validated_data=new_validated_data)
-            has_fingerprint = self.child.has_log_fingerprint(app_id, ding_msg_id, mobile, log_fingerprint)
+            log_fingerprint_items.append((new_validated_data["app_id"], ding_msg_id, mobile, log_fingerprint))
+
+        # 过滤消息记录指纹(整批一次 MGET)
+        has_fingerprints = self.child.has_log_fingerprints(log_fingerprint_items)
+
+        for index, new_validated_data in enumerate(new_validated_data_list):
+            is_cached = new_validated_data.pop("is_cached", True)  # 消息是否需要缓存，默认缓存
 
             if is_cached:
-                if not has_fingerprint:
+                if not has_fingerprints[index]:
+                    app_id, ding_msg_id, mobile, log_fingerprint = log_fingerprint_items[index]
                     ding_message_log_mapping[(app_id, ding_msg_id, mobile)] = log_fingerprint
                     bulk_obj_list.append(model_cls.create_object(force_insert=False, **new_validated_data))
             else:
@@ -189,7 +199,8 @@ class ListPushDingMsgLogSerializer(serializers.ListSerializer):
 
         end_parse_time = time.time()
         logger.info("ListPushDingMsgLogSerializer ===>>> Parse Cost:%s", end_parse_time - start_parse_time)
-        instance_list = model_cls.objects.bulk_create(bulk_obj_list)  # bulk_obj_list 太大可能引起批量插入的性能下降
+        # 分块插入(PostgreSQL 走 COPY), msg_uid 冲突的记录跳过, 只返回实际插入的记录
+        instance_list = bulk_insert(model_cls, bulk_obj_list, conflict_field="msg_uid")
 
         end_bulk_time = time.time()
         log_args = (end_bulk_time - start_bulk_time, end_bulk_time - end_parse_time)
@@ -301,10 +312,80 @@ class PushDingMsgLogSerializer(serializers.ModelSerializer):
         cached_message_body_mapping[message_body_fingerprint] = ding_msg_id  # 暂存
         return ding_msg_id
 
+    def get_or_create_message_ids(self, data_list, cached_message_body_mapping=None):
+        """ 批量获取或创建 DingMessageModel 对象, 结果与逐条调用 get_or_create_message_id 一致
+
+        message_id 整批一次查询; 消息主体指纹整批一次 MGET, 未命中的按指纹去重后创建, 新指纹一次 pipeline 写回 Redis
+        :return: list, 与 data_list 一一对应的 ding_msg_id
+        """
+        assert isinstance(cached_message_body_mapping, dict), "缓存参数必须传 dict 类型"
+
+        row_message_ids = [int(data.pop("message_id", 0)) for data in data_list]
+        message_ids = {message_id for message_id in row_message_ids if message_id}
+        message_dict = {}
+
+        if message_ids:
+            message_queryset = DingMessageModel.objects.filter(id__in=message_ids, is_del=False)
+            message_dict = {message_obj.id: message_obj.to_dict(exclude=["id"]) for message_obj in message_queryset}
+
+            missing_ids = message_ids - set(message_dict)
+            if missing_ids:
+                raise ObjectDoesNotExist("DingMessageModel<id: %s>不存在" % ",".join(map(str, missing_ids)))
+
+            for message_id, ding_msg_dict in message_dict.items():
+                fingerprint_data = {k: ding_msg_dict.get(k, '') for k in self.fingerprint_fields}
+                cached_message_body_mapping[self.get_message_body_fingerprint(fingerprint_data)] = message_id
+
+        row_fingerprints = []
+        fingerprint_data_dict = {}  # 每个指纹对应的第一条消息, 用于创建消息主体
+
+        for data, message_id in zip(data_list, row_message_ids):
+            if message_id:
+                data.update(message_dict[message_id])  # 可能没有消息主体消息，更新
+                row_fingerprints.append(None)
+            else:
+                message_body_fingerprint = self.get_message_body_fingerprint(data)
+                fingerprint_data_dict.setdefault(message_body_fingerprint, data)
+                row_fingerprints.append(message_body_fingerprint)
+
+        if fingerprint_data_dict:
+            redis_conn = get_redis_connection()
+            fingerprints = list(fingerprint_data_dict)
+            cached_ids = redis_conn.mget([self.DING_MSG_BODY_KEY % fingerprint for fingerprint in fingerprints])
+            new_body_mapping = {}
+
+            for message_body_fingerprint, msg_id_from_redis in zip(fingerprints, cached_ids):
+                if msg_id_from_redis:
+                    cached_message_body_mapping[message_body_fingerprint] = int(msg_id_from_redis)
+                    continue
+
+                ding_msg_id = cached_message_body_mapping.get(message_body_fingerprint)
+                if not ding_msg_id:
+                    ding_msg_obj = DingMessageModel.create_object(**fingerprint_data_dict[message_body_fingerprint])
+                    ding_msg_id = ding_msg_obj.id
+
+                cached_message_body_mapping[message_body_fingerprint] = ding_msg_id
+                new_body_mapping[self.DING_MSG_BODY_KEY % message_body_fingerprint] = ding_msg_id
+
+            # 存入 Redis 中
+            if new_body_mapping:
+                with redis_conn.pipeline(transaction=False) as pipe:
+                    for body_key, ding_msg_id in new_body_mapping.items():
+                        pipe.set(body_key, ding_msg_id, ex=7 * 24 * 60 * 60)
+
+                    pipe.execute()
+
+        return [
+            message_id or cached_message_body_mapping[message_body_fingerprint]
+            for message_id, message_body_fingerprint in zip(row_message_ids, row_fingerprints)
+        ]
+
     @classmethod
-    def derive_value(cls, validated_data):
-        """ 自定义类方法 """
-        snow_alg = Snowflake(1, 1)
+    def derive_value(cls, validated_data, msg_uid=None):
+        """ 自定义类方法
+
+        :param msg_uid: 预先分配的消息唯一id(批量时由 Snowflake.next_ids 一次分配), 为空时单独生成
+        """
         source_mapper = dict(DingMessageModel.SOURCE_CHOICES)
         msg_type_mapper = dict(DingMessageModel.MSG_TYPE_CHOICES)
 
@@ -317,7 +398,7 @@ class PushDingMsgLogSerializer(serializers.ModelSerializer):
 
         validated_data.update(
             is_read=False, is_success=False,
-            send_time=datetime.now(), msg_uid=snow_alg.get_id(),
+            send_time=datetime.now(), msg_uid=msg_uid or Snowflake().get_id(),
             sender=local_user.mobile if local_user else "sys",
             source_cn=source_mapper.get(validated_data.get("source"), ""),
             msg_type_cn=msg_type_mapper.get(validated_data.get("msg_type"), 0)
@@ -406,7 +487,26 @@ class PushDingMsgLogSerializer(serializers.ModelSerializer):
         key = self.DING_MSG_LOG_KEY % (app_id, ding_msg_id, mobile)
         old_fingerprint = redis_conn.get(key)
 
-        return old_fingerprint == check_fingerprint
+        # decode_responses=False, Redis 返回 bytes
+        return old_fingerprint is not None and old_fingerprint.decode() == check_fingerprint
+
+    def has_log_fingerprints(self, fingerprint_items):
+        """ 批量校验消息记录指纹, 整批一次 MGET
+
+        :param fingerprint_items: list, eg: [(app_id, ding_msg_id, mobile, fingerprint), ...]
+        :return: list, 与 fingerprint_items 一一对应的 bool
+        """
+        if not fingerprint_items:
+            return []
+
+        redis_conn = get_redis_connection()
+        keys = [self.DING_MSG_LOG_KEY % (app_id, ding_msg_id, mobile) for app_id, ding_msg_id, mobile, _ in fingerprint_items]
+        old_fingerprints = redis_conn.mget(keys)
+
+        return [
+            old_fingerprint is not None and old_fingerprint.decode() == item[3]
+            for item, old_fingerprint in zip(fingerprint_items, old_fingerprints)
+        ]
 
     def bulk_insert_fingerprint_to_redis(self, bulk_body_mappings=None, bulk_log_mappings=None, timeout=None):
         """ 批量插入Redis,使用 Lua 可极大提升性能
@@ -6,6 +6,7 @@ from datetime import datetime, timedelta
 from operator import itemgetter
 from itertools import groupby
 
+from django.db.models import Q, F, Case, When, Value
 from django.contrib.auth import get_user_model
 
 from config.celery import celery_app
@@ -13,7 +14,7 @@ from .message_converter import MessageConverter
 from fosun_circle.libs.log import task_logger as logger
 from ding_talk.models import DingMsgPushLogModel, DingMessageModel
 from fosun_circle.constants.enums.ding_msg_type import DingMsgTypeEnum
-from fosun_circle.core.ding_talk.open_api import DingTalkMessageOpenApi
+from fosun_circle.core.ding_talk.sender import DingMessageSender
 
 
 @celery_app.task(ignore_result=True)
@@ -32,13 +33,14 @@ def send_ding_message(msg_uid_list=None, alert=False, **kwargs):
     msg_queryset = DingMessageModel.objects.filter(id__in=ding_msg_ids, is_del=False).select_related("app")
     msg_mapping_dict = {msg_obj.id: msg_obj for msg_obj in msg_queryset}
 
+    push_jobs, push_msg_uid_groups = [], []
+
     # 同应用消息分组
     for ding_msg_id, iterator in groupby(log_msg_queryset, key=itemgetter("ding_msg_id")):
         log_msg_list = list(iterator)
         push_count = len(log_msg_list)
         ding_msg = msg_mapping_dict.get(ding_msg_id)
 
-        start_time2 = time.time()
         _log_args = (ding_msg_id, ding_msg, push_count)
         logger.info("send_ding_message => ding_msg_id: %s, ding_msg: %s, push_count: %s", *_log_args)
 
@@ -48,7 +50,6 @@ def send_ding_message(msg_uid_list=None, alert=False, **kwargs):
         app_obj = ding_msg.app
         msg_type_int = ding_msg.msg_type
         msg_type_mapper = dict(DingMessageModel.MSG_TYPE_CHOICES)
-        ret = dict(errcode=500, errmsg="failed", task_id="", request_id="")
 
         ding_body_kwargs = {}
         msg_type = msg_type_mapper.get(msg_type_int)
@@ -82,44 +83,55 @@ def send_ding_message(msg_uid_list=None, alert=False, **kwargs):
             push_job_code_list = User.get_job_code_list(mobile_list=mobile_list)
             logger.info("send_ding_message => User: %s, push_job_code_list:%s", User, push_job_code_list)
 
-        try:
-            userid_list = push_job_code_list
-            body_kwargs = dict(ding_body_kwargs, author=app_obj.app_name)
+        body_kwargs = dict(ding_body_kwargs, author=app_obj.app_name)
+        push_jobs.append(dict(
+            msg_type=msg_type, userid_list=push_job_code_list,
+            body_kwargs=body_kwargs, api_init_kwargs=api_init_kwargs,
+        ))
+        push_msg_uid_groups.append(push_msg_uid_list)
+
+    # 各分组并发推送(按微应用限流), 推送结果与 push_jobs 一一对应
+    results = DingMessageSender().send(push_jobs)
+
+    try:
+        _update_push_logs(push_msg_uid_groups, results)
+    except Exception as e:
+        logger.error("Celery Task[send_ding_message] update log err: %s", e)
+        logger.error(traceback.format_exc())
 
-            ding_service = DingTalkMessageOpenApi(msg_type=msg_type, **api_init_kwargs)
-            task_id = ding_service.async_send(body_kwargs=body_kwargs, userid_list=userid_list)
-            ret.update(errcode=0, errmsg="ok", task_id=str(task_id))
-        except Exception as e:
-            logger.error("Celery Task[send_ding_message] send err: %s", e)
-            exc_msg = traceback.format_exc()
-            logger.error(exc_msg)
-            ret.update(errmsg=exc_msg[-1000:])
-        finally:
-            push_count = len(push_msg_uid_list)
-            logger.info("send_ding_message => push_msg_uid_list: %s, Count: %s", push_msg_uid_list, push_count)
-            logger.info("send_ding_message => DingTalk Api Cost time: %s", time.time() - start_time2)
+    for job, push_msg_uid_list, ret in zip(push_jobs, push_msg_uid_groups, results):
+        log_args = (push_msg_uid_list, job["userid_list"], job["body_kwargs"], ret)
+        logger.info("send_ding_message => push_msg_uid_list: %s, Push DingTalk UserIds: %s, \n"
+                    "body_kwargs:%s, \nresult: %s", *log_args)
 
-            try:
-                update_kwargs = dict(
-                    is_success=int(ret["errcode"]) == 0, task_id=ret["task_id"],
-                    traceback=ret["errmsg"], request_id=ret["request_id"]
-                )
+    logger.info("send_ding_message => Push groups: %s, Task All CostTime: %s", len(push_jobs), time.time() - start_time)
 
-                now = datetime.now()  # datetime
-                if os.environ.get("DEPLOY") == 'DOCKER':
-                    now = now + timedelta(hours=8)
 
-                update_kwargs["is_success"] and update_kwargs.update(receive_time=now)
-                DingMsgPushLogModel.objects.filter(msg_uid__in=push_msg_uid_list).update(**update_kwargs)
-            except Exception as e:
-                logger.error("Celery Task[send_ding_message] update log err: %s", e)
-                logger.error(traceback.format_exc())
+def _update_push_logs(push_msg_uid_groups, results):
+    """ 一条 UPDATE 回写所有分组的推送结果 """
+    all_msg_uid_list = [msg_uid for msg_uid_list in push_msg_uid_groups for msg_uid in msg_uid_list]
 
-            log_args = (push_job_code_list, ding_body_kwargs, ret, time.time() - start_time)
-            logger.info("send_ding_message => Push DingTalk UserIds: %s, \n"
-                        "body_kwargs:%s, \nresult: %s, Task All CostTime: %s", *log_args)
+    if not all_msg_uid_list:
+        return
 
+    now = datetime.now()  # datetime
+    if os.environ.get("DEPLOY") == 'DOCKER':
+        now = now + timedelta(hours=8)
 
+    field_whens = dict(is_success=[], task_id=[], traceback=[], request_id=[], receive_time=[])
 
+    for msg_uid_list, ret in zip(push_msg_uid_groups, results):
+        condition = Q(msg_uid__in=msg_uid_list)
+        is_success = int(ret["errcode"]) == 0
+        values = dict(is_success=is_success, task_id=ret["task_id"], traceback=ret["errmsg"], request_id=ret["request_id"])
+        is_success and values.update(receive_time=now)
 
+        for field_name, value in values.items():
+            field_whens[field_name].append(When(condition, then=Value(value)))
 
+    opts = DingMsgPushLogModel._meta
+    update_kwargs = {
+        field_name: Case(*whens, default=F(field_name), output_field=opts.get_field(field_name))
+        for field_name, whens in field_whens.items() if whens
+    }
+    DingMsgPushLogModel.objects.filter(msg_uid__in=all_msg_uid_list).update(**update_kwargs)
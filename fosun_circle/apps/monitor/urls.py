@@ -9,6 +9,12 @@ api_urlpatterns = [
     re_path(r"robot/send$", view=views.DDCustomRobotWebhookApi.as_view(), name="dd_custom_robot_send_api"),
 ]
 
+# 连接池统计(可选): 排查连接池耗尽等问题
+if getattr(settings, 'DB_POOL_STATS_API', False):
+    api_urlpatterns.append(
+        re_path(r"db/pool/stats$", view=views.DbPoolStatsApi.as_view(), name="db_pool_stats_api")
+    )
+
 view_urlpatterns = [
     re_path(r"celery/flower$", view=views.FlowerView.as_view(), name="monitor_flower"),
     re_path(r"inner/404$", view=views.Inner404View.as_view(), name="monitor_inner_404"),
@@ -11,6 +11,7 @@ from django_redis import get_redis_connection
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.exceptions import Throttled
+from rest_framework import permissions
 
 from fosun_circle.libs import redis_helpers
 from fosun_circle.core.views import SingleVueView
@@ -163,3 +164,16 @@ class DDCustomRobotWebhookApi(APIView):
 
         return Response(data=None)
 
+
+class DbPoolStatsApi(APIView):
+    """ 当前 worker 进程内各数据库连接池的统计 (settings.DB_POOL_STATS_API 开启, 仅管理员)
+
+    连接池以 `database#digest` 区分, 不返回用户名、主机等连接参数
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        from fosun_circle.contrib.db_pool.core.stats import get_pool_stats
+
+        alias = request.query_params.get('alias')
+        return Response(data=dict(pid=os.getpid(), pools=get_pool_stats(alias)))
@@ -3,14 +3,16 @@ import random
 import string
 import base64
 import logging
+import threading
 import traceback
-from collections import deque
+from collections import deque, namedtuple
 from typing import List, Union, Dict
 
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth import get_user_model
+from django_redis import get_redis_connection
 
 from fosun_circle.libs import exception
 from fosun_circle.libs.utils.crypto import AESHelper
@@ -85,7 +87,7 @@ class ApiInvokerClientModel(BaseAbstractModel):
             self.access_token = access_token
 
         self.expire_at = expire_at
-        self.save()
+        self.save(update_fields=list(ApiInvokerSnapshot.TOKEN_FIELDS))
 
     def is_expired(self):
         expire_at = self.expire_at
@@ -143,6 +145,178 @@ class ApiInvokerUriModel(BaseAbstractModel):
         return cls.objects.filter(url=api_path, is_del=False).exists()
 
 
+ApiInvokerEntry = namedtuple(
+    'ApiInvokerEntry',
+    ['id', 'name', 'client_id', 'app_key', 'app_secret', 'expire_ts', 'allowed_paths', 'error']
+)
+
+
+class ApiInvokerSnapshot:
+    """ API三方调用授权快照(进程内)
+
+    token -> 已解密校验的调用方及其可调用的 api path 集合, 热路径不查库。
+    ApiInvokerClientModel/ApiInvokerUriModel 保存或删除时(permissions.signals)递增版本号,
+    本进程立即重建, 其他进程最多 CHECK_INTERVAL 秒后通过 Redis 中的版本号感知并重建。
+
+    gettoken(set_token) 只更新 TOKEN_FIELDS, 不递增版本号: 新签发或续期的 token 可能落在其他进程,
+    快照中不存在或已过期的 token 在拒绝前从库中重读, 只更新该调用方的条目。
+    """
+    VERSION_KEY = 'api_invoker_snapshot_version'
+    CHECK_INTERVAL = 5
+    TOKEN_FIELDS = frozenset(['access_token', 'expire_at', 'update_time'])
+
+    _lock = threading.Lock()
+    _version = None
+    _checked_at = 0
+    _api_paths = frozenset()
+    _tokens = {}
+    _clients = {}
+
+    @classmethod
+    def _get_shared_version(cls):
+        try:
+            return int(get_redis_connection().get(cls.VERSION_KEY) or 0)
+        except Exception as e:
+            logging.error("ApiInvokerSnapshot => get version err: %s", e)
+            return cls._version or 0
+
+    @classmethod
+    def invalidate(cls):
+        try:
+            get_redis_connection().incr(cls.VERSION_KEY)
+        except Exception as e:
+            logging.error("ApiInvokerSnapshot => incr version err: %s", e)
+
+        with cls._lock:
+            cls._version = None
+
+    @staticmethod
+    def _build_entry(invoker_obj, allowed_paths):
+        error = None
+        fields = dict(id=invoker_obj.id, name=invoker_obj.name, client_id=invoker_obj.client_id)
+
+        try:
+            encrypt_text = base64.b64decode(invoker_obj.access_token)
+            plain_text = AESHelper(key=invoker_obj.salt).decrypt(text=encrypt_text)
+            client_id, app_key, app_secret, _ = plain_text.split(':')
+        except Exception:
+            logging.error(traceback.format_exc())
+            client_id = app_key = app_secret = None
+            error = (exception.InvalidTokenError, "API Token 解析错误，请检查token！")
+        else:
+            if (client_id != invoker_obj.client_id or
+                    app_key != invoker_obj.app_key or
+                    app_secret != invoker_obj.app_secret):
+                error = (exception.InvalidTokenError, "API Token 非法注册，请联系管理员核查！")
+
+        expire_at = invoker_obj.expire_at
+        if isinstance(expire_at, str):
+            expire_at = timezone.datetime.strptime(expire_at, "%Y-%m-%d %H:%M:%S")
+
+        return ApiInvokerEntry(
+            app_key=app_key, app_secret=app_secret,
+            expire_ts=expire_at.timestamp() if expire_at else 0,
+            allowed_paths=frozenset(allowed_paths), error=error, **fields
+        )
+
+    @classmethod
+    def _rebuild(cls, version):
+        invoker_paths = {}
+        api_paths = set()
+        tokens, clients = {}, {}
+
+        uri_queryset = ApiInvokerUriModel.objects.filter(is_del=False).values_list('invoker_id', 'url')
+        for invoker_id, url in uri_queryset:
+            api_paths.add(url)
+            invoker_paths.setdefault(invoker_id, []).append(url)
+
+        for invoker_obj in ApiInvokerClientModel.objects.filter(is_del=False):
+            entry = cls._build_entry(invoker_obj, invoker_paths.get(invoker_obj.id, []))
+            # 与 get_invoker_object 一致: 同一 token 取第一条
+            tokens.setdefault(invoker_obj.access_token, entry)
+            clients[invoker_obj.client_id] = entry
+
+        cls._api_paths = frozenset(api_paths)
+        cls._tokens, cls._clients = tokens, clients
+        cls._version = version
+
+    @classmethod
+    def _reload_token(cls, access_token):
+        """ 从库中重读单个 token, 替换该调用方在快照中的条目(copy-on-write, 读取方不加锁) """
+        invoker_obj = ApiInvokerClientModel.objects.filter(is_del=False, access_token=access_token).first()
+
+        if invoker_obj is None:
+            entry = None
+        else:
+            uri_queryset = ApiInvokerUriModel.objects.filter(invoker_id=invoker_obj.id, is_del=False)
+            entry = cls._build_entry(invoker_obj, uri_queryset.values_list('url', flat=True))
+
+        with cls._lock:
+            tokens = {
+                token: item for token, item in cls._tokens.items()
+                if token != access_token and (entry is None or item.id != entry.id)
+            }
+            clients = dict(cls._clients)
+
+            if entry is not None:
+                tokens[access_token] = clients[entry.client_id] = entry
+
+            cls._tokens, cls._clients = tokens, clients
+
+        return entry
+
+    @classmethod
+    def _ensure_fresh(cls):
+        now = time.time()
+        if cls._version is not None and now - cls._checked_at < cls.CHECK_INTERVAL:
+            return
+
+        with cls._lock:
+            if cls._version is not None and now - cls._checked_at < cls.CHECK_INTERVAL:
+                return
+
+            version = cls._get_shared_version()
+            if version != cls._version:
+                cls._rebuild(version)
+
+            cls._checked_at = now
+
+    @classmethod
+    def has_api_path(cls, api_path):
+        cls._ensure_fresh()
+        return api_path in cls._api_paths
+
+    @classmethod
+    def get_client(cls, client_id):
+        cls._ensure_fresh()
+        return cls._clients.get(client_id)
+
+    @classmethod
+    def authorize(cls, access_token, api_path):
+        """ 校验 token 是否合法以及是否有 api 权限, 与 get_invoker_object + check_invoker_urls 等价 """
+        cls._ensure_fresh()
+        entry = cls._tokens.get(access_token)
+
+        # 其他进程刚签发或续期的 token 在本进程快照中不存在或已过期, 重读后再判断
+        if entry is None or time.time() > entry.expire_ts:
+            entry = cls._reload_token(access_token)
+
+        if entry is None:
+            raise exception.InvalidTokenError("非法API Token ，疑似非法用户！")
+
+        if entry.error is not None:
+            error_cls, message = entry.error
+            raise error_cls(message)
+
+        if time.time() > entry.expire_ts:
+            raise exception.ExpiredTokenError("API Token 已过期！")
+
+        if api_path not in entry.allowed_paths:
+            raise exception.UriForbiddenError("没有权限调用该接口: %s" % api_path)
+
+        return entry
+
+
 class MenuModel(BaseAbstractModel):
     # 菜单栏等级
     MENU_LEVEL_CHOICES = [
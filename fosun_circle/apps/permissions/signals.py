@@ -0,0 +1,18 @@
+from django.db import router, transaction
+from django.dispatch import receiver
+from django.db.models.signals import post_save, post_delete
+
+from .models import ApiInvokerClientModel, ApiInvokerUriModel, ApiInvokerSnapshot
+
+
+@receiver([post_save, post_delete], sender=ApiInvokerClientModel)
+@receiver([post_save, post_delete], sender=ApiInvokerUriModel)
+def invalidate_api_invoker_snapshot(sender, instance, update_fields=None, **kwargs):
+    """ 调用方或其 api 权限变更: 事务提交后授权快照版本号递增(避免其他进程按未提交的数据重建快照)
+
+    只签发或续期 token(set_token) 时不递增, 各进程在授权时按需重读该 token(见 ApiInvokerSnapshot.authorize)
+    """
+    if update_fields and frozenset(update_fields) <= ApiInvokerSnapshot.TOKEN_FIELDS:
+        return
+
+    transaction.on_commit(ApiInvokerSnapshot.invalidate, using=router.db_for_write(sender))
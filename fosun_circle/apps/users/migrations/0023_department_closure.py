@@ -0,0 +1,68 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:00
+
+from django.db import migrations, models
+import fosun_circle.core.db.base
+
+# 与 CircleDepartmentClosureModel.REBUILD_SQL 一致, 迁移时用现有部门表初始化闭包表
+REBUILD_SQL = """
+    WITH RECURSIVE dep AS (
+        SELECT DISTINCT dep_id, parent_dep_id FROM circle_ding_department WHERE is_alive = true AND dep_id <> ''
+    ), tree(ancestor_dep_id, dep_id, depth) AS (
+        SELECT dep_id, dep_id, 0 FROM dep
+        UNION ALL
+        SELECT t.ancestor_dep_id, d.dep_id, t.depth + 1
+        FROM tree t JOIN dep d ON d.parent_dep_id = t.dep_id
+        WHERE t.depth < 50
+    )
+    INSERT INTO circle_ding_department_closure
+        (ancestor_dep_id, dep_id, depth, creator, modifier, create_time, update_time, is_del)
+    SELECT ancestor_dep_id, dep_id, MIN(depth), 'sys', 'sys', NOW(), NOW(), false
+    FROM tree
+    GROUP BY ancestor_dep_id, dep_id
+"""
+
+
+def build_department_closure(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(REBUILD_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0022_circleusersmodel_is_required_2fa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CircleDepartmentClosureModel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creator', models.CharField(default=fosun_circle.core.db.base.AutoExecutor(), max_length=200, verbose_name='创建人')),
+                ('modifier', models.CharField(default=fosun_circle.core.db.base.AutoExecutor(), max_length=200, verbose_name='创建人')),
+                ('create_time', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('is_del', models.BooleanField(default=False, verbose_name='是否删除')),
+                ('ancestor_dep_id', models.CharField(default='', max_length=200, verbose_name='祖先部门唯一标识')),
+                ('dep_id', models.CharField(default='', max_length=200, verbose_name='部门唯一标识')),
+                ('depth', models.IntegerField(default=0, verbose_name='相对祖先部门的层级')),
+            ],
+            options={
+                'verbose_name': '钉钉部门闭包表',
+                'verbose_name_plural': '钉钉部门闭包表',
+                'db_table': 'circle_ding_department_closure',
+                'unique_together': {('ancestor_dep_id', 'dep_id')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='circleusersmodel',
+            index=models.Index(fields=['usr_id'], name='circle_users_usr_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='circleuser2departmentmodel',
+            index=models.Index(fields=['dep_id', 'usr_id'], name='user_dep_rel_dep_usr_idx'),
+        ),
+        migrations.RunPython(build_department_closure, migrations.RunPython.noop),
+    ]
@@ -7,7 +7,7 @@ from collections import deque
 
 from django.conf import settings
 from django.urls import reverse
-from django.db import models, connections, router
+from django.db import models, connections, router, transaction
 from django.db.models import ObjectDoesNotExist, Q
 from django.core.mail import send_mail
 from django.contrib.auth import get_user_model
@@ -139,6 +139,7 @@ class CircleUsersModel(AbstractUser):
         db_table = "circle_users"
         verbose_name = "用户表"
         verbose_name_plural = verbose_name
+        indexes = [models.Index(fields=["usr_id"], name="circle_users_usr_id_idx")]
 
     def __str__(self):
         return self.username
@@ -199,45 +200,27 @@ class CircleUsersModel(AbstractUser):
         :param dep_ids: 部门 id列表, eg: ['5fff4ae9-326d-425a-a188-106b7be22ba2']
         """
         start_time = time.time()
-        department_id_set = set()
-        all_department_dict = CircleDepartmentModel.get_department_tree()
+        dep_ids = [dep_id for dep_id in dep_ids or [] if dep_id]
 
-        for _dep_id in dep_ids or []:
-            department_tree = all_department_dict.get(_dep_id) or {}
-            queue = deque([department_tree])
-
-            while queue:
-                depart_item = queue.popleft()
-                depart_id = depart_item.get("value", "")
-                department_id_set.add(depart_id)
-
-                # 子部门进入队列
-                queue.extend(depart_item.get("children") or [])
-
-        dep_end_time = time.time()
-        logger.info("get_ding_users_by_dep_ids => get_department_tree cost time:%s", dep_end_time - start_time)
-
-        if not department_id_set:
-            logger.info("get_ding_users_by_dep_ids => department_id_set is empty")
+        if not dep_ids:
+            logger.info("get_ding_users_by_dep_ids => dep_ids is empty")
             return []
 
-        # 根据部门id获取人员usr_id (数量过大，采用sql获取, 现用时6s,之前20s)
-        alias = router.db_for_read(cls)
-        _connection = connections[alias]
-        cursor = _connection.cursor()
-
+        # 部门闭包表展开所有子部门(含自身), 只扫描命中部门的人员, 耗时与结果数量相关, 与组织规模无关
         raw_sql = """
-            SELECT b.dep_id, a.phone_number, a.ding_job_code FROM circle_users a
-            JOIN circle_user_department_relation b
-            ON a.usr_id = b.usr_id AND b.is_alive=true
-            WHERE a.is_del=FALSE
+            SELECT DISTINCT a.phone_number, a.ding_job_code
+            FROM circle_ding_department_closure c
+            JOIN circle_user_department_relation b ON b.dep_id = c.dep_id AND b.is_alive = true
+            JOIN circle_users a ON a.usr_id = b.usr_id AND a.is_del = false
+            WHERE c.ancestor_dep_id = ANY(%s)
         """
 
-        cursor.execute(raw_sql)
-        db_fetch_result = cursor.fetchall()
-        results = {tmp_item[1:] for tmp_item in db_fetch_result if tmp_item[0] in department_id_set}
+        alias = router.db_for_read(cls)
+        with connections[alias].cursor() as cursor:
+            cursor.execute(raw_sql, [list(set(dep_ids))])
+            results = cursor.fetchall()
 
-        log_args = (time.time() - dep_end_time, len(results))
+        log_args = (time.time() - start_time, len(results))
         logger.info("get_ding_users_by_dep_ids => total cost time: %s, len(db_results): %s", *log_args)
 
         ding_user_list = [dict(phone_number=item[0], ding_job_code=item[1]) for item in results]
@@ -357,6 +340,51 @@ class CircleUser2DepartmentModel(BaseAbstractModel):
         db_table = "circle_user_department_relation"
         verbose_name = "钉钉人员与部门关系表"
         verbose_name_plural = verbose_name
+        indexes = [models.Index(fields=["dep_id", "usr_id"], name="user_dep_rel_dep_usr_idx")]
+
+
+class CircleDepartmentClosureModel(BaseAbstractModel):
+    """ 部门闭包表: 每个有效部门与其所有子孙部门(含自身, depth=0)各一行, 同步部门表后整表重建 """
+    ancestor_dep_id = models.CharField(max_length=200, verbose_name="祖先部门唯一标识", default="")
+    dep_id = models.CharField(max_length=200, verbose_name="部门唯一标识", default="")
+    depth = models.IntegerField(verbose_name="相对祖先部门的层级", default=0)
+
+    # 部门层级上限, 防止脏数据中父子关系成环导致递归不结束
+    MAX_DEPTH = 50
+
+    REBUILD_SQL = """
+        WITH RECURSIVE dep AS (
+            SELECT DISTINCT dep_id, parent_dep_id FROM circle_ding_department WHERE is_alive = true AND dep_id <> ''
+        ), tree(ancestor_dep_id, dep_id, depth) AS (
+            SELECT dep_id, dep_id, 0 FROM dep
+            UNION ALL
+            SELECT t.ancestor_dep_id, d.dep_id, t.depth + 1
+            FROM tree t JOIN dep d ON d.parent_dep_id = t.dep_id
+            WHERE t.depth < %s
+        )
+        INSERT INTO circle_ding_department_closure
+            (ancestor_dep_id, dep_id, depth, creator, modifier, create_time, update_time, is_del)
+        SELECT ancestor_dep_id, dep_id, MIN(depth), 'sys', 'sys', NOW(), NOW(), false
+        FROM tree
+        GROUP BY ancestor_dep_id, dep_id
+    """
+
+    class Meta:
+        db_table = "circle_ding_department_closure"
+        verbose_name = "钉钉部门闭包表"
+        verbose_name_plural = verbose_name
+        unique_together = [("ancestor_dep_id", "dep_id")]
+
+    @classmethod
+    def rebuild(cls):
+        """ 根据钉钉部门表重建闭包表(同一事务内完成, 查询方看不到中间状态) """
+        using = router.db_for_write(cls)
+
+        with transaction.atomic(using=using):
+            with connections[using].cursor() as cursor:
+                cursor.execute("DELETE FROM circle_ding_department_closure")
+                cursor.execute(cls.REBUILD_SQL, [cls.MAX_DEPTH])
+                return cursor.rowcount
 
 
 class CircleUsersVirtualRoleModel(BaseAbstractModel):
@@ -0,0 +1,27 @@
+import traceback
+
+from django.dispatch import receiver
+from django.db.models.signals import post_save, post_delete
+from django_redis import get_redis_connection
+
+from fosun_circle.libs.log import dj_logger as logger
+from fosun_circle.constants.constant import USER_CACHE_PREFIX, USER_CACHE_INVALIDATE_CHANNEL
+from .models import CircleUsersModel
+
+
+@receiver([post_save, post_delete], sender=CircleUsersModel)
+def invalidate_user_cache(sender, instance, **kwargs):
+    """ 用户变更: 删除 Redis 中的用户缓存, 并通知各进程删除本地缓存 """
+    if not instance.phone_number:
+        return
+
+    cache_key = USER_CACHE_PREFIX + instance.phone_number
+
+    try:
+        pipe = get_redis_connection().pipeline(transaction=False)
+        pipe.delete(cache_key)
+        pipe.publish(USER_CACHE_INVALIDATE_CHANNEL, cache_key)
+        pipe.execute()
+    except Exception as e:
+        logger.error("invalidate_user_cache => cache_key: %s, err: %s", cache_key, e)
+        logger.error(traceback.format_exc())
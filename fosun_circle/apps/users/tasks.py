@@ -11,6 +11,7 @@ from users.models import (
     CircleUsersModel,
     CircleDepartmentModel,
     CircleUser2DepartmentModel,
+    CircleDepartmentClosureModel,
 )
 from fosun_circle.libs.log import task_logger as logger
 from fosun_circle.libs.decorators import to_retry
@@ -236,9 +237,16 @@ def sync_ding_user_and_department(*args, **kwargs):
     """ 同步钉钉部门表 (03:30) """
     _sync_ding_users()
     _sync_ding_department()
+    _rebuild_ding_department_closure()
     _sync_ding_user_department_relation()
 
 
+def _rebuild_ding_department_closure():
+    """ 部门表同步后重建部门闭包表 """
+    row_cnt = CircleDepartmentClosureModel.rebuild()
+    logger.info("_rebuild_ding_department_closure => closure rows: %s", row_cnt)
+
+
 # @celery_app.task
 def sync_user_dept_info(**kwargs):
     cursor = connection.cursor()
@@ -2,3 +2,7 @@ HOME_BACKGROUND_URL = "http://www.bing.com/HPImageArchive.aspx?format=js&idx=0&n
 REQUEST_PARAMS_NEGOTIATOR_CAMEL = "PARAMS_NEGOTIATOR_CAMEL"
 RESPONSE_CONTENT_NEGOTIATOR_CAMEL = "CONTENT_NEGOTIATOR_CAMEL"
 
+
+# 用户信息缓存(Redis hash) 前缀与失效通知频道
+USER_CACHE_PREFIX = "user_"
+USER_CACHE_INVALIDATE_CHANNEL = "user_cache_invalidate"
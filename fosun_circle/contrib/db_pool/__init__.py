@@ -28,10 +28,11 @@ settings.py:
     fosun_circle.contrib.db_pool,  # Could be a independent package that not under `apps` package
     ......
     ]
+
+    DB_POOL_WARMUP = 5                          # pre-open 5 connections per alias when app ready, 0: disabled
+    DB_POOL_WARMUP_ALIASES = ["default"]        # optional, default: all pooled aliases
 """
 
-import os
-import os.path
 import logging
 
 from django.conf import settings
@@ -43,16 +44,13 @@ logger = logging.getLogger("django")
 
 
 def setup_pool():
-    app_name = settings.APP_NAME
     databases = settings.DATABASES
 
-    module_pkg = os.path.realpath(backends.__file__)
-    backends_module_path = module_pkg.split(os.sep)[:-1]
-    relative_module_path = backends_module_path[backends_module_path.index(app_name) + 1:]
-    engine_pkg_path = ".".join(relative_module_path)
+    # the engines must be imported under the same package name as this app (INSTALLED_APPS),
+    # otherwise the backends, the pool registry, the stats and the fork hooks are loaded twice
+    # (`contrib.db_pool` and `fosun_circle.contrib.db_pool`) and don't see each other
+    engine_pkg_path = backends.__name__
 
-    logger.warning("ORM Pool `backends_module_path`: %s", backends_module_path)
-    logger.warning("ORM Pool `relative_module_path`: %s", relative_module_path)
     logger.warning("ORM Pool Backend Package Path: %s\n" % engine_pkg_path)
 
     backend_type_list = [".mysql", ".postgresql", ".oracle"]
@@ -74,3 +72,5 @@ def setup_pool():
 
 
 setup_pool()
+
+default_app_config = 'fosun_circle.contrib.db_pool.apps.DbPoolConfig'
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class DbPoolConfig(AppConfig):
+    name = 'fosun_circle.contrib.db_pool'
+
+    def ready(self):
+        from .core.hooks import register_fork_hooks, warm_up_pools
+
+        register_fork_hooks()
+
+        warmup_size = getattr(settings, "DB_POOL_WARMUP", 0)
+        if not warmup_size:
+            return
+
+        warmup_aliases = getattr(settings, "DB_POOL_WARMUP_ALIASES", None)
+        warm_up_pools(warmup_size, warmup_aliases)
+
+        try:
+            from celery.signals import worker_process_init
+        except ImportError:
+            return
+
+        # the pools warmed up in the celery main process are left behind by its prefork children
+        worker_process_init.connect(
+            lambda **kwargs: warm_up_pools(warmup_size, warmup_aliases),
+            weak=False, dispatch_uid="db_pool_warm_up",
+        )
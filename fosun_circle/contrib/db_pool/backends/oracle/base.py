@@ -8,8 +8,23 @@ from ...core.mixins import PoolDatabaseWrapperMixin
 
 class DatabaseWrapper(PoolDatabaseWrapperMixin, base.DatabaseWrapper):
     class SQLAlchemyDialect(OracleDialect):
+        # ORA-00028 session killed, ORA-01033 startup/shutdown in progress, ORA-02396 idle time exceeded,
+        # ORA-03113 end-of-file on channel, ORA-03114 not connected, ORA-03135 connection lost contact
+        DISCONNECT_CODES = frozenset([28, 1033, 2396, 3113, 3114, 3135])
+
+        def is_disconnect(self, e, connection, cursor):
+            if not isinstance(e, DatabaseError) or not e.args:
+                return False
+
+            return getattr(e.args[0], "code", None) in self.DISCONNECT_CODES
+
         def do_ping(self, dbapi_connection):
             try:
                 return super(OracleDialect, self).do_ping(dbapi_connection)
             except DatabaseError:
                 return False
+
+    def _set_autocommit(self, autocommit):
+        # the pool's connection proxy doesn't forward attribute assignment
+        with self.wrap_database_errors:
+            self.dbapi_connection.autocommit = autocommit
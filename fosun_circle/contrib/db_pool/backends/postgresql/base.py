@@ -4,12 +4,11 @@ import logging
 from functools import partial
 
 from django.conf import settings
-from django.db.backends.postgresql import base
 
 from sqlalchemy import event
-from sqlalchemy.pool import manage, QueuePool
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
-from psycopg2 import InterfaceError, ProgrammingError, OperationalError
+from psycopg2 import InterfaceError, OperationalError
 
 try:
     # Django >= 1.9
@@ -38,39 +37,47 @@ if settings.DEBUG:
     event.listen(QueuePool, 'connect', partial(_log, 'new connection'))
 
 
-def is_disconnect(e, connection, cursor):
-    """
-    Connection state check from SQLAlchemy:
-    https://bitbucket.org/sqlalchemy/sqlalchemy/src/tip/lib/sqlalchemy/dialects/postgresql/psycopg2.py
-    """
-    if isinstance(e, OperationalError):
-        # these error messages from libpq: interfaces/libpq/fe-misc.c.
-        # TODO: these are sent through gettext in libpq and we can't
-        # check within other locales - consider using connection.closed
-        return 'terminating connection' in str(e) or \
-               'closed the connection' in str(e) or \
-               'connection not open' in str(e) or \
-               'could not receive data from server' in str(e)
-    elif isinstance(e, InterfaceError):
-        # psycopg2 client errors, psycopg2/conenction.h, psycopg2/cursor.h
-        return 'connection already closed' in str(e) or \
-               'cursor already closed' in str(e)
-    elif isinstance(e, ProgrammingError):
-        # not sure where this path is originally from, it may
-        # be obsolete.   It really says "losed", not "closed".
-        return "closed the connection unexpectedly" in str(e)
-    else:
-        return False
-
-
-class DeprecatedDatabaseWrapper(PoolDatabaseWrapperMixin, base.DatabaseWrapper):
+# SQLSTATE codes which mean the server side of the session is gone
+# https://www.postgresql.org/docs/current/errcodes-appendix.html
+DISCONNECT_SQLSTATE_CLASSES = frozenset([
+    "08",       # connection_exception
+])
+DISCONNECT_SQLSTATES = frozenset([
+    "57P01",    # admin_shutdown: pg_terminate_backend(), smart/fast shutdown
+    "57P02",    # crash_shutdown
+    "57P03",    # cannot_connect_now: starting up, shutting down, in recovery
+    "57P05",    # idle_session_timeout (PostgreSQL 14+)
+    "25P03",    # idle_in_transaction_session_timeout
+])
+
+
+def is_disconnect(e, connection=None, cursor=None):
     """
-    Reference: https://github.com/altairbow/django-db-connection-pool
-    Issues: 查询没有问题, insert + update 不起作用
+    Whether `e` means the connection is dead and must be discarded from the pool
+
+    Decided by the SQLSTATE sent by the server, the psycopg2 exception type and
+    the connection state, never by the (localized) error message.
     """
+    # django.db.utils.Error wraps the psycopg2 exception
+    if not isinstance(e, Database.Error):
+        e = e.__cause__
 
-    class SQLAlchemyDialect(PGDialect_psycopg2):
-        pass
+        if not isinstance(e, Database.Error):
+            return False
+
+    pgcode = e.pgcode
+    if pgcode:
+        return pgcode[:2] in DISCONNECT_SQLSTATE_CLASSES or pgcode in DISCONNECT_SQLSTATES
+
+    # no SQLSTATE: raised by libpq/psycopg2 on the client side
+    if isinstance(e, (OperationalError, InterfaceError)):
+        # connection.closed: 0 open, 1 closed, 2 broken
+        if connection is not None and hasattr(connection, "closed"):
+            return connection.closed != 0
+
+        return True
+
+    return False
 
 
 class DatabaseCreation(Psycopg2DatabaseCreation):
@@ -80,47 +87,39 @@ class DatabaseCreation(Psycopg2DatabaseCreation):
         super(DatabaseCreation, self).destroy_test_db(*args, **kw)
 
 
-class DatabaseWrapper(Psycopg2DatabaseWrapper):
-    """ SQLAlchemy FTW.
-    Reference: https://github.com/heroku-python/django-postgrespool
+class DatabaseWrapper(PoolDatabaseWrapperMixin, Psycopg2DatabaseWrapper):
     """
+    Reference: https://github.com/altairbow/django-db-connection-pool
+               https://github.com/heroku-python/django-postgrespool
 
-    POOL_SETTINGS = {
-        'pre_ping': True,
-        'echo': True,
-        'timeout': None,
-        'recycle': 60 * 60,
-        'pool_size': 10,
-        'max_overflow': 15,
-    }
+    `self.connection` is the pool's connection proxy: method calls are forwarded to
+    the psycopg2 connection, but attribute assignment (autocommit) is not.
+    """
 
-    def __init__(self, *args, **kwargs):
-        super(DatabaseWrapper, self).__init__(*args, **kwargs)
-        self.creation = DatabaseCreation(self)
+    class SQLAlchemyDialect(PGDialect_psycopg2):
+        def is_disconnect(self, e, connection, cursor):
+            return is_disconnect(e, connection, cursor)
+
+        def do_ping(self, dbapi_connection):
+            # sqlalchemy 1.3 pings every checkout, the new connections too: unless autocommit
+            # is on, the ping opens a transaction, and psycopg2 refuses to set autocommit
+            # (django's connect()) inside a transaction, end it
+            is_alive = super(DatabaseWrapper.SQLAlchemyDialect, self).do_ping(dbapi_connection)
 
-    @property
-    def db_pool(self):
-        pool_setting = {}
-        pool_options = self.settings_dict.get('POOL_OPTIONS', {})
+            if is_alive and not dbapi_connection.autocommit:
+                dbapi_connection.rollback()
 
-        for key, value in self.POOL_SETTINGS.items():
-            if key.upper() in pool_options:
-                pool_setting.setdefault(key.lower(), pool_options[key.upper()])
-            else:
-                pool_setting.setdefault(key.lower(), value)
+            return is_alive
 
-        if hasattr(self, "_db_pool"):
-            pool = getattr(self, "_db_pool")
-        else:
-            pool = manage(Database, **pool_setting)
-            setattr(self, "_db_pool", pool)
+    def __init__(self, *args, **kwargs):
+        super(DatabaseWrapper, self).__init__(*args, **kwargs)
+        self.creation = DatabaseCreation(self)
 
-        log.info("contrib.db_pool.backends.postgresql.base.DatabaseWrapper <db_pool>: %s", pool)
-        return pool
+    def _set_autocommit(self, autocommit):
+        with self.wrap_database_errors:
+            self.dbapi_connection.autocommit = autocommit
 
     def _commit(self):
-        log.info("DatabaseWrapper._commit -> connection: %s, is_usable: %s", self.connection, self.is_usable)
-
         if self.connection is not None and self.is_usable():
             with self.wrap_database_errors:
                 return self.connection.commit()
@@ -132,20 +131,11 @@ class DatabaseWrapper(Psycopg2DatabaseWrapper):
 
     def _dispose(self):
         """Dispose of the pool for this instance, closing all connections."""
-        self.close()
-        # _DBProxy.dispose doesn't actually call dispose on the pool
-        conn_params = self.get_connection_params()
-        key = self.db_pool._serialize(**conn_params)
-        try:
-            pool = self.db_pool.pools[key]
-        except KeyError:
-            log.info("DatabaseWrapper._dispose err")
-        else:
-            pool.dispose()
-            del self.db_pool.pools[key]
+        self.dispose_pool()
+
+    def is_disconnect(self, e):
+        return is_disconnect(e, self.dbapi_connection)
 
     def is_usable(self):
         # https://github.com/kennethreitz/django-postgrespool/issues/24
-        return not self.connection.closed
-
-
+        return self.connection.is_valid and not self.connection.closed
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import os
 import threading
 try:
     from django.utils.translation import ugettext_lazy as _
@@ -7,13 +8,21 @@ except ImportError:
     from django.utils.translation import gettext_lazy as _
 
 from ..core.exceptions import PoolDoesNotExist
+from .stats import reset_pool_stats
 
 
 class ConnectionPool(dict):
+    """ Per-process pool registry: (alias, connection parameters) -> pool
+
+    Pools are created once per process. A forked child must never use (or close)
+    the sockets inherited from its parent, so the registry is reset as soon as it
+    is used from a new pid: inherited pools are kept aside, untouched.
+    """
+
     # the default parameters of pool
     pool_default_params = {
         'pre_ping': True,
-        'echo': True,
+        'echo': False,
         'timeout': None,
         'recycle': 60 * 60,
         'pool_size': 10,
@@ -27,9 +36,53 @@ class ConnectionPool(dict):
             # Important:
             # acquire this lock before modify pool_container
             cls._instance.lock = threading.Lock()
+            cls._instance.pid = os.getpid()
+            cls._instance.inherited_pools = []
 
         return cls._instance
 
+    @staticmethod
+    def make_key(alias, conn_params):
+        return alias, repr(sorted(conn_params.items()))
+
+    def reset(self):
+        """ Forget the pools created by the parent process, without closing their connections """
+        if self.pid == os.getpid():
+            return
+
+        # the lock may have been held by another thread of the parent at fork time
+        self.lock = threading.Lock()
+        self.inherited_pools.extend(self.values())
+        self.clear()
+        self.pid = os.getpid()
+
+        # the counters of the parent's pools are not this process's
+        reset_pool_stats()
+
+    def get_pool(self, alias, conn_params):
+        """ Hot path: a pid check plus a dict lookup, return None if the pool does not exist """
+        if self.pid != os.getpid():
+            self.reset()
+
+        return dict.get(self, self.make_key(alias, conn_params))
+
+    def get_or_create_pool(self, alias, conn_params, create_pool):
+        db_pool = self.get_pool(alias, conn_params)
+        if db_pool is not None:
+            return db_pool
+
+        key = self.make_key(alias, conn_params)
+        with self.lock:
+            db_pool = dict.get(self, key)
+
+            if db_pool is None:
+                db_pool = self[key] = create_pool()
+
+        return db_pool
+
+    def get_alias_pools(self, alias):
+        return [db_pool for (pool_alias, _), db_pool in list(self.items()) if pool_alias == alias]
+
     def put(self, pool_name, pool):
         self[pool_name] = pool
 
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""
+Process lifecycle hooks of the pools.
+
+. warm up: pre-open N connections per alias, so the first requests of a fresh
+  worker don't pay the TCP/TLS/auth cost (settings.DB_POOL_WARMUP)
+
+. after fork: a forked child (gunicorn --preload, celery prefork) must not touch
+  the connections inherited from its parent, neither use nor close them, closing
+  a psycopg2/pymysql connection sends a termination packet over the shared socket
+  and breaks the parent's session.
+"""
+
+import os
+import logging
+
+from django.db import connections
+
+from . import conn_pool
+from .mixins import PoolDatabaseWrapperMixin
+
+logger = logging.getLogger("django")
+
+# the pool connections (_ConnectionFairy) of django's wrappers inherited from the
+# parent, referenced forever: once garbage collected, sqlalchemy's finalizer would
+# reset (ROLLBACK) them over the socket still shared with the parent
+inherited_connections = []
+
+
+def warm_up_pools(size, aliases=None):
+    """ Pre-open `size` connections (at most pool_size) in the pool of each alias """
+    warmed = {}
+
+    for alias in aliases or connections:
+        wrapper = connections[alias]
+
+        if not isinstance(wrapper, PoolDatabaseWrapperMixin):
+            continue
+
+        try:
+            db_pool = wrapper.db_pool
+            # connections beyond pool_size are overflow, they would be closed on checkin
+            count = min(size, db_pool.size())
+            # check out all of them at the same time, otherwise the pool hands back the same one
+            conns = [db_pool.connect() for _ in range(count)]
+        except Exception as e:
+            logger.warning("Warm up %s's pool failed: %s", alias, e)
+            continue
+
+        for conn in conns:
+            conn.close()
+
+        warmed[alias] = len(conns)
+
+    logger.info("Pools warmed up: %s, pid: %s", warmed, os.getpid())
+    return warmed
+
+
+def after_fork_in_child():
+    """ Forget the pools and django connections inherited from the parent process, without closing them """
+    conn_pool.reset()
+
+    for alias in connections:
+        # Only touch the wrappers already created in the forking thread
+        wrapper = getattr(connections._connections, alias, None)
+
+        if wrapper is not None and wrapper.connection is not None:
+            inherited_connections.append(wrapper.connection)
+            wrapper.connection = None
+            wrapper.in_atomic_block = False
+            wrapper.needs_rollback = False
+            wrapper.savepoint_ids = []
+
+
+def register_fork_hooks():
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=after_fork_in_child)
@@ -1,95 +1,152 @@
 # -*- coding: utf-8 -*-
 
-from copy import deepcopy
 from sqlalchemy import pool
-from sqlalchemy import create_engine
-from sqlalchemy.engine import Engine
+from django.db.utils import DatabaseErrorWrapper
 try:
     from django.utils.translation import ugettext_lazy as _
 except ImportError:
     from django.utils.translation import gettext_lazy as _
 
 from . import conn_pool
+from .stats import instrument_pool, observe_checkout, describe_conn_params, pool_stats
 
 import logging
 logger = logging.getLogger("django")
 
 
+class PoolDatabaseErrorWrapper(DatabaseErrorWrapper):
+    """ Invalidate the pooled connection as soon as the driver reports a disconnect """
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and issubclass(exc_type, self.wrapper.Database.Error):
+            self.wrapper.invalidate_if_disconnect(exc_value)
+
+        return super(PoolDatabaseErrorWrapper, self).__exit__(exc_type, exc_value, traceback)
+
+
 class PoolDatabaseWrapperMixin(object):
+    _sqlalchemy_dialect = None
+
+    def get_pool_params(self):
+        # make a copy of default parameters
+        pool_params = dict(conn_pool.pool_default_params)
+
+        # parse parameters of current database from self.settings_dict
+        pool_setting = {
+            # transform the keys in POOL_OPTIONS to upper case
+            # to fit sqlalchemy.pool.QueuePool's arguments requirement
+            key.lower(): value
+            # traverse POOL_OPTIONS to get arguments
+            for key, value in
+            # self.settings_dict was created by Django
+            # is the connection parameters of self.alias
+            self.settings_dict.get('POOL_OPTIONS', {}).items()
+            # There are some limits of self.alias's pool's option(POOL_OPTIONS):
+            # the keys in POOL_OPTIONS must be capitalised
+            # and the keys's lowercase must be in conn_pool.pool_default_params
+            if key == key.upper() and key.lower() in conn_pool.pool_default_params
+        }
+
+        # replace pool_params's items with pool_setting's items
+        # to import custom parameters
+        pool_params.update(**pool_setting)
+        return pool_params
+
+    def create_pool(self, conn_params):
+        pool_params = self.get_pool_params()
+
+        # method of connection initiation defined by django
+        # django.db.backends.<database>.base.DatabaseWrapper
+        django_get_new_connection = super(PoolDatabaseWrapperMixin, self).get_new_connection
+
+        # method of connection initiation defined by
+        # dj_db_conn_pool.backends.<database>.base.DatabaseWrapper
+        get_new_connection = getattr(self, '_get_new_connection', django_get_new_connection)
+
+        alias_pool = pool.QueuePool(
+            # super().get_new_connection was defined by
+            # db_pool.backends.<database>.base.DatabaseWrapper or
+            # django.db.backends.<database>.base.DatabaseWrapper
+            # the method of connection initiation
+            lambda: get_new_connection(conn_params),
+            # SQLAlchemy use the dialect to maintain the pool
+            dialect=self.SQLAlchemyDialect(dbapi=self.Database),
+            # parameters of self.alias
+            **pool_params
+        )
+
+        # collect checkout/checkin/invalidate... statistics of the pool
+        instrument_pool(conn_pool.make_key(self.alias, conn_params), alias_pool, describe_conn_params(conn_params))
+
+        logger.info(_("%s's pool has been created, parameter: %s"), self.alias, pool_params)
+        return alias_pool
+
+    @property
+    def db_pool(self):
+        conn_params = self.get_connection_params()
+        return conn_pool.get_or_create_pool(self.alias, conn_params, lambda: self.create_pool(conn_params))
+
+    @property
+    def dbapi_connection(self):
+        """ The raw DB-API connection behind the pool's connection proxy """
+        return getattr(self.connection, 'connection', self.connection)
+
+    @property
+    def wrap_database_errors(self):
+        return PoolDatabaseErrorWrapper(self)
+
+    def is_disconnect(self, e):
+        """ Whether the driver exception `e` means the connection is dead, using the dialect's error codes """
+        cls = type(self)
+        if cls._sqlalchemy_dialect is None:
+            cls._sqlalchemy_dialect = self.SQLAlchemyDialect(dbapi=self.Database)
+
+        return cls._sqlalchemy_dialect.is_disconnect(e, self.dbapi_connection, None)
+
+    def invalidate_if_disconnect(self, e):
+        fairy = self.connection
+
+        # not checked out from a pool, or already invalidated
+        if not getattr(fairy, 'is_valid', False) or not self.is_disconnect(e):
+            return False
+
+        # the same as sqlalchemy's engine does: discard this connection, and the
+        # other connections opened before now (server restart / failover) are
+        # reconnected on their next checkout instead of failing one by one
+        fairy._pool._invalidate(fairy, e)
+        logger.warning("%s's connection is invalidated, error: %r", self.alias, e)
+
+        # django connects again on the next query, or after the atomic block
+        self.close()
+        return True
+
     def get_new_connection(self, conn_params):
         """
         override django.db.backends.<database>.base.DatabaseWrapper.get_new_connection to
         change the default behavior of getting new connection to database, we maintain
         conn_pool who contains the connection pool of each database here
-        when django call this method to get new connection, we check whether there exists
-        the pool of this database(self.alias)
-        if the target pool doesn't exist, we will create one
-        then grab one connection from the pool and return it to django
+
+        the pool of (self.alias, conn_params) is created once per process, after that
+        getting a connection is a dict lookup plus a pool checkout
         :return:
         """
-        with conn_pool.lock:
-            # acquire the lock, check whether there exists the pool of current database
-            # note: the value of self.alias is the name of current database, one of setting.DATABASES
-            if self.alias not in conn_pool:
-                # self.alias's pool doesn't exist, time to create it
-
-                # make a copy of default parameters
-                pool_params = deepcopy(conn_pool.pool_default_params)
-
-                # parse parameters of current database from self.settings_dict
-                pool_setting = {
-                    # transform the keys in POOL_OPTIONS to upper case
-                    # to fit sqlalchemy.pool.QueuePool's arguments requirement
-                    key.lower(): value
-                    # traverse POOL_OPTIONS to get arguments
-                    for key, value in
-                    # self.settings_dict was created by Django
-                    # is the connection parameters of self.alias
-                    self.settings_dict.get('POOL_OPTIONS', {}).items()
-                    # There are some limits of self.alias's pool's option(POOL_OPTIONS):
-                    # the keys in POOL_OPTIONS must be capitalised
-                    # and the keys's lowercase must be in conn_pool.pool_default_params
-                    if key == key.upper() and key.lower() in conn_pool.pool_default_params
-                }
-
-                # replace pool_params's items with pool_setting's items
-                # to import custom parameters
-                pool_params.update(**pool_setting)
-
-                # method of connection initiation defined by django
-                # django.db.backends.<database>.base.DatabaseWrapper
-                django_get_new_connection = super(PoolDatabaseWrapperMixin, self).get_new_connection
-
-                # method of connection initiation defined by
-                # dj_db_conn_pool.backends.<database>.base.DatabaseWrapper
-                get_new_connection = getattr(self, '_get_new_connection', django_get_new_connection)
-
-                # now we have all parameters of self.alias
-                # create self.alias's pool
-                alias_pool = pool.QueuePool(
-                    # super().get_new_connection was defined by
-                    # db_pool.backends.<database>.base.DatabaseWrapper or
-                    # django.db.backends.<database>.base.DatabaseWrapper
-                    # the method of connection initiation
-                    lambda: get_new_connection(conn_params),
-                    # SQLAlchemy use the dialect to maintain the pool
-                    dialect=self.SQLAlchemyDialect(dbapi=self.Database),
-                    # parameters of self.alias
-                    **pool_params
-                )
-
-                logger.info(_("%s's pool has been created, parameter: %s"), self.alias, pool_params)
-
-                # pool has been created
-                # put into conn_pool for reusing
-                conn_pool.put(self.alias, alias_pool)
-
-        # get self.alias's pool from conn_pool
-        db_pool = conn_pool.get(self.alias)
+        db_pool = conn_pool.get_pool(self.alias, conn_params)
+
+        if db_pool is None:
+            db_pool = conn_pool.get_or_create_pool(self.alias, conn_params, lambda: self.create_pool(conn_params))
+
         # get one connection from the pool
-        conn = db_pool.connect()
-        # logger.info(_("got %s's connection from its pool"), self.alias)
-        return conn
+        with observe_checkout(db_pool):
+            return db_pool.connect()
+
+    def dispose_pool(self):
+        """ Dispose of the pools of this alias, closing all connections """
+        self.close()
+
+        with conn_pool.lock:
+            for key in [key for key in conn_pool if key[0] == self.alias]:
+                conn_pool.pop(key).dispose()
+                pool_stats.pop(key, None)
 
     def close(self, *args, **kwargs):
         # logger.info(_("release %s's connection to its pool"), self.alias)
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+"""
+Per-pool statistics collected from SQLAlchemy pool events.
+
+One alias may own several pools (the registry is keyed by alias and connection
+parameters), so the stats of an alias are a list, one item per pool.
+
+    from fosun_circle.contrib.db_pool.core.stats import get_pool_stats
+    get_pool_stats()            # {alias: [{...}, ...], ...}
+    get_pool_stats("default")   # [{...}, ...]
+
+The numbers live in the current process only (every gunicorn/celery worker
+owns its pools, a forked child starts from zero). With
+settings.DB_POOL_STATS_PUBLISH_INTERVAL > 0 each process publishes its snapshot to
+the redis hash PUBLISH_KEY (field `host:pid`) at most once per interval, on a
+checkout, so that the `db_pool_stats` command can read the pools of the running
+workers; an idle process keeps its last snapshot until it is older than
+3 intervals.
+"""
+
+import os
+import json
+import time
+import socket
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from django.conf import settings
+
+logger = logging.getLogger("django")
+
+PUBLISH_KEY = "db_pool:stats"
+
+
+class PoolStats(object):
+    COUNTERS = (
+        "connects", "checkouts", "checkins", "invalidations",
+        "pre_ping_failures", "recycles", "checkout_errors",
+    )
+
+    def __init__(self, alias, pool, target=""):
+        self.alias = alias
+        self.pool = pool
+        self.target = target
+        self.created_at = time.time()
+        self._lock = threading.Lock()
+
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def incr(self, name, value=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def observe_wait(self, seconds):
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self):
+        pool = self.pool
+        data = dict(
+            alias=self.alias,
+            target=self.target,
+            pool=pool.__class__.__name__,
+            uptime=round(time.time() - self.created_at, 3),
+        )
+
+        # QueuePool only
+        for attr in ("size", "checkedin", "checkedout", "overflow"):
+            method = getattr(pool, attr, None)
+            if callable(method):
+                data[attr] = method()
+
+        data["max_overflow"] = getattr(pool, "_max_overflow", None)
+
+        with self._lock:
+            data.update({name: getattr(self, name) for name in self.COUNTERS})
+            data.update(
+                wait_count=self.wait_count,
+                wait_avg_ms=round(self.wait_total / self.wait_count * 1000, 3) if self.wait_count else 0,
+                wait_max_ms=round(self.wait_max * 1000, 3),
+            )
+
+        return data
+
+
+# registry key of the pool: (alias, connection parameters) -> PoolStats
+pool_stats = {}
+_published_at = 0
+
+
+def reset_pool_stats():
+    """ Forget the statistics of the pools inherited from the parent process (after fork) """
+    global _published_at
+
+    pool_stats.clear()
+    _published_at = 0
+
+
+def describe_conn_params(conn_params):
+    """ `database#digest` of the connection parameters: tells the pools of an alias apart,
+    without exposing the user, host or password """
+    database = conn_params.get("database") or conn_params.get("dbname") or conn_params.get("db") or ""
+    digest = hashlib.sha1(repr(sorted(conn_params.items())).encode()).hexdigest()[:8]
+
+    return "%s#%s" % (database, digest)
+
+
+def instrument_pool(key, pool, target=""):
+    """ Attach statistics listeners to `pool` and register it under its registry `key` (alias, ...) """
+    stats = PoolStats(key[0], pool, target=target)
+
+    def on_connect(dbapi_connection, connection_record):
+        stats.incr("connects")
+        record_info = connection_record.record_info
+
+        # a record that connects again was either invalidated or recycled
+        if record_info.get("connected"):
+            if not record_info.pop("invalidated", False):
+                stats.incr("recycles")
+
+        record_info["connected"] = True
+
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        stats.incr("invalidations")
+        connection_record.record_info["invalidated"] = True
+
+    event.listen(pool, "connect", on_connect)
+    event.listen(pool, "checkout", lambda *args: stats.incr("checkouts"))
+    event.listen(pool, "checkin", lambda *args: stats.incr("checkins"))
+    event.listen(pool, "invalidate", on_invalidate)
+
+    dialect = getattr(pool, "_dialect", None)
+    do_ping = getattr(dialect, "do_ping", None)
+
+    if do_ping is not None:
+        def counted_do_ping(dbapi_connection):
+            try:
+                is_alive = do_ping(dbapi_connection)
+            except Exception:
+                stats.incr("pre_ping_failures")
+                raise
+
+            if not is_alive:
+                stats.incr("pre_ping_failures")
+            return is_alive
+
+        dialect.do_ping = counted_do_ping
+
+    pool_stats[key] = stats
+    pool._pool_stats = stats
+    return stats
+
+
+@contextmanager
+def observe_checkout(pool):
+    """ Measure the time spent waiting for a connection from `pool` """
+    stats = getattr(pool, "_pool_stats", None)
+    start = time.perf_counter()
+
+    try:
+        yield
+    except Exception:
+        stats is not None and stats.incr("checkout_errors")
+        raise
+    finally:
+        if stats is not None:
+            stats.observe_wait(time.perf_counter() - start)
+
+    publish_pool_stats()
+
+
+def get_pool_stats(alias=None):
+    result = {}
+
+    for (_alias, _), stats in list(pool_stats.items()):
+        result.setdefault(_alias, []).append(stats.snapshot())
+
+    if alias is not None:
+        return result.get(alias, [])
+
+    return result
+
+
+def _get_redis_connection():
+    from django_redis import get_redis_connection
+    return get_redis_connection()
+
+
+def publish_pool_stats(force=False):
+    """ Publish the snapshot of this process to redis, at most once per DB_POOL_STATS_PUBLISH_INTERVAL """
+    global _published_at
+
+    interval = getattr(settings, "DB_POOL_STATS_PUBLISH_INTERVAL", 0)
+    now = time.time()
+
+    if not interval or (not force and now - _published_at < interval):
+        return False
+
+    _published_at = now
+    field = "%s:%s" % (socket.gethostname(), os.getpid())
+    data = dict(pid=os.getpid(), published_at=now, pools=get_pool_stats())
+
+    try:
+        _get_redis_connection().hset(PUBLISH_KEY, field, json.dumps(data, default=str))
+    except Exception as e:
+        logger.warning("Publish pool stats failed: %s", e)
+        return False
+
+    return True
+
+
+def get_published_pool_stats(alias=None):
+    """ The snapshots published by the running processes: {`host:pid`: {pid, published_at, pools}}
+
+    Snapshots older than 3 intervals (dead or long idle processes) are dropped.
+    """
+    max_age = 3 * getattr(settings, "DB_POOL_STATS_PUBLISH_INTERVAL", 0)
+    redis_conn = _get_redis_connection()
+    result, expired = {}, []
+
+    for field, value in redis_conn.hgetall(PUBLISH_KEY).items():
+        field = field.decode() if isinstance(field, bytes) else field
+        data = json.loads(value)
+
+        if time.time() - data["published_at"] > max_age:
+            expired.append(field)
+            continue
+
+        if alias is not None:
+            data["pools"] = {alias: data["pools"].get(alias, [])}
+
+        result[field] = data
+
+    if expired:
+        redis_conn.hdel(PUBLISH_KEY, *expired)
+
+    return result
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import json
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.core.management.base import BaseCommand
+
+from ...core.stats import get_published_pool_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Check every database alias with `SELECT 1` and print, as json, the pool statistics published "
+        "by the running gunicorn/celery processes (settings.DB_POOL_STATS_PUBLISH_INTERVAL > 0). "
+        "The pools of this command's own process are not reported, they are new and say nothing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--alias", action="append", dest="aliases", help="database alias, default all")
+        parser.add_argument("--no-ping", action="store_false", dest="ping", help="do not run `SELECT 1`")
+
+    def ping(self, alias):
+        health = dict(ok=True, error=None, latency_ms=None)
+        start = time.perf_counter()
+
+        try:
+            connection = connections[alias]
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM DUAL" if connection.vendor == "oracle" else "SELECT 1")
+                cursor.fetchone()
+        except Exception as e:
+            health.update(ok=False, error=str(e))
+
+        health["latency_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        connections[alias].close()
+        return health
+
+    def handle(self, *args, **options):
+        aliases = options["aliases"] or list(connections)
+        report = dict(health={}, processes={})
+
+        if options["ping"]:
+            report["health"] = {alias: self.ping(alias) for alias in aliases}
+
+        if not getattr(settings, "DB_POOL_STATS_PUBLISH_INTERVAL", 0):
+            report["processes"] = "settings.DB_POOL_STATS_PUBLISH_INTERVAL is 0, the processes publish nothing"
+        else:
+            for process, data in get_published_pool_stats().items():
+                data["pools"] = {alias: pools for alias, pools in data["pools"].items() if alias in aliases}
+                report["processes"][process] = data
+
+        self.stdout.write(json.dumps(report, indent=2, default=str))
@@ -0,0 +1,59 @@
+"""
+Render the project's standard response envelope directly from `response.data`:
+
+    {"code": 200, "message": "OK", "data": ...}
+
+The envelope (and optional camelCase conversion) is applied once to the python
+data before it is serialized, so `HttpResponseMiddleware` no longer has to parse
+the rendered body, wrap it and render it again.
+"""
+import coreapi
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+
+from fosun_circle.libs.utils.camel_underline import camel_dict
+from fosun_circle.constants.enums.code_message import CodeMessageEnum
+from fosun_circle.constants.constant import RESPONSE_CONTENT_NEGOTIATOR_CAMEL
+
+
+def standard_response_data(raw_result, status_code, camel=False):
+    """ 将视图的原始数据包装为标准响应结构 """
+    data = dict(code=CodeMessageEnum.OK_200.code, message=CodeMessageEnum.OK_200.message, data=None)
+
+    if status.is_success(status_code):
+        data.update(data=raw_result)
+    else:
+        raw_result = raw_result if isinstance(raw_result, dict) else {}
+        data.update(
+            code=raw_result.get("code") or status_code,
+            message=str(raw_result.get("message", ""))
+        )
+
+    if data.get("code") != 200:
+        data.update(data=None)
+
+    if isinstance(data.get("data"), dict) and 'code' in data['data'] and data['data']['code'] != 200:
+        data.update(data=None, code=data['data']["code"], message=data['data'].get("message"))
+
+    return camel_dict(data) if camel else data
+
+
+class StandardJSONRenderer(JSONRenderer):
+    """ 渲染时直接输出标准响应结构, 并标记 response 已包装 """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        view = renderer_context.get("view")
+        response = renderer_context.get("response")
+
+        if response is None or \
+           getattr(response, "_raw_response", False) or \
+           isinstance(data, coreapi.Document) or \
+           response.get("Content-Disposition"):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        camel = getattr(view.__class__, RESPONSE_CONTENT_NEGOTIATOR_CAMEL, False) if view is not None else True
+        response._is_enveloped = True
+
+        data = standard_response_data(data, response.status_code, camel=camel)
+        return super().render(data, accepted_media_type, renderer_context)
@@ -30,14 +30,70 @@ django default cache does not require this parameter, one or the other.
 
 Provides various throttling policies.
 """
+import os
 import time
-import json
 
 from django_redis import get_redis_connection
 from django.core.exceptions import ImproperlyConfigured
 from rest_framework.settings import api_settings
 
 
+# Sliding window over a sorted set, executed atomically on the redis server.
+# KEYS[1]: throttle key
+# ARGV: now(ms), window(ms), limit, member
+# Return: {allowed, hits in window, oldest score in window}
+SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+local hits = redis.call('ZCARD', key)
+local allowed = 0
+
+if hits < limit then
+    redis.call('ZADD', key, now, ARGV[4])
+    redis.call('PEXPIRE', key, window)
+    hits = hits + 1
+    allowed = 1
+end
+
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+return {allowed, hits, oldest[2] or tostring(now)}
+"""
+
+
+class SlidingWindowLimiter:
+    """
+    Atomic sliding-window limiter shared by all throttles.
+
+    Trim, count and record are executed by a single lua script (EVALSHA), so
+    every check costs one round trip with a constant payload and concurrent
+    requests can never over-admit.
+    """
+
+    def __init__(self, client, script=SLIDING_WINDOW_SCRIPT):
+        self.client = client
+        self._script = client.register_script(script)
+
+    def hit(self, key, limit, duration, now):
+        """
+        Record a hit of `key` at `now` (seconds) if fewer than `limit` hits
+        were recorded during the last `duration` seconds.
+
+        Return a three tuple of: <allowed>, <hits in window>, <oldest hit time>
+        """
+        now_ms = int(now * 1000)
+        member = '%d-%s' % (now_ms, os.urandom(6).hex())
+        allowed, hits, oldest = self._script(keys=[key], args=[now_ms, int(duration * 1000), limit, member])
+
+        if isinstance(oldest, bytes):
+            oldest = oldest.decode()
+
+        return bool(allowed), int(hits), float(oldest) / 1000
+
+
 class BaseThrottle:
     """
     Rate throttling of requests.
@@ -89,6 +145,7 @@ class SimpleRateThrottle(BaseThrottle):
     Previous request information used for throttling is stored in the cache.
     """
     cache = get_redis_connection()
+    limiter = SlidingWindowLimiter(cache)
     timer = time.time
     cache_format = 'throttle_%(scope)s_%(ident)s'
     scope = None
@@ -149,25 +206,20 @@ class SimpleRateThrottle(BaseThrottle):
         if self.key is None:
             return True
 
-        dumps = self.cache.get(self.key) or '[]'
-        self.history = json.loads(dumps)
         self.now = self.timer()
+        allowed, self.num_hits, self.oldest = self.limiter.hit(
+            self.key, self.num_requests, self.duration, self.now
+        )
 
-        # Drop any requests from the history which have now passed the
-        # throttle duration
-        while self.history and self.history[-1] <= self.now - self.duration:
-            self.history.pop()
-        if len(self.history) >= self.num_requests:
+        if not allowed:
             return self.throttle_failure()
         return self.throttle_success()
 
     def throttle_success(self):
         """
-        Inserts the current request's timestamp along with the key
-        into the cache.
+        Called when the request was admitted, the hit has already been
+        recorded by the limiter.
         """
-        self.history.insert(0, self.now)
-        self.cache.set(self.key, json.dumps(self.history), ex=self.duration)
         return True
 
     def throttle_failure(self):
@@ -180,12 +232,12 @@ class SimpleRateThrottle(BaseThrottle):
         """
         Returns the recommended next request time in seconds.
         """
-        if self.history:
-            remaining_duration = self.duration - (self.now - self.history[-1])
+        if self.num_hits:
+            remaining_duration = self.duration - (self.now - self.oldest)
         else:
             remaining_duration = self.duration
 
-        available_requests = self.num_requests - len(self.history) + 1
+        available_requests = self.num_requests - self.num_hits + 1
         if available_requests <= 0:
             return None
 
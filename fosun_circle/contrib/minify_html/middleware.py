@@ -4,7 +4,7 @@ import json
 from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
 
-from .minify import html_minify
+from .minify import cached_html_minify
 
 
 class MarkRequestMiddleware(MiddlewareMixin):
@@ -15,6 +15,12 @@ class MarkRequestMiddleware(MiddlewareMixin):
 class HtmlMinifyMiddleware(MiddlewareMixin):
     HTML_REGEX = re.compile(r'<template>.*?</template>', re.M | re.S)
 
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        self.exclude_regex_list = [
+            re.compile(url_pattern) for url_pattern in getattr(settings, 'EXCLUDE_FROM_MINIFYING', ())
+        ]
+
     def _is_hybrid(self, response):
         """ A hybrid of html and json """
         # Mixed Content maybe have Html to Vue
@@ -30,7 +36,7 @@ class HtmlMinifyMiddleware(MiddlewareMixin):
 
     def _html_minify_hybrid(self, response, ignore_comments=True, parser=None):
         data = json.loads(response.content)
-        mini_html = html_minify(data['html'], ignore_comments=ignore_comments, parser=parser)
+        mini_html = cached_html_minify(data['html'], ignore_comments=ignore_comments, parser=parser)
         data['html'] = mini_html
 
         return json.dumps(data)
@@ -41,12 +47,11 @@ class HtmlMinifyMiddleware(MiddlewareMixin):
         except AttributeError:
             return False
 
-        if hasattr(settings, 'EXCLUDE_FROM_MINIFYING'):
-            for url_pattern in settings.EXCLUDE_FROM_MINIFYING:
-                regex = re.compile(url_pattern)
-                if regex.match(request.path.lstrip('/')):
-                    req_ok = False
-                    break
+        request_path = request.path.lstrip('/')
+        for regex in self.exclude_regex_list:
+            if regex.match(request_path):
+                req_ok = False
+                break
 
         resp_ok = 'text/html' in response.get('Content-Type', '')
         if hasattr(response, 'minify_response'):
@@ -57,11 +62,11 @@ class HtmlMinifyMiddleware(MiddlewareMixin):
     def process_response(self, request, response):
         minify = getattr(settings, "HTML_MINIFY", not settings.DEBUG)
         keep_comments = getattr(settings, 'KEEP_COMMENTS_ON_MINIFYING', False)
-        parser = getattr(settings, 'HTML_MIN_PARSER', 'html5lib')
+        parser = getattr(settings, 'HTML_MIN_PARSER', 'stream')
 
         if minify:
             if self.can_minify_response(request, response):
-                content = html_minify(response.content, ignore_comments=not keep_comments, parser=parser)
+                content = cached_html_minify(response.content, ignore_comments=not keep_comments, parser=parser)
             elif self._is_hybrid(response):
                 # Issue: 子组件的自组件无法正产展示
                 content = self._html_minify_hybrid(response, ignore_comments=not keep_comments, parser=parser)
@@ -69,6 +74,6 @@ class HtmlMinifyMiddleware(MiddlewareMixin):
                 content = response.content
 
             response.content = content
-            response['Content-Length'] = len(content)
+            response['Content-Length'] = len(response.content)
 
         return response
@@ -1,10 +1,15 @@
 import re
+import sys
+import hashlib
+from html.parser import HTMLParser
+
 import six
 import bs4
 
 from django.conf import settings
 
 from .util import force_text
+from fosun_circle.libs.local_cache import TTLCache
 
 _EXCLUDE_TAGS = ("pre", "script", "textarea", )
 EXCLUDE_TAGS = getattr(settings, "EXCLUDE_TAGS_FROM_MINIFYING", _EXCLUDE_TAGS)
@@ -21,6 +26,11 @@ TEXT_FLOW = {
     "ruby", "rt", "rp", "bdi", "bdo", "span", "br", "wbr", "ins", "del",
 }
 
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link",
+    "meta", "param", "source", "track", "wbr",
+}
+
 # fold the doctype element, if True then no newline is added after the
 # doctype element. If False, a newline will be inserted
 FOLD_DOCTYPE = True
@@ -39,6 +49,179 @@ re_cond_comment_end_space = re.compile(r'\s+(<!\[endif\])',
                                        re.MULTILINE | re.DOTALL | re.UNICODE)
 
 
+# minified output keyed by content digest, most admin/template pages render identical markup.
+# the cache is bounded by entry count and by the total size of the cached strings
+MINIFY_CACHE_SIZE = getattr(settings, "HTML_MINIFY_CACHE_SIZE", 256)
+MINIFY_CACHE_MAX_LENGTH = getattr(settings, "HTML_MINIFY_CACHE_MAX_LENGTH", 512 * 1024)
+MINIFY_CACHE_MAX_BYTES = getattr(settings, "HTML_MINIFY_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+_minified_cache = TTLCache(
+    maxsize=MINIFY_CACHE_SIZE, ttl=60 * 60, weigher=sys.getsizeof, max_weight=MINIFY_CACHE_MAX_BYTES
+)
+
+
+def cached_html_minify(html_code, ignore_comments=True, parser="stream"):
+    """minify html code, the result is cached by the digest of the content.
+
+    :param parser: "stream" uses the tokenizer based `stream_minify`, any
+                   other value is a bs4 parser used by `html_minify`
+    """
+    html_code = force_text(html_code)
+
+    if len(html_code) > MINIFY_CACHE_MAX_LENGTH:
+        return _minify(html_code, ignore_comments, parser)
+
+    digest = hashlib.blake2b(html_code.encode("utf-8"), digest_size=16).digest()
+    cache_key = (digest, ignore_comments, parser)
+    minified = _minified_cache.get(cache_key)
+
+    if minified is None:
+        minified = _minify(html_code, ignore_comments, parser)
+        _minified_cache.set(cache_key, minified)
+
+    return minified
+
+
+def _minify(html_code, ignore_comments, parser):
+    if parser == "stream":
+        return stream_minify(html_code, ignore_comments)
+    return html_minify(html_code, ignore_comments, parser)
+
+
+class StreamMinifier(HTMLParser):
+    """Tokenizer based minifier, never builds a DOM.
+
+    Follows the same whitespace rules as `space_minify`, but the markup
+    itself (tags, attributes, entities) is written back unchanged.
+    """
+
+    def __init__(self, ignore_comments=True):
+        super().__init__(convert_charrefs=False)
+        self.ignore_comments = ignore_comments
+        self.output = []
+        self.open_tags = []         # stack of open tag names
+        self.excluded_depth = 0     # > 0 inside pre, script, textarea ...
+        self.pending_text = []      # text waiting for its next sibling
+        self.prev_flow = False
+        self._endtag_pos = None     # offset of the end tag being parsed
+
+    def minify(self, html_code):
+        self.feed(html_code)
+        self.close()
+        self._flush_text(next_flow=False)
+        return "".join(self.output)
+
+    def _in_text_tag(self):
+        return bool(self.open_tags) and self.open_tags[-1] in TEXT_FLOW
+
+    def _flush_text(self, next_flow):
+        if not self.pending_text:
+            return
+
+        text = "".join(self.pending_text)
+        self.pending_text = []
+
+        if self.excluded_depth:
+            self.output.append(text)
+            return
+
+        new_string = re_multi_space.sub(' ', text)
+        if not CONSERVATIVE_WHITESPACE:
+            # text within a text tag element is always in flow
+            prev_flow = self.prev_flow or self._in_text_tag()
+            next_flow = next_flow or self._in_text_tag()
+
+            new_string = re_only_space.sub(' ' if prev_flow and next_flow else '', new_string)
+            new_string = re_start_space.sub(' ' if prev_flow else '', new_string)
+            new_string = re_end_space.sub(' ' if next_flow else '', new_string)
+
+        self.output.append(re_single_nl.sub('', new_string))
+
+    def _emit_tag(self, tag, raw):
+        self._flush_text(next_flow=tag in TEXT_FLOW)
+        self.output.append(raw)
+        self.prev_flow = tag in TEXT_FLOW
+
+    def handle_starttag(self, tag, attrs):
+        self._emit_tag(tag, self.get_starttag_text())
+
+        if tag in VOID_TAGS:
+            return
+
+        self.open_tags.append(tag)
+        if tag in EXCLUDE_TAGS:
+            self.excluded_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self._emit_tag(tag, self.get_starttag_text())
+
+    def parse_endtag(self, i):
+        self._endtag_pos = i
+        return super().parse_endtag(i)
+
+    def get_endtag_text(self, tag):
+        """raw text of the end tag being parsed, `tag` itself is lowercased by
+        HTMLParser (`</MyComp>` -> `mycomp`)."""
+        start = self._endtag_pos
+        end = self.rawdata.find(">", start) if start is not None else -1
+
+        if end != -1:
+            raw = self.rawdata[start:end + 1]
+            if raw[2:2 + len(tag)].lower() == tag:
+                return raw
+
+        return "</%s>" % tag
+
+    def handle_endtag(self, tag):
+        self._emit_tag(tag, self.get_endtag_text(tag))
+
+        if tag in self.open_tags:
+            while self.open_tags:
+                open_tag = self.open_tags.pop()
+                if open_tag in EXCLUDE_TAGS:
+                    self.excluded_depth -= 1
+                if open_tag == tag:
+                    break
+
+    def handle_data(self, data):
+        self.pending_text.append(data)
+
+    def handle_entityref(self, name):
+        self.pending_text.append("&%s;" % name)
+
+    def handle_charref(self, name):
+        self.pending_text.append("&#%s;" % name)
+
+    def handle_comment(self, data):
+        if self.excluded_depth:
+            self.pending_text.append("<!--%s-->" % data)
+            return
+
+        self._flush_text(next_flow=False)
+        self.prev_flow = False
+
+        if re_cond_comment.search(data):
+            new_string = re_multi_space.sub(' ', data)
+            new_string = re_cond_comment_start_space.sub(r'\1', new_string)
+            new_string = re_cond_comment_end_space.sub(r'\1', new_string)
+            self.output.append("<!--%s-->" % new_string)
+        elif not self.ignore_comments:
+            self.output.append("<!--%s-->" % data)
+
+    def handle_decl(self, decl):
+        self._emit_tag("", "<!%s>" % decl)
+
+    def handle_pi(self, data):
+        self._emit_tag("", "<?%s>" % data)
+
+    def unknown_decl(self, data):
+        self._emit_tag("", "<![%s]>" % data)
+
+
+def stream_minify(html_code, ignore_comments=True):
+    """minify html code with `StreamMinifier`, no DOM is built."""
+    return StreamMinifier(ignore_comments=ignore_comments).minify(force_text(html_code))
+
+
 def html_minify(html_code, ignore_comments=True, parser="html5lib"):
     html_code = force_text(html_code)
     soup = bs4.BeautifulSoup(html_code, parser)
@@ -1,10 +1,12 @@
+import threading
 from copy import deepcopy
+from functools import lru_cache
 from datetime import date, datetime
 
 from django.db import models
+from django.db.models.signals import class_prepared
 from django.utils import timezone
 from django.utils.functional import cached_property
-from django.core.management.utils import get_random_string
 
 from django.db.models.base import ModelBase
 from django.db.models.options import Options
@@ -43,13 +45,7 @@ class BaseAbstractModel(models.Model):
         abstract = True
 
     def default(self, o):
-        if isinstance(o, datetime):
-            return o.strftime("%Y-%m-%d %H:%M:%S")
-
-        if isinstance(o, date):
-            return o.strftime("%Y-%m-%d")
-
-        return o
+        return _to_json_value(o)
 
     def save(self, *args, **kwargs):
         if not self.create_time:
@@ -68,9 +64,40 @@ class BaseAbstractModel(models.Model):
         return self
 
     def to_dict(self, *extra, exclude=()):
-        fields = list(set(self.fields() + list(extra)) - set(exclude))
-        # model_dict = model_to_dict(self)
-        return {_field: self.default(self.__dict__[_field]) for _field in fields}
+        field_meta = self.get_field_meta()
+        values = self.__dict__
+
+        if field_meta.custom_default:
+            fields = list(set(field_meta.attnames + extra) - set(exclude))
+            return {_field: self.default(values[_field]) for _field in fields}
+
+        if not exclude:
+            data = {
+                name: values[name] if extractor is None else extractor(values[name])
+                for name, extractor in field_meta.extractors
+            }
+        else:
+            data = {
+                name: values[name] if extractor is None else extractor(values[name])
+                for name, extractor in field_meta.extractors if name not in exclude
+            }
+
+        for name in extra:
+            if name not in data and name not in exclude:
+                data[name] = _to_json_value(values[name])
+
+        return data
+
+    @classmethod
+    def get_field_meta(cls):
+        """ 字段元数据在 class_prepared 时创建(抽象 Model 首次访问时创建) """
+        field_meta = cls.__dict__.get("_field_meta")
+
+        if field_meta is None:
+            field_meta = ModelFieldMeta(cls)
+            setattr(cls, "_field_meta", field_meta)
+
+        return field_meta
 
     @classmethod
     def fields(cls, exclude=()):
@@ -81,22 +108,13 @@ class BaseAbstractModel(models.Model):
             3: opts.concrete_fields
             4: opts.private_fields, opts.many_to_many
          """
-        fields = []
-        exclude_fields = set(exclude)
-        abc_meta_cls = getattr(BaseAbstractModel, "_meta", None)
-        abc_fields = abc_meta_cls.fields if abc_meta_cls else []
-        abc_fields_name_list = [_field.name for _field in abc_fields]
-
-        for field in cls._meta.fields:
-            field_name = field.attname
-
-            if field_name in exclude_fields:
-                continue
+        attnames = cls.get_field_meta().attnames
 
-            if field_name not in abc_fields_name_list:
-                fields.append(field_name)
+        if not exclude:
+            return list(attnames)
 
-        return fields
+        exclude_fields = set(exclude)
+        return [field_name for field_name in attnames if field_name not in exclude_fields]
 
     @classmethod
     def get_fields(cls, exclude=()):
@@ -125,66 +143,110 @@ class BaseAbstractModel(models.Model):
         return ShardingModel(shard_model_cls=cls).create_sharding_model(sharding_table)
 
 
+def _to_json_value(o):
+    if isinstance(o, datetime):
+        return o.strftime("%Y-%m-%d %H:%M:%S")
+
+    if isinstance(o, date):
+        return o.strftime("%Y-%m-%d")
+
+    return o
+
+
+class ModelFieldMeta:
+    """ Model 的字段元数据, 每个 Model 只计算一次
+
+    attnames: 非 BaseAbstractModel 的字段 attname
+    extractors: (attname, extractor), 仅日期/时间字段需要转换取值, 其余为 None 直接取值
+    custom_default: Model 重写了 default(), to_dict 需逐个值调用 default()
+    """
+    __slots__ = ("attnames", "extractors", "custom_default")
+
+    def __init__(self, model_cls):
+        abc_meta_cls = getattr(BaseAbstractModel, "_meta", None)
+        abc_fields = abc_meta_cls.fields if abc_meta_cls else []
+        abc_fields_names = {_field.name for _field in abc_fields}
+
+        fields = [field for field in model_cls._meta.fields if field.attname not in abc_fields_names]
+
+        self.attnames = tuple(field.attname for field in fields)
+        self.extractors = tuple(
+            (field.attname, _to_json_value if isinstance(field, models.DateField) else None)
+            for field in fields
+        )
+        self.custom_default = model_cls.default is not BaseAbstractModel.default
+
+
+def _prepare_field_meta(sender, **kwargs):
+    if issubclass(sender, BaseAbstractModel):
+        sender._field_meta = ModelFieldMeta(sender)
+
+
+class_prepared.connect(_prepare_field_meta, dispatch_uid="base_abstract_model_field_meta")
+
+
 class ShardingModel:
     """ ShardingModel support table horizontal partition """
+    # (原 Model, 分表名) -> 分表 Model, 每个分表在进程内只创建一次
     _shard_db_models = {}
-    _base_shard_model_cls = None
+    _lock = threading.Lock()
 
-    def __new__(cls,  *args, **kwargs):
-        cls._base_shard_model_cls = kwargs.pop("shard_model_cls")
-        return super().__new__(cls, *args, **kwargs)
+    def __init__(self, shard_model_cls):
+        self._base_shard_model_cls = shard_model_cls
 
     def create_sharding_model(self, sharding_table):
-        class Meta:
-            db_table = sharding_table
-            ordering = ["-id"]
+        key = (self._base_shard_model_cls, sharding_table)
+        model_class = self._shard_db_models.get(key)
 
-        class ShardMetaclass(ModelBase):
-            def __new__(cls, name, bases, attrs):
-                shard_model_cls = self._base_shard_model_cls
-                base_model_name = shard_model_cls.__name__
+        if model_class is not None:
+            return model_class
 
-                # 原字段可能存在缓存，导致查询时表名指向错误
-                new_concrete_fields = {}
-                for field in shard_model_cls._meta.concrete_fields:
-                    dp_field = deepcopy(field)
+        with self._lock:
+            model_class = self._shard_db_models.get(key)
 
-                    for name in dir(dp_field.__class__):
-                        val = getattr(dp_field.__class__, name, None)
-                        if isinstance(val, cached_property) and hasattr(dp_field, name):
-                            delattr(dp_field, name)
+            if model_class is None:
+                # 每个id(model_class)不同，互不影响
+                # 若直接修改原Model: self._base_shard_model_cls._meta.db_table = sharding_table
+                # 同时计算多个分表的数据时，最终只有一个有效
+                model_class = self._build_sharding_model(sharding_table)
+                self._shard_db_models[key] = model_class
 
-                    new_concrete_fields[field.name] = dp_field
+        return model_class
 
-                attrs.update({
-                    '__module__': shard_model_cls.__module__,
-                    '__doc__': 'Using %s table from %s Model' % (sharding_table, base_model_name),
-                    'Meta': Meta
-                }, **new_concrete_fields)
+    def _build_sharding_model(self, sharding_table):
+        shard_model_cls = self._base_shard_model_cls
+        base_model_name = shard_model_cls.__name__
 
-                model_name = sharding_table.title().replace("_", "") + "_Sharding_%s" % get_random_string(8)
-                model_cls = super().__new__(cls, "%sModel" % model_name, shard_model_cls.__bases__, attrs)
-                # model_meta = model_cls._meta
-                # model_meta.db_table = sharding_table
+        class Meta:
+            db_table = sharding_table
+            ordering = ["-id"]
 
-                return model_cls
+        def __str__(obj):
+            model_name = obj.__class__.__name__.split("_")[0]
+            return '%s object (%s)' % (model_name, obj.pk)
 
-        class ProxyShardingModel(metaclass=ShardMetaclass):
-            def __str__(self):
-                model_name = self.__class__.__name__.split("_")[0]
-                return '%s object (%s)' % (model_name, self.pk)
+        # 原字段可能存在缓存，导致查询时表名指向错误
+        new_concrete_fields = {}
+        for field in shard_model_cls._meta.concrete_fields:
+            dp_field = deepcopy(field)
 
-        model_class = self._shard_db_models.get(sharding_table)
-        if model_class is not None:
-            return model_class
+            for name in _cached_property_names(dp_field.__class__):
+                if name in dp_field.__dict__:
+                    delattr(dp_field, name)
 
-        # 这种方法与原Model类一样，如果同时计算多个分表的数据，最终只有一个有效
-        # model_class = self._base_shard_model_cls._meta.db_table = sharding_table
+            new_concrete_fields[field.name] = dp_field
 
-        # 每个id(model_class)不同，互不影响
-        model_class = ProxyShardingModel
-        self._shard_db_models[sharding_table] = model_class
-        return model_class
+        attrs = {
+            '__module__': shard_model_cls.__module__,
+            '__doc__': 'Using %s table from %s Model' % (sharding_table, base_model_name),
+            '__str__': __str__,
+            'Meta': Meta,
+        }
+        attrs.update(new_concrete_fields)
+
+        # 分表 Model 只创建一次, 类名固定即可, 不会在 app registry 中重复注册
+        model_name = sharding_table.title().replace("_", "") + "_Sharding_%s" % base_model_name
+        return ModelBase(model_name, shard_model_cls.__bases__, attrs)
 
     @staticmethod
     def get_relation_fields(fields):
@@ -204,3 +266,45 @@ class ShardingModel:
                 pass
         return relation_fields
 
+
+class ShardRouter:
+    """ 分表路由: shard key -> (分表 Model, 数据库 alias), 首次访问后为一次字典查找
+
+        router = ShardRouter(DingMsgPushLogModel, "circle_ding_msg_push_log_{shard}", shard_func=lambda key: key % 16)
+        model_cls, using = router.route(user_id)
+        router.get_queryset(user_id).filter(...)
+
+    shard_func: shard key -> shard, 默认 shard key 即 shard
+    using: 数据库 alias, 可以是 str 或 callable(shard), 默认 None 交由 DATABASE_ROUTERS 决定
+    """
+
+    def __init__(self, shard_model_cls, table_format, shard_func=None, using=None):
+        self.shard_model_cls = shard_model_cls
+        self.table_format = table_format
+        self.shard_func = shard_func
+        self.using = using
+
+        self._routes = {}
+
+    def route(self, shard_key):
+        shard = self.shard_func(shard_key) if self.shard_func else shard_key
+        route = self._routes.get(shard)
+
+        if route is None:
+            model_cls = self.shard_model_cls.get_sharding(self.table_format.format(shard=shard))
+            using = self.using(shard) if callable(self.using) else self.using
+            route = self._routes.setdefault(shard, (model_cls, using))
+
+        return route
+
+    def get_model(self, shard_key):
+        return self.route(shard_key)[0]
+
+    def get_queryset(self, shard_key):
+        model_cls, using = self.route(shard_key)
+        return model_cls.objects.using(using) if using else model_cls.objects.all()
+
+
+@lru_cache(maxsize=None)
+def _cached_property_names(field_cls):
+    return tuple(name for name in dir(field_cls) if isinstance(getattr(field_cls, name, None), cached_property))
@@ -0,0 +1,141 @@
+import io
+
+from django.conf import settings
+from django.db import connections, router, transaction
+
+__all__ = ["bulk_insert"]
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def _to_copy_text(value):
+    """ 字段值转为 COPY text 格式 """
+    if value is None:
+        return "\\N"
+
+    if isinstance(value, bool):
+        return "t" if value else "f"
+
+    text = str(value)
+    return text.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _stage_table_name(model_cls):
+    return "_stage_%s" % model_cls._meta.db_table
+
+
+def _create_stage_table(connection, model_cls, fields):
+    """ 与目标表同结构(只含 fields 列)的临时表, 每个分块 COPY 到这里 """
+    quote_name = connection.ops.quote_name
+    columns = ", ".join(quote_name(field.column) for field in fields)
+
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE TEMP TABLE {stage} AS SELECT {columns} FROM {table} WITH NO DATA".format(
+            stage=quote_name(_stage_table_name(model_cls)), columns=columns,
+            table=quote_name(model_cls._meta.db_table),
+        ))
+
+
+def _drop_stage_table(connection, model_cls):
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TABLE %s" % connection.ops.quote_name(_stage_table_name(model_cls)))
+
+
+def _copy_insert_chunk(connection, model_cls, fields, objs, conflict_field=None):
+    """ COPY 到临时表, 再 INSERT ... SELECT ... ON CONFLICT DO NOTHING 写入目标表, 返回实际插入的对象 """
+    quote_name = connection.ops.quote_name
+    table = quote_name(model_cls._meta.db_table)
+    stage = quote_name(_stage_table_name(model_cls))
+    columns = ", ".join(quote_name(field.column) for field in fields)
+
+    buffer = io.StringIO()
+    obj_mapping = {}
+    conflict_index = fields.index(conflict_field) if conflict_field is not None else None
+
+    for obj in objs:
+        values = [field.get_db_prep_save(field.pre_save(obj, True), connection) for field in fields]
+        buffer.write("\t".join(_to_copy_text(value) for value in values) + "\n")
+
+        if conflict_index is not None:
+            obj_mapping[values[conflict_index]] = obj
+
+    buffer.seek(0)
+    insert_sql = "INSERT INTO {table} ({columns}) SELECT {columns} FROM {stage}".format(
+        table=table, columns=columns, stage=stage
+    )
+
+    if conflict_field is not None:
+        pk_column = quote_name(model_cls._meta.pk.column)
+        insert_sql += " ON CONFLICT ({conflict}) DO NOTHING RETURNING {pk}, {conflict}".format(
+            conflict=quote_name(conflict_field.column), pk=pk_column
+        )
+
+    with connection.cursor() as cursor:
+        cursor.copy_expert("COPY {stage} ({columns}) FROM STDIN".format(stage=stage, columns=columns), buffer)
+        cursor.execute(insert_sql)
+        returning_rows = cursor.fetchall() if conflict_field is not None else None
+        cursor.execute("TRUNCATE {stage}".format(stage=stage))
+
+    if returning_rows is None:
+        return objs
+
+    inserted_objs = []
+    for pk, conflict_value in returning_rows:
+        obj = obj_mapping[conflict_value]
+        obj.pk = pk
+        inserted_objs.append(obj)
+
+    return inserted_objs
+
+
+def bulk_insert(model_cls, objs, conflict_field=None, chunk_size=None, using=None):
+    """ 分块批量插入
+
+    PostgreSQL(psycopg2) 使用 COPY FROM STDIN, 其他数据库使用分块 bulk_create;
+    所有分块在同一个事务中, 任一分块失败则全部回滚(与单条 bulk_create 一致, 调用方重试不会产生重复记录)
+    :param model_cls: Model
+    :param objs: 未保存的 model 对象列表
+    :param conflict_field: 唯一字段名, 与已有记录冲突的对象跳过(ON CONFLICT DO NOTHING)
+    :param chunk_size: 每块条数, 默认 settings.DB_BULK_INSERT_CHUNK_SIZE
+    :param using: 数据库别名, 默认由 router 决定
+    :return: list, 实际插入的对象; COPY 且指定 conflict_field 时会回填主键,
+             bulk_create 且指定 conflict_field 时无法区分被跳过的对象, 返回全部对象
+    """
+    objs = list(objs)
+    chunk_size = chunk_size or getattr(settings, "DB_BULK_INSERT_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)
+    using = using or router.db_for_write(model_cls)
+    connection = connections[using]
+
+    opts = model_cls._meta
+    fields = [field for field in opts.concrete_fields if field is not opts.auto_field]
+    conflict_field = opts.get_field(conflict_field) if conflict_field else None
+    is_copy = connection.vendor == "postgresql" and connection.Database.__name__ == "psycopg2"
+
+    inserted_objs = []
+    if not objs:
+        return inserted_objs
+
+    with transaction.atomic(using=using):
+        # 临时表随事务回滚一并撤销
+        if is_copy:
+            _create_stage_table(connection, model_cls, fields)
+
+        for i in range(0, len(objs), chunk_size):
+            chunk_objs = objs[i: i + chunk_size]
+
+            if is_copy:
+                chunk_objs = _copy_insert_chunk(connection, model_cls, fields, chunk_objs, conflict_field)
+
+                for obj in chunk_objs:
+                    obj._state.adding = False
+                    obj._state.db = using
+            else:
+                manager = model_cls._base_manager.using(using)
+                chunk_objs = manager.bulk_create(chunk_objs, ignore_conflicts=conflict_field is not None)
+
+            inserted_objs.extend(chunk_objs)
+
+        if is_copy:
+            _drop_stage_table(connection, model_cls)
+
+    return inserted_objs
@@ -0,0 +1,147 @@
+"""
+钉钉 AppKeyClient 进程内复用
+
+. access_token: 本地 + Redis 两级缓存, 同一 app_key 的所有进程共享; 在过期前 DING_ACCESS_TOKEN_EARLY_REFRESH 秒刷新,
+  同一进程内的并发刷新只请求一次
+. client: 按 (corp_id, app_key, app_secret) 复用 AppKeyClient
+. HTTP: dingtalk-sdk 所有 client 共用类属性 BaseClient._http(requests.Session), 此处调大连接池, fork 后子进程重建
+"""
+import os
+import threading
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+from django_redis import get_redis_connection
+
+from dingtalk import AppKeyClient
+from dingtalk.client.base import BaseClient
+from dingtalk.storage import BaseStorage
+from dingtalk.storage.kvstorage import KvStorage
+
+from config.conf.dingtalk import DingTalkConfig
+from fosun_circle.libs.log import dj_logger as logger
+from fosun_circle.libs.local_cache import TTLCache, SingleFlight
+
+__all__ = ["DingTokenStorage", "SharedAppKeyClient", "get_app_key_client"]
+
+
+class DingTokenStorage(BaseStorage):
+    """ 本地 + Redis 两级存储: 本地最多缓存 LOCAL_TTL 秒, Redis 不可用时只用本地缓存 """
+    LOCAL_TTL = 60
+
+    def __init__(self, prefix="dingtalk"):
+        self._local = TTLCache(maxsize=256, ttl=self.LOCAL_TTL)
+        self._remote = KvStorage(get_redis_connection(), prefix=prefix)
+
+    def get(self, key, default=None):
+        value = self._local.get(key)
+
+        if value is None:
+            try:
+                value = self._remote.get(key)
+            except Exception as e:
+                logger.warning("DingTokenStorage get %s from redis error: %s", key, e)
+
+            value is not None and self._local.set(key, value)
+
+        return default if value is None else value
+
+    def set(self, key, value, ttl=None):
+        self._local.set(key, value, ttl)
+
+        try:
+            self._remote.set(key, value, ttl)
+        except Exception as e:
+            logger.warning("DingTokenStorage set %s to redis error: %s", key, e)
+
+    def delete(self, key):
+        self._local.delete(key)
+
+        try:
+            self._remote.delete(key)
+        except Exception as e:
+            logger.warning("DingTokenStorage delete %s from redis error: %s", key, e)
+
+
+class SharedAppKeyClient(AppKeyClient):
+    _token_flight = SingleFlight()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # 接口地址可指向本地的模拟服务(测试)
+        if DingTalkConfig.DING_API_BASE_URL:
+            self.API_BASE_URL = DingTalkConfig.DING_API_BASE_URL
+
+    def _handle_pre_top_request(self, params, uri):
+        if DingTalkConfig.DING_API_BASE_URL and not uri.startswith(("http://", "https://")):
+            uri = urljoin(DingTalkConfig.DING_API_BASE_URL, uri)
+
+        return super()._handle_pre_top_request(params, uri)
+
+    @property
+    def access_token(self):
+        token = self.cache.access_token.get()
+
+        if token is None:
+            token = self._token_flight.do(self.get_access_token_key(), self._refresh_access_token)
+
+        return token
+
+    def _refresh_access_token(self):
+        # 等待期间其他线程/进程可能已刷新
+        token = self.cache.access_token.get()
+
+        if token is None:
+            ret = self.get_access_token()
+            token = ret["access_token"]
+            expires_in = ret.get("expires_in", 7200)
+
+            # 提前过期, 在钉钉的 token 失效之前换取新的 token
+            ttl = max(expires_in - DingTalkConfig.DING_ACCESS_TOKEN_EARLY_REFRESH, 60)
+            self.cache.access_token.set(value=token, ttl=ttl)
+            logger.info("SharedAppKeyClient refresh access_token, app_key: %s, ttl: %s", self.app_key, ttl)
+
+        return token
+
+
+_storage = None
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_app_key_client(corp_id, app_key, app_secret):
+    """ 进程内复用的 AppKeyClient, access_token 由所有进程共享 """
+    global _storage
+
+    key = (corp_id, app_key, app_secret)
+    client = _clients.get(key)
+
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+
+            if client is None:
+                _storage = _storage or DingTokenStorage()
+                client = _clients[key] = SharedAppKeyClient(
+                    corp_id=corp_id, app_key=app_key, app_secret=app_secret, storage=_storage
+                )
+
+    return client
+
+
+def _reset_http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=DingTalkConfig.DING_HTTP_POOL_SIZE)
+
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    BaseClient._http = session
+
+
+_reset_http_session()
+
+# 子进程不能与父进程共用 HTTP 连接
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_http_session)
@@ -6,7 +6,7 @@ import traceback
 from datetime import date
 from inspect import Parameter
 
-from dingtalk import AppKeyClient, DingTalkException
+from dingtalk import DingTalkException
 from dingtalk.model.message import BodyBase
 from dingtalk.client.api.message import Message
 from dingtalk.core.exceptions import DingTalkClientException
@@ -16,6 +16,7 @@ from django.core.files.uploadedfile import UploadedFile
 
 
 from .parser import MessageBodyParser
+from .client import get_app_key_client
 from fosun_circle.libs.decorators import to_retry
 from config.conf.dingtalk import DingTalkConfig
 from fosun_circle.libs.log import dj_logger as logger
@@ -32,7 +33,8 @@ class BaseDingMixin:
         self._app_key = app_key or self.default_config["app_key"]
         self._app_secret = app_secret or self.default_config["app_secret"]
 
-        self._client = AppKeyClient(
+        # 复用进程内的 client, access_token 在 Redis 中共享
+        self._client = get_app_key_client(
             corp_id=self._corp_id,
             app_key=self._app_key,
             app_secret=self._app_secret
@@ -49,8 +51,8 @@ class BaseDingMixin:
 
     @to_retry
     def get_access_token(self):
-        """ 获取应用 access token """
-        return self._client.get_access_token()
+        """ 获取应用 access token(缓存) """
+        return self._client.access_token
 
 
 class DingTalkMessageOpenApi(BaseDingMixin, MessageBodyParser):
@@ -164,7 +166,11 @@ class DingTalkMessageOpenApi(BaseDingMixin, MessageBodyParser):
 
     @to_retry
     def async_send(self, body_kwargs, userid_list=(), dept_id_list=(), to_all_user=False):
-        """ 企业会话消息异步发送
+        """ 企业会话消息异步发送(失败立即重试, 共 3 次) """
+        return self.async_send_once(body_kwargs, userid_list, dept_id_list, to_all_user)
+
+    def async_send_once(self, body_kwargs, userid_list=(), dept_id_list=(), to_all_user=False):
+        """ 企业会话消息异步发送(不重试, 由调用方决定重试策略)
         :param body_kwargs: dict, 不同消息体对应的参数
         :param userid_list: list|tuple, 接收者的用户userid列表
         :param dept_id_list: list|tuple, 接收者的部门id列表
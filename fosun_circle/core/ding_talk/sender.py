@@ -0,0 +1,131 @@
+import time
+import random
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from dingtalk import DingTalkException
+from django_redis import get_redis_connection
+
+from .open_api import DingTalkMessageOpenApi
+from config.conf.dingtalk import DingTalkConfig
+from fosun_circle.libs.log import dj_logger as logger
+from fosun_circle.contrib.drf.throttling import SlidingWindowLimiter
+
+__all__ = ["DingMessageSender"]
+
+
+class DingMessageSender:
+    """ 并发推送钉钉工作通知
+
+    . 并发: 最多 max_workers 个请求同时进行, 总耗时约为 max(接口耗时) 而不是 sum(接口耗时)
+    . 限流: 每个微应用(app_key)在 redis 中一个 1/qps 秒的滑动窗口, 所有进程的请求按 1/qps 秒的间隔均匀放行, 不允许突发
+    . 重试: 限流/系统繁忙的错误码、连接错误、超时和 HTTP 5xx 按指数退避(full jitter)重试, 其他错误不重试
+
+    jobs: list of dict, eg: dict(
+        msg_type="oa", userid_list=["0123", ...], body_kwargs={...},
+        api_init_kwargs=dict(corp_id=..., app_key=..., app_secret=..., agent_id=...),
+    )
+    """
+    # -1: 系统繁忙; 90002/90018: 调用频率超过限制
+    RETRY_ERRCODES = (-1, 90002, 90018)
+
+    # 连接失败、超时(与原 async_send 的 @to_retry 一致; 读超时时钉钉可能已收到, 重试可能重复推送)
+    RETRY_EXCEPTIONS = (requests.ConnectionError, requests.Timeout)
+
+    LIMITER_KEY = "ding_talk:send_qps:%s"
+
+    _limiter = None
+    _limiter_lock = threading.Lock()
+
+    def __init__(self, max_workers=None, qps=None, max_retries=None, backoff=0.5, max_backoff=8.0):
+        self.max_workers = max_workers or DingTalkConfig.DING_SEND_CONCURRENCY
+        self.qps = qps or DingTalkConfig.DING_SEND_QPS
+        self.max_retries = DingTalkConfig.DING_SEND_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    @classmethod
+    def get_limiter(cls):
+        if cls._limiter is None:
+            with cls._limiter_lock:
+                if cls._limiter is None:
+                    cls._limiter = SlidingWindowLimiter(get_redis_connection())
+
+        return cls._limiter
+
+    def acquire(self, app_key):
+        """ 阻塞直到取得 app_key 的请求配额(所有进程共享, 以各机器本地时钟计时), 返回等待的秒数 """
+        waited = 0.0
+        interval = 1.0 / self.qps
+        key = self.LIMITER_KEY % app_key
+
+        while True:
+            now = time.time()
+            allowed, hits, oldest = self.get_limiter().hit(key, 1, interval, now)
+
+            if allowed:
+                return waited
+
+            # 等到上一个请求离开窗口, 加少量抖动避免各线程同时醒来
+            wait_seconds = max(oldest + interval - now, 0.001) + random.uniform(0, interval / 10)
+            time.sleep(wait_seconds)
+            waited += wait_seconds
+
+    def is_retryable(self, e):
+        if isinstance(e, self.RETRY_EXCEPTIONS):
+            return True
+
+        if isinstance(e, DingTalkException):
+            if e.errcode is not None:
+                return e.errcode in self.RETRY_ERRCODES
+
+            # errcode 为 None: SDK 的 raise_for_status 失败, 仅重试 5xx
+            response = getattr(e, "response", None)
+            return response is None or response.status_code >= 500
+
+        return False
+
+    def _send_one(self, job):
+        api_init_kwargs = job["api_init_kwargs"]
+        ding_service = DingTalkMessageOpenApi(msg_type=job["msg_type"], **api_init_kwargs)
+
+        for attempt in range(self.max_retries + 1):
+            self.acquire(api_init_kwargs["app_key"])
+
+            try:
+                body_kwargs = dict(job["body_kwargs"])
+                task_id = ding_service.async_send_once(body_kwargs=body_kwargs, userid_list=job["userid_list"])
+                return dict(errcode=0, errmsg="ok", task_id=str(task_id), request_id="")
+            except Exception as e:
+                if not self.is_retryable(e) or attempt >= self.max_retries:
+                    raise
+
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                logger.warning("DingMessageSender retry: %s, err: %r, sleep: %.3fs", attempt + 1, e, delay)
+                time.sleep(delay)
+
+    def _send(self, job):
+        ret = dict(errcode=500, errmsg="failed", task_id="", request_id="")
+        start_time = time.time()
+
+        try:
+            ret.update(self._send_one(job))
+        except Exception as e:
+            logger.error("DingMessageSender send err: %s", e)
+            exc_msg = traceback.format_exc()
+            logger.error(exc_msg)
+            ret.update(errmsg=exc_msg[-1000:])
+
+        logger.info("DingMessageSender => push count: %s, result: %s, DingTalk Api Cost time: %s",
+                    len(job["userid_list"]), ret, time.time() - start_time)
+        return ret
+
+    def send(self, jobs):
+        """ 并发推送, 返回与 jobs 一一对应的结果: dict(errcode, errmsg, task_id, request_id) """
+        if not jobs:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as executor:
+            return list(executor.map(self._send, jobs))
@@ -190,5 +190,13 @@ class CeleryConfig(BaseConfig, QueueRouteConfig):
             'kwargs': dict(),
         },
 
+        # 埋点 DAU/MAU 增量汇总
+        "rollup_event_tracking": {
+            'task': '%s.apps.circle.tasks.task_event_tracking_rollup.rollup_event_tracking' % __name__.split(".", 1)[0],
+            'schedule': crontab(minute='*/10'),
+            'args': (),
+            'kwargs': dict(),
+        },
+
     }
 
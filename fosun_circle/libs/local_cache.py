@@ -0,0 +1,123 @@
+import time
+import threading
+from collections import OrderedDict
+
+__all__ = ["TTLCache", "SingleFlight"]
+
+
+class TTLCache:
+    """ 进程内有界 LRU 缓存, 每个条目带有独立的过期时间(线程安全)
+
+    超过 maxsize 时淘汰最久未使用的条目; 过期条目在读取时惰性删除。
+    指定 weigher(value -> 权重, 如 sys.getsizeof) 与 max_weight 时, 同时按条目权重之和淘汰。
+    """
+    _missing = object()
+
+    def __init__(self, maxsize=1024, ttl=60, timer=time.monotonic, weigher=None, max_weight=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.weigher = weigher
+        self.max_weight = max_weight
+
+        self._data = OrderedDict()
+        self._weight = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, self._missing) is not self._missing
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+
+            if item is None:
+                return default
+
+            value, expires_at, _ = item
+            if expires_at <= self.timer():
+                self._pop(key)
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """ ttl: 秒, 默认且最大为 self.ttl; ttl <= 0 时不缓存 """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+
+        weight = self.weigher(value) if self.weigher else 0
+        if self.max_weight is not None and weight > self.max_weight:
+            return
+
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (value, self.timer() + ttl, weight)
+            self._weight += weight
+
+            while len(self._data) > self.maxsize or (self.max_weight is not None and self._weight > self.max_weight):
+                _, (_, _, evicted_weight) = self._data.popitem(last=False)
+                self._weight -= evicted_weight
+
+    def _pop(self, key):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._weight -= item[2]
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._weight = 0
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """ 同一 key 的并发调用只执行一次 fn, 其余调用阻塞等待并共享其结果(或异常) """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+
+            if is_leader:
+                call = self._calls[key] = _Call()
+
+        if not is_leader:
+            call.event.wait()
+
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+        return call.result
@@ -75,8 +75,8 @@ def hset(
     Returns 1 if HSETNX created a field, otherwise 0 if redis < (3, 5, 0).
     Returns the number of fields that were added.
     """
-    ret = None
     conn = get_redis_connection(alias=alias)
+    pipe = conn.pipeline(transaction=False)
     mapping = mapping or {}
 
     if key and value:
@@ -92,9 +92,8 @@ def hset(
         if mapping or items:
             warnings.warn("redis-py(version: %s) unexpected keyword argument 'mapping' and 'items'" % __version__)
 
-        ret = conn.hmset(name, mapping=mapping)
-
-    if VERSION >= (3, 5, 0):
+        pipe.hmset(name, mapping=mapping)
+    elif VERSION >= (3, 5, 0):
         if VERSION <= (4, 1, 4):
             # Only keywords: key, value, mapping
             if items:
@@ -104,13 +103,15 @@ def hset(
             # Have keywords: key, value, mapping, items
             pass
 
-        ret = conn.hset(name, mapping=mapping)
-
-    if ret is None:
+        pipe.hset(name, mapping=mapping)
+    else:
         raise ExecAbortError("redis-py(%s) is unexpected version" % __version__)
 
     if isinstance(expires, datetime.timedelta):
         expires = int(expires.total_seconds())
 
-    conn.expire(name, expires)
-    return ret
+    if expires is not None:
+        pipe.expire(name, expires)
+
+    # hset 与 expire 同一次往返
+    return pipe.execute()[0]
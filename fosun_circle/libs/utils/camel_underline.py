@@ -1,57 +1,115 @@
-""" 本模块解决变量名驼峰与下划线的转换 """
+""" 本模块解决变量名驼峰与下划线的转换
+
+请求与响应的每个字典 key 都会经过这里, 而 key 的取值范围很小, 因此:
+    1. 正则预编译, key 的转换结果使用有界缓存;
+    2. 嵌套结构使用非递归遍历, key 与子结构都未变化的 dict/list 原样返回, 不做拷贝。
+"""
 
 import re
+from functools import lru_cache
+
+CAMEL_REGEX = re.compile(r'([a-z]|\d)([A-Z])')
+UNDERLINE_REGEX = re.compile(r'(_\w)')
+KEY_CACHE_SIZE = 4096
 
 
+@lru_cache(maxsize=KEY_CACHE_SIZE)
 def camel2underline(camel_var_name):
     """ 驼峰转下划线 """
-    
-    pattern = re.compile(r'([a-z]|\d)([A-Z])')
-    underline_var_name = re.sub(pattern, r'\1_\2', camel_var_name).lower()
+
+    underline_var_name = CAMEL_REGEX.sub(r'\1_\2', camel_var_name).lower()
     return underline_var_name
 
 
+@lru_cache(maxsize=KEY_CACHE_SIZE)
 def underline2camel(underline_var_name):
     """ 下划线转驼峰 """
 
-    camel_var_name = re.sub(r'(_\w)', lambda x: x.group(1)[1].upper(), underline_var_name)
+    camel_var_name = UNDERLINE_REGEX.sub(lambda x: x.group(1)[1].upper(), underline_var_name)
     return camel_var_name
 
 
-def underline_dict(camel_params):
-    """ 可嵌套将驼峰字典或驼峰列表转为下划线 """
+class _Frame:
+    __slots__ = ("src", "keys", "values", "out", "index")
 
-    underline_params = camel_params
+    def __init__(self, src):
+        self.src = src
+        self.keys = list(src.keys()) if isinstance(src, dict) else None
+        self.values = [src[k] for k in self.keys] if self.keys is not None else list(src)
+        self.out = []
+        self.index = 0
 
-    if isinstance(camel_params, dict):
-        underline_params = {}
-        for k, v in camel_params.items():
-            underline_params[camel2underline(k)] = underline_dict(camel_params[k])
+    def build(self, convert_key):
+        src, values, out = self.src, self.values, self.out
 
-    elif isinstance(camel_params, list):
-        underline_params = []
-        for param in camel_params:
-            underline_params.append(underline_dict(param))
+        if self.keys is None:
+            if type(src) is not list:
+                return out
 
-    return underline_params
+            for o, v in zip(out, values):
+                if o is not v:
+                    return out
+            return src
 
+        converted = {}
+        is_changed = type(src) is not dict
 
-def camel_dict(underline_params):
-    """ 可嵌套将下划线字典或下划线列表转为驼峰  """
-    
-    camel_params = underline_params
+        for k, o, v in zip(self.keys, out, values):
+            new_key = convert_key(k) if k.__class__ is str else k
+            converted[new_key] = o
+
+            if new_key != k or o is not v:
+                is_changed = True
+
+        return converted if is_changed else src
+
+
+def _convert_keys(params, convert_key):
+    """ 非递归遍历嵌套的 dict/list, 转换所有 dict 的 key """
+    if not isinstance(params, (dict, list)):
+        return params
+
+    result = None
+    stack = [_Frame(params)]
+
+    while stack:
+        frame = stack[-1]
+        values, out = frame.values, frame.out
+        index, size = frame.index, len(values)
+
+        while index < size:
+            value = values[index]
+            index += 1
 
-    if isinstance(underline_params, dict):
-        camel_params = {}
-        for k, v in underline_params.items():
-            camel_params[underline2camel(k)] = camel_dict(underline_params[k])
+            if isinstance(value, (dict, list)):
+                stack.append(_Frame(value))
+                break
 
-    elif isinstance(underline_params, list):
-        camel_params = []
-        for param in underline_params:
-            camel_params.append(camel_dict(param))
+            out.append(value)
+        else:
+            stack.pop()
+            converted = frame.build(convert_key)
 
-    return camel_params
+            if stack:
+                stack[-1].out.append(converted)
+            else:
+                result = converted
+
+        frame.index = index
+
+    return result
+
+
+def underline_dict(camel_params):
+    """ 可嵌套将驼峰字典或驼峰列表转为下划线 """
+
+    return _convert_keys(camel_params, camel2underline)
+
+
+def camel_dict(underline_params):
+    """ 可嵌套将下划线字典或下划线列表转为驼峰  """
+
+    return _convert_keys(underline_params, underline2camel)
 
 
 if __name__ == "__main__":
@@ -67,5 +125,3 @@ if __name__ == "__main__":
     ))
 
     print(camel_dict({'we_chat': 'WoDeAbcdFg', 'ali_yun': {'yun_console': 'SMS'}}))
-
-
@@ -1,6 +1,9 @@
 import os
 import uuid
 import json
+import time
+import hashlib
+import threading
 import traceback
 import asyncio
 from urllib.parse import quote_plus
@@ -8,10 +11,10 @@ from datetime import datetime, timedelta
 from collections import namedtuple
 
 import jwt
-from rest_framework_jwt.utils import jwt_get_secret_key
 from django.conf import settings
 from django.urls import reverse, NoReverseMatch, is_valid_path
 from django.contrib.auth.models import AnonymousUser
+from django.db.models.base import ModelState
 from django.http import HttpResponseRedirect, JsonResponse
 from django.contrib.auth import get_user_model
 from django.utils.deprecation import MiddlewareMixin
@@ -23,8 +26,10 @@ from . import get_request_view_class
 from ..libs import redis_helpers
 from ..libs.log import dj_logger as logger
 from ..libs.exception import AuthenticationFailed
+from ..libs.local_cache import TTLCache, SingleFlight
+from ..constants.constant import USER_CACHE_PREFIX, USER_CACHE_INVALIDATE_CHANNEL
 from fosun_circle.core.globals import LocalContext
-from permissions.models import ApiInvokerClientModel, ApiInvokerUriModel
+from permissions.models import ApiInvokerSnapshot
 
 User = get_user_model()
 ALGORITHM = "HS256"
@@ -68,10 +73,6 @@ def decode_handler(token, secret_key=None):
         'verify_exp': VERIFY_EXPIRATION,
     }
 
-    # get user from token, BEFORE verification, to get user secret key
-    unverified_payload = jwt.decode(token, secret_key, [ALGORITHM])
-    _secret_key = jwt_get_secret_key(unverified_payload)
-
     return jwt.decode(
         token,
         secret_key,
@@ -91,9 +92,29 @@ def response_payload_handler(token, user=None, request=None):
 
 
 class BaseAuthMiddleware:
-    CACHE_PREFIX = "user_"
+    CACHE_PREFIX = USER_CACHE_PREFIX
+
+    # 已验签的 payload 进程内缓存: 同一 token 每个 worker 只验签一次, 条目不会晚于 token 的 exp 过期
+    payload_cache = TTLCache(maxsize=4096, ttl=10 * 60)
+
+    # 用户两级缓存: 进程内 LRU(短 TTL) -> Redis hash -> DB
+    # CircleUsersModel 变更时由 users.signals 发布失效通知, 各进程订阅后删除本地条目
+    user_cache = TTLCache(maxsize=2048, ttl=30)
+    user_flight = SingleFlight()
+    _listener_pid = None
+    _listener_lock = threading.Lock()
 
     def get_payload(self, token):
+        cache_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        payload = self.payload_cache.get(cache_key)
+
+        if payload is None:
+            payload = self._decode_payload(token)
+            self.payload_cache.set(cache_key, payload, ttl=(payload.get("exp") or 0) - time.time())
+
+        return payload
+
+    def _decode_payload(self, token):
         # 通过X-Auth校验后，基本都是有用户的
         try:
             payload = decode_handler(token, secret_key=None)
@@ -214,12 +235,11 @@ class AuthTokenMiddleware(MiddlewareMixin, BaseAuthMiddleware):
             return False, None
 
         try:
-            # 建议缓存
-            if not ApiInvokerUriModel.has_api_path(path):
+            # 授权快照(进程内缓存), 不查库
+            if not ApiInvokerSnapshot.has_api_path(path):
                 return False, None
 
-            invoker_obj = ApiInvokerClientModel.get_invoker_object(access_token=access_token)  # 校验token是否合法
-            ApiInvokerUriModel.check_invoker_urls(path, invoker_id=invoker_obj.id)  # 校验api权限
+            invoker_obj = ApiInvokerSnapshot.authorize(access_token, path)  # 校验token是否合法及api权限
 
             if not hasattr(request, 'api_invoker'):
                 request.api_invoker = ApiInvokerClient(
@@ -233,26 +253,78 @@ class AuthTokenMiddleware(MiddlewareMixin, BaseAuthMiddleware):
 
         return True, None
 
-    def _get_request_user(self, request, payload, redis_key=None):
+    @classmethod
+    def _listen_user_invalidation(cls):
+        """ 每个进程(含 fork 出的 worker)启动一个订阅线程 """
+        pid = os.getpid()
+        if cls._listener_pid == pid:
+            return
+
+        with cls._listener_lock:
+            if cls._listener_pid == pid:
+                return
+
+            cls._listener_pid = pid
+            cls.user_cache.clear()
+            threading.Thread(target=cls._user_invalidation_loop, name="user-cache-invalidation", daemon=True).start()
+
+    @classmethod
+    def _user_invalidation_loop(cls):
+        decode = (lambda s: s.decode() if isinstance(s, bytes) else s)
+
+        while True:
+            try:
+                pubsub = get_redis_connection().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(USER_CACHE_INVALIDATE_CHANNEL)
+
+                # 断线期间可能丢失通知, 重新订阅后清空本地缓存
+                cls.user_cache.clear()
+
+                for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        cls.user_cache.delete(decode(message["data"]))
+            except Exception as e:
+                logger.error("AuthTokenMiddleware => user invalidation listener err: %s", e)
+                time.sleep(1)
+
+    def _load_user(self, payload, redis_key):
         redis_conn = get_redis_connection()
         cached_user = redis_conn.hgetall(redis_key) or {}  # bool 被转成了 'True' or 'False' ???
         decode = (lambda s: s.decode() if isinstance(s, bytes) else s)
 
         if cached_user:
-            user = User(**{decode(k): decode(v) for k, v in cached_user.items()})
-        else:
-            user = self.authenticate_credentials(payload)
+            return User(**{decode(k): decode(v) for k, v in cached_user.items()})
 
-            try:
-                redis_helpers.hset(redis_key, mapping=user.to_dict(), expires=24 * 60 * 60)
-            except Exception as e:
-                # redis-py version > 2.10.6 raise error:
-                # redis.exceptions.DataError: Invalid input of type: 'bool'. Convert to a byte, string or number first.
-                logger.error('auth_token => process_request err: %s', e)
-                logger.error(traceback.format_exc())
+        user = self.authenticate_credentials(payload)
+
+        try:
+            redis_helpers.hset(redis_key, mapping=user.to_dict(), expires=24 * 60 * 60)
+        except Exception as e:
+            # redis-py version > 2.10.6 raise error:
+            # redis.exceptions.DataError: Invalid input of type: 'bool'. Convert to a byte, string or number first.
+            logger.error('auth_token => process_request err: %s', e)
+            logger.error(traceback.format_exc())
+
+        return user
+
+    def _get_request_user(self, request, payload, redis_key=None):
+        self._listen_user_invalidation()
+        cached_user = self.user_cache.get(redis_key)
+
+        if cached_user is None:
+            # 同一冷 key 的并发请求只有一个去查 Redis/DB
+            cached_user = self.user_flight.do(redis_key, self._load_user, payload, redis_key)
+            # user 对象中可能没有 mobile
+            cached_user.mobile = cached_user.phone_number
+            self.user_cache.set(redis_key, cached_user)
+
+        # 缓存中的 user 跨请求共享, 每个请求使用浅拷贝
+        user = User.__new__(User)
+        user.__dict__.update(cached_user.__dict__)
+        user._state = ModelState()
+        user._state.db = cached_user._state.db
+        user._state.adding = cached_user._state.adding
 
-        # user 对象中可能没有 mobile
-        user.mobile = user.phone_number
         request.user = user  # 保证所有的模板中包含request.user信息
         logger.info("用户登录信息 user: %s, mobile: %s", request.user, request.user.mobile)
 
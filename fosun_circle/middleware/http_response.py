@@ -15,19 +15,20 @@ from django.http import JsonResponse, StreamingHttpResponse, HttpResponseRedirec
 from django.core.exceptions import ValidationError
 from django.template.response import TemplateResponse
 
-from rest_framework import status
 from rest_framework import exceptions
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.settings import api_settings
 
 from . import get_request_view_class
-from fosun_circle.libs.utils.camel_underline import camel_dict, underline_dict
-from fosun_circle.constants.enums.code_message import CodeMessageEnum
+from fosun_circle.libs.utils.camel_underline import underline_dict
+from fosun_circle.contrib.drf.renderers import standard_response_data
 from fosun_circle.constants.constant import REQUEST_PARAMS_NEGOTIATOR_CAMEL
 from fosun_circle.constants.constant import RESPONSE_CONTENT_NEGOTIATOR_CAMEL
 from fosun_circle.libs.log import dj_logger as logger
 
+DOCTYPE_REGEX = re.compile(rb"<!DOCTYPE")
+
 
 class ResponseMiddlewareBase:
     def select_parser(self, request, parsers=None):
@@ -68,22 +69,14 @@ class ResponseMiddlewareBase:
         query_dict._mutable = False
         return query_dict
 
-    def convert_standard_data(self, data, request=None):
-        """ 将最终的响应数据转为下划线命名 """
-        if data.get("code") != 200:
-            data.update(data=None)
-
-        if isinstance(data.get("data"), dict) and 'code' in data['data'] and data['data']['code'] != 200:
-            data.update(data=None, code=data['data']["code"], message=data['data'].get("message"))
-
+    def convert_standard_data(self, raw_result, status_code, request=None):
+        """ 将最终的响应数据转为标准结构 """
         if request is None:
-            return camel_dict(data)
+            return standard_response_data(raw_result, status_code, camel=True)
 
         view_class = get_request_view_class(request=request)
-        if getattr(view_class, RESPONSE_CONTENT_NEGOTIATOR_CAMEL, False):
-            return camel_dict(underline_params=data)
-
-        return data
+        camel = getattr(view_class, RESPONSE_CONTENT_NEGOTIATOR_CAMEL, False)
+        return standard_response_data(raw_result, status_code, camel=camel)
 
 
 class HttpResponseMiddleware(MiddlewareMixin, ResponseMiddlewareBase):
@@ -125,15 +118,20 @@ class HttpResponseMiddleware(MiddlewareMixin, ResponseMiddlewareBase):
         logger.info(msg, cls_name, request, params, form_data)
         logger.info("Middleware<%s>.process_request => request.headers[Content-Type]: %s", cls_name, content_type)
 
-        view_class = get_request_view_class(request=request)
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        msg = "Middleware<%s>.process_view => Request:%s, callback:%s, callback_args:%s, callback_kwargs:%s"
+        logger.info(msg, self.__class__.__name__, request, callback, callback_args, callback_kwargs)
+
+        # 视图已解析, 直接使用 callback, 不再重复 resolve
+        view_class = getattr(callback, "view_class", callback)
         params_negotiator_camel = getattr(view_class, REQUEST_PARAMS_NEGOTIATOR_CAMEL, False)
 
         if params_negotiator_camel:
-            request.GET = self.get_query_dict(params)
-            request.POST = self.get_query_dict(form_data)
+            request.GET = self.get_query_dict(request.GET)
+            request.POST = self.get_query_dict(request.POST)
 
         # Content_Type: application/json 是否转驼峰
-        if "application/json" in content_type and request.body:
+        if "application/json" in request.headers.get("Content-Type", "") and request.body:
             body_data = json.loads(request.body)
 
             if params_negotiator_camel:
@@ -141,10 +139,6 @@ class HttpResponseMiddleware(MiddlewareMixin, ResponseMiddlewareBase):
 
             logger.info("=> Request json body: {}".format(body_data))
 
-    def process_view(self, request, callback, callback_args, callback_kwargs):
-        msg = "Middleware<%s>.process_view => Request:%s, callback:%s, callback_args:%s, callback_kwargs:%s"
-        logger.info(msg, self.__class__.__name__, request, callback, callback_args, callback_kwargs)
-
     def process_response(self, request, response):
         msg = "Middleware<%s>.process_response => Request: %s, Response:%s\n"
         logger.info(msg, self.__class__.__name__, request, response)
@@ -154,9 +148,13 @@ class HttpResponseMiddleware(MiddlewareMixin, ResponseMiddlewareBase):
             logger.info("__debug__ | Werobot response => %s", response)
             return response
 
+        # DRF 响应已由 StandardJSONRenderer 在渲染时包装为标准结构, 无需解析后再次渲染
+        if getattr(response, "_is_enveloped", False):
+            response["Access-Control-Allow-Origin"] = "*"
+            return response
+
         is_raw_response = getattr(response, "_raw_response", False)
         not hasattr(response, "data") and setattr(response, "data", None)
-        data = dict(code=CodeMessageEnum.OK_200.code, message=CodeMessageEnum.OK_200.message, data=None)
 
         # 必须直接返回的response:
         if is_raw_response or \
@@ -174,7 +172,7 @@ class HttpResponseMiddleware(MiddlewareMixin, ResponseMiddlewareBase):
             content = response.content
 
             # 网页、模板、重定向 直接返回
-            if re.compile(rb"<!DOCTYPE").search(content):
+            if DOCTYPE_REGEX.search(content):
                 return response
 
             raw_result = response.data or json.loads(content)
@@ -182,16 +180,8 @@ class HttpResponseMiddleware(MiddlewareMixin, ResponseMiddlewareBase):
             raw_result = {}
 
         # 以下全部为api
-        if status.is_success(response.status_code):
-            data.update(data=raw_result)
-        else:
-            data.update(
-                code=raw_result.pop("code", None) or response.status_code,
-                message=str(raw_result.pop("message", ""))
-            )
-
         cookies = response.cookies
-        standard_data = self.convert_standard_data(data, request=request)
+        standard_data = self.convert_standard_data(raw_result, response.status_code, request=request)
 
         if not isinstance(response, Response):
             # 不是 rest_framework 标准响应, 是：Django.http.response.JsonResponse
@@ -199,6 +189,7 @@ class HttpResponseMiddleware(MiddlewareMixin, ResponseMiddlewareBase):
         else:
             response.data = standard_data
             response._is_rendered = False
+            response._raw_response = True   # 已包装, StandardJSONRenderer 不再重复包装
 
         if hasattr(response, "render"):
             response.render()
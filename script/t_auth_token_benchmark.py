@@ -0,0 +1,38 @@
+""" AuthTokenMiddleware 单次请求的 token 解析开销: 每次验签 vs 进程内 payload 缓存 """
+import sys
+import timeit
+import os.path
+from datetime import datetime, timedelta
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import Config
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", Config.DJANGO_SETTINGS_MODULE)
+django.setup()
+
+from fosun_circle.middleware.auth_token import AuthTokenMiddleware, encode_handler
+
+NUMBER = 20000
+
+
+def run():
+    token = encode_handler({
+        "user_id": 1, "username": "13800000000", "mobile": "13800000000",
+        "exp": datetime.utcnow() + timedelta(hours=1),
+    })
+    middleware = AuthTokenMiddleware(get_response=lambda request: None)
+
+    uncached = timeit.timeit(lambda: middleware._decode_payload(token), number=NUMBER)
+
+    middleware.payload_cache.clear()
+    cached = timeit.timeit(lambda: middleware.get_payload(token), number=NUMBER)
+
+    print("verify every request: %.2f us/req" % (uncached / NUMBER * 1e6))
+    print("payload cache:        %.2f us/req" % (cached / NUMBER * 1e6))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,108 @@
+""" 钉钉消息推送记录批量插入: bulk_create vs 分块 bulk_create vs COPY(fosun_circle.core.db.bulk.bulk_insert)
+
+在 default 库的当前会话中创建同名临时表 circle_ding_msg_push_log(遮蔽正式表, 会话结束自动删除),
+分别插入 ROWS_LIST 中各数量的记录比较耗时, 并校验 msg_uid 冲突的记录被跳过。
+
+单条 INSERT 包含全部记录的 bulk_create 只跑 10 万以内, 百万级只比较分块 bulk_create 和 COPY。
+
+本机 PostgreSQL 16.2(unix socket) + psycopg2-binary 2.9.13 + Django 5.2 的一次运行输出(原样粘贴; Django 5.2 建表的
+自增主键是 identity 列, 运行前已改为与 Django 3.1 一致的 serial):
+    bulk_create            rows: 10000    inserted: 10000    cost:    1.826s        5477 rows/s
+    bulk_create(chunked)   rows: 10000    inserted: 10000    cost:    1.708s        5855 rows/s
+    bulk_insert(COPY)      rows: 10000    inserted: 10000    cost:    0.930s       10754 rows/s
+
+    bulk_create            rows: 100000   inserted: 100000   cost:   15.067s        6637 rows/s
+    bulk_create(chunked)   rows: 100000   inserted: 100000   cost:   12.316s        8119 rows/s
+    bulk_insert(COPY)      rows: 100000   inserted: 100000   cost:    7.533s       13275 rows/s
+
+    bulk_create(chunked)   rows: 1000000  inserted: 1000000  cost:  138.887s        7200 rows/s
+    bulk_insert(COPY)      rows: 1000000  inserted: 1000000  cost:   91.505s       10928 rows/s
+"""
+import sys
+import time
+import os.path
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import Config
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", Config.DJANGO_SETTINGS_MODULE)
+django.setup()
+
+from django.db import connections, router
+from ding_talk.models import DingMsgPushLogModel
+from fosun_circle.core.db.bulk import bulk_insert
+
+ROWS_LIST = [10000, 100000, 1000000]
+CHUNK_SIZE = 5000
+TABLE = DingMsgPushLogModel._meta.db_table
+USING = router.db_for_write(DingMsgPushLogModel)
+
+
+def create_table():
+    with connections[USING].cursor() as cursor:
+        cursor.execute("CREATE TEMP TABLE {0} (LIKE {0} INCLUDING ALL)".format(TABLE))
+        # 主键使用临时序列, 不消耗正式表的序列
+        cursor.execute("CREATE TEMP SEQUENCE bench_push_log_id_seq")
+        cursor.execute("ALTER TABLE pg_temp.{0} ALTER COLUMN id SET DEFAULT nextval('bench_push_log_id_seq')".format(TABLE))
+
+
+def truncate_table():
+    with connections[USING].cursor() as cursor:
+        cursor.execute("TRUNCATE pg_temp.%s" % TABLE)
+
+
+def make_objects(rows, prefix):
+    return [
+        DingMsgPushLogModel(
+            ding_msg_id=i % 100, receiver_mobile="1%010d" % i, receiver_job_code="job%s" % i,
+            msg_uid="%s-%s" % (prefix, i), traceback="line1\nline2\ttab\\slash" if i % 1000 == 0 else "",
+        )
+        for i in range(rows)
+    ]
+
+
+def run(name, rows, func):
+    objs = make_objects(rows, name)
+    truncate_table()
+
+    start = time.perf_counter()
+    inserted_cnt = len(func(objs))
+    cost = time.perf_counter() - start
+
+    print("%-22s rows: %-8s inserted: %-8s cost: %8.3fs  %10.0f rows/s" % (name, rows, inserted_cnt, cost, rows / cost))
+    return objs
+
+
+def main():
+    create_table()
+    manager = DingMsgPushLogModel.objects.using(USING)
+
+    for rows in ROWS_LIST:
+        if rows <= 100000:
+            # 单条 INSERT 语句包含全部记录, 百万级内存占用过大
+            run("bulk_create", rows, lambda objs: manager.bulk_create(objs))
+
+        run("bulk_create(chunked)", rows, lambda objs: manager.bulk_create(
+            objs, batch_size=CHUNK_SIZE, ignore_conflicts=True)
+        )
+        objs = run("bulk_insert(COPY)", rows, lambda objs: bulk_insert(
+            DingMsgPushLogModel, objs, conflict_field="msg_uid", chunk_size=CHUNK_SIZE, using=USING)
+        )
+
+        # 相同 msg_uid 再插入一次, 应全部跳过
+        duplicates = [DingMsgPushLogModel(msg_uid=obj.msg_uid) for obj in objs[:CHUNK_SIZE]]
+        inserted = bulk_insert(DingMsgPushLogModel, duplicates, conflict_field="msg_uid", using=USING)
+        assert not inserted, "msg_uid 冲突的记录没有被跳过"
+
+        with connections[USING].cursor() as cursor:
+            cursor.execute("SELECT traceback FROM pg_temp.%s WHERE msg_uid=%%s" % TABLE, ["bulk_insert(COPY)-0"])
+            assert cursor.fetchone()[0] == "line1\nline2\ttab\\slash", "COPY 转义不正确"
+
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+""" camel_underline 基准: 10k 行嵌套数据, 旧实现(每次编译正则 + 递归拷贝) vs 当前实现 """
+import re
+import sys
+import timeit
+import os.path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fosun_circle.libs.utils.camel_underline import camel_dict, underline_dict
+
+ROWS = 10000
+NUMBER = 5
+
+
+def old_camel2underline(camel_var_name):
+    pattern = re.compile(r'([a-z]|\d)([A-Z])')
+    return re.sub(pattern, r'\1_\2', camel_var_name).lower()
+
+
+def old_underline2camel(underline_var_name):
+    return re.sub(r'(_\w)', lambda x: x.group(1)[1].upper(), underline_var_name)
+
+
+def old_underline_dict(camel_params):
+    if isinstance(camel_params, dict):
+        return {old_camel2underline(k): old_underline_dict(v) for k, v in camel_params.items()}
+    elif isinstance(camel_params, list):
+        return [old_underline_dict(param) for param in camel_params]
+    return camel_params
+
+
+def old_camel_dict(underline_params):
+    if isinstance(underline_params, dict):
+        return {old_underline2camel(k): old_camel_dict(v) for k, v in underline_params.items()}
+    elif isinstance(underline_params, list):
+        return [old_camel_dict(param) for param in underline_params]
+    return underline_params
+
+
+def get_payload():
+    return {
+        "total_count": ROWS,
+        "list": [
+            dict(bbs_id=i, content_text="content " * 5, is_anonymous=False, create_time="2023-01-01 00:00:00",
+                 user_info=dict(user_id=i, phone_number="138%08d" % i, avatar_url="http://xxx/%s.png" % i),
+                 tag_list=[dict(tag_id=t, tag_name="tag_%s" % t) for t in range(3)],
+                 image_list=["http://xxx/%s_%s.png" % (i, n) for n in range(3)])
+            for i in range(ROWS)
+        ]
+    }
+
+
+def run():
+    payload = get_payload()
+    camel_payload = camel_dict(payload)
+
+    assert camel_payload == old_camel_dict(payload)
+    assert underline_dict(camel_payload) == old_underline_dict(camel_payload) == payload
+    # key 已是下划线的结构不做拷贝
+    assert underline_dict(payload) is payload
+
+    cases = [
+        ("camel_dict", lambda: old_camel_dict(payload), lambda: camel_dict(payload)),
+        ("underline_dict", lambda: old_underline_dict(camel_payload), lambda: underline_dict(camel_payload)),
+        ("underline_dict(unchanged)", lambda: old_underline_dict(payload), lambda: underline_dict(payload)),
+    ]
+
+    for name, old_func, new_func in cases:
+        old_cost = timeit.timeit(old_func, number=NUMBER) / NUMBER * 1000
+        new_cost = timeit.timeit(new_func, number=NUMBER) / NUMBER * 1000
+        print("%-28s old: %8.2f ms, new: %8.2f ms" % (name, old_cost, new_cost))
+
+
+if __name__ == "__main__":
+    run()
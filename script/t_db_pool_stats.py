@@ -0,0 +1,152 @@
+""" 连接池统计: 使用 SQLite 作为本地替身, 校验 checkout/checkin/invalidate/recycle/等待时间 等统计,
+fork 后子进程从零统计, 以及各进程发布到 Redis 的统计(需要 settings 中的 Redis)
+"""
+import sys
+import time
+import socket
+import sqlite3
+import os.path
+from multiprocessing.dummy import Pool as ThreadPool
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import Config
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", Config.DJANGO_SETTINGS_MODULE)
+django.setup()
+
+from django.test import override_settings
+from sqlalchemy import pool
+from sqlalchemy.dialects.sqlite.pysqlite import SQLiteDialect_pysqlite
+from fosun_circle.contrib.db_pool.core import conn_pool
+from fosun_circle.contrib.db_pool.core.stats import (
+    instrument_pool, observe_checkout, get_pool_stats, pool_stats, describe_conn_params,
+    publish_pool_stats, get_published_pool_stats,
+)
+
+ALIAS = "sqlite_stand_in"
+KEY = (ALIAS, "memory")
+
+
+def create_pool(**kwargs):
+    params = dict(pool_size=2, max_overflow=1, timeout=5, pre_ping=True, recycle=-1)
+    params.update(kwargs)
+
+    return pool.QueuePool(
+        lambda: sqlite3.connect(":memory:", check_same_thread=False),
+        dialect=SQLiteDialect_pysqlite(dbapi=sqlite3), **params
+    )
+
+
+def checkout(db_pool, hold=0.05):
+    with observe_checkout(db_pool):
+        conn = db_pool.connect()
+
+    conn.cursor().execute("SELECT 1")
+    time.sleep(hold)
+    conn.close()
+
+
+def test_counters_and_wait_time():
+    db_pool = create_pool()
+    instrument_pool(KEY, db_pool)
+
+    # 3 connections (2 + 1 overflow) for 9 threads: the others must wait
+    thread_pool = ThreadPool(9)
+    thread_pool.map(lambda _: checkout(db_pool), range(9))
+    thread_pool.close()
+    thread_pool.join()
+
+    stats, = get_pool_stats(ALIAS)
+    print(stats)
+
+    assert stats["checkouts"] == stats["checkins"] == 9
+    assert stats["connects"] <= 3
+    assert stats["checkedout"] == 0
+    assert stats["wait_count"] == 9 and stats["wait_max_ms"] >= 40
+
+
+def test_invalidate_and_recycle():
+    db_pool = create_pool(recycle=1)
+    instrument_pool(KEY, db_pool)
+
+    conn = db_pool.connect()
+    conn.invalidate()
+    conn.close()
+
+    checkout(db_pool, hold=0)       # reconnect after invalidation
+    time.sleep(1.1)
+    checkout(db_pool, hold=0)       # reconnect after recycle
+
+    stats, = get_pool_stats(ALIAS)
+    print(stats)
+
+    assert stats["invalidations"] == 1
+    assert stats["recycles"] == 1
+
+
+def test_pools_of_the_same_alias():
+    """ 同一 alias 不同连接参数的连接池分别统计, 互不覆盖 """
+    pool_a, pool_b = create_pool(), create_pool()
+    instrument_pool((ALIAS, "a"), pool_a)
+    instrument_pool((ALIAS, "b"), pool_b)
+
+    checkout(pool_a, hold=0)
+    checkout(pool_b, hold=0)
+    checkout(pool_b, hold=0)
+
+    stats_list = get_pool_stats(ALIAS)
+    print(stats_list)
+
+    assert len(stats_list) == 3     # KEY, a, b
+    assert pool_stats[(ALIAS, "a")].checkouts == 1
+    assert pool_stats[(ALIAS, "b")].checkouts == 2
+
+
+def test_describe_conn_params():
+    """ 区分同一 alias 的连接池, 但不暴露用户名、主机、密码 """
+    conn_params = dict(user="reader", password="secret", host="10.0.0.1", port=5432, database="fosun_circle")
+    target = describe_conn_params(conn_params)
+    print(target)
+
+    assert target.startswith("fosun_circle#")
+    assert all(str(conn_params[name]) not in target for name in ("user", "password", "host", "port"))
+    assert target != describe_conn_params(dict(conn_params, host="10.0.0.2"))
+
+
+def test_reset_after_fork():
+    """ 子进程不继承父进程的统计 """
+    assert pool_stats
+
+    pid = os.fork()
+    if pid == 0:
+        conn_pool.get_pool(ALIAS, {})
+        os._exit(0 if not pool_stats else 1)
+
+    _, status = os.waitpid(pid, 0)
+    assert status == 0, "fork 后子进程仍然统计父进程的连接池"
+
+
+def test_publish_pool_stats():
+    """ 进程发布统计到 Redis, db_pool_stats 命令从 Redis 读取各进程的统计 """
+    with override_settings(DB_POOL_STATS_PUBLISH_INTERVAL=60):
+        assert publish_pool_stats(force=True)
+        assert not publish_pool_stats()     # 间隔内不重复发布
+
+        published = get_published_pool_stats(ALIAS)
+        print(published)
+
+    data = published["%s:%s" % (socket.gethostname(), os.getpid())]
+    assert data["pid"] == os.getpid()
+    assert len(data["pools"][ALIAS]) == len(get_pool_stats(ALIAS))
+
+
+if __name__ == "__main__":
+    test_counters_and_wait_time()
+    test_invalidate_and_recycle()
+    test_pools_of_the_same_alias()
+    test_describe_conn_params()
+    test_reset_after_fork()
+    test_publish_pool_stats()
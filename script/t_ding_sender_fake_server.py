@@ -0,0 +1,196 @@
+""" 钉钉工作通知并发推送(fosun_circle.core.ding_talk.sender.DingMessageSender)
+
+本地启动模拟的钉钉接口(/gettoken, /router/rest), 每个请求有 LATENCY 秒延迟, 部分推送的第一次请求固定失败
+(限流错误 90018、HTTP 503、断开连接, 见 FIRST_ATTEMPT_ERRORS), 对比串行、并发、两个进程并发推送的耗时, 并校验:
+全部推送成功, 同时进行的请求数不超过并发数, 每个微应用的请求速率(所有进程合计)不超过 QPS
+
+限流配额保存在 redis(django_redis 默认连接)中, 需要可用的 redis
+
+redis 6.2 上的运行结果(LATENCY=0.2, QPS=10, 40 个推送中 24 个第一次请求失败, serial 的耗时主要是重试退避):
+    serial     jobs: 40 ok: 40 requests: 64 cost: 18.527s max in-flight: 1 max qps per app: [3, 3]
+    concurrent jobs: 40 ok: 40 requests: 64 cost: 3.810s max in-flight: 5 max qps per app: [10, 10]
+    2 procs    jobs: 40 ok: 40 requests: 64 cost: 3.675s max in-flight: 6 max qps per app: [10, 10]
+"""
+import sys
+import json
+import time
+import random
+import os.path
+import multiprocessing
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import Config
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", Config.DJANGO_SETTINGS_MODULE)
+django.setup()
+
+from config.conf.dingtalk import DingTalkConfig
+from fosun_circle.core.ding_talk.sender import DingMessageSender
+
+LATENCY = 0.2
+JOB_COUNT = 40
+CONCURRENCY = 8
+QPS = 10
+APP_KEYS = ["fake_app_key_1", "fake_app_key_2"]
+RESPONSE_KEY = "dingtalk_oapi_message_corpconversation_asyncsend_v2_response"
+
+# 第 i 个推送(i % 5)第一次请求的错误, 重试后成功
+FIRST_ATTEMPT_ERRORS = {0: "90018", 1: "503", 2: "disconnect"}
+RETRY_COUNT = sum(1 for i in range(JOB_COUNT) if i % 5 in FIRST_ATTEMPT_ERRORS)
+
+
+class Stats:
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    request_times = []  # [(app_key, time)]
+    attempts = {}       # job index -> 请求次数
+
+
+class FakeDingHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _write_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        app_key = query.get("appkey", [""])[0]
+        self._write_json(dict(errcode=0, errmsg="ok", access_token="token-%s" % app_key, expires_in=7200))
+
+    def do_POST(self):
+        query = parse_qs(urlparse(self.path).query)
+        app_key = query.get("session", [""])[0].replace("token-", "")
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        job_index = int(query["userid_list"][0].replace("job", ""))
+
+        with Stats.lock:
+            Stats.in_flight += 1
+            Stats.max_in_flight = max(Stats.max_in_flight, Stats.in_flight)
+            Stats.request_times.append((app_key, time.monotonic()))
+            Stats.attempts[job_index] = attempt = Stats.attempts.get(job_index, 0) + 1
+
+        time.sleep(LATENCY)
+
+        with Stats.lock:
+            Stats.in_flight -= 1
+
+        error = FIRST_ATTEMPT_ERRORS.get(job_index % 5) if attempt == 1 else None
+
+        if error == "disconnect":
+            self.close_connection = True
+            return
+
+        if error == "503":
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if error == "90018":
+            result = dict(errcode=90018, errmsg="request too fast")
+        else:
+            result = dict(errcode=0, errmsg="ok", task_id=random.randint(1, 10 ** 10), request_id="fake")
+
+        self._write_json({RESPONSE_KEY: result})
+
+
+def make_jobs():
+    return [
+        dict(
+            msg_type="oa", userid_list=["job%s" % i],
+            body_kwargs=dict(title="title%s" % i, content="content", message_url="https://example.com", author="test"),
+            api_init_kwargs=dict(
+                corp_id="fake_corp_id", app_key=APP_KEYS[i % len(APP_KEYS)], app_secret="fake", agent_id=1,
+            ),
+        )
+        for i in range(JOB_COUNT)
+    ]
+
+
+def max_qps(app_key):
+    """ 任意 1 秒窗口内的最大请求数 """
+    times = sorted(t for key, t in Stats.request_times if key == app_key)
+    return max((sum(1 for t2 in times if t <= t2 < t + 1) for t in times), default=0)
+
+
+def send_in_process(jobs, max_workers, queue):
+    queue.put(DingMessageSender(max_workers=max_workers, qps=QPS).send(jobs))
+
+
+def send_in_processes(jobs, max_workers, processes=2):
+    """ 每个进程各自的 DingMessageSender 推送一部分, 限流配额通过 redis 共享 """
+    ctx = multiprocessing.get_context("fork")
+    queue = ctx.Queue()
+    workers = [
+        ctx.Process(target=send_in_process, args=(jobs[i::processes], max_workers, queue))
+        for i in range(processes)
+    ]
+
+    for worker in workers:
+        worker.start()
+
+    results = [ret for _ in workers for ret in queue.get()]
+
+    for worker in workers:
+        worker.join()
+
+    return results
+
+
+def run(name, max_workers, processes=1):
+    Stats.max_in_flight = 0
+    Stats.request_times = []
+    Stats.attempts = {}
+    # 上一轮的请求离开 1 秒窗口
+    time.sleep(1)
+
+    start = time.perf_counter()
+
+    if processes == 1:
+        results = DingMessageSender(max_workers=max_workers, qps=QPS).send(make_jobs())
+    else:
+        results = send_in_processes(make_jobs(), max_workers, processes)
+
+    cost = time.perf_counter() - start
+
+    ok_cnt = sum(1 for ret in results if ret["errcode"] == 0)
+    qps_list = [max_qps(app_key) for app_key in APP_KEYS]
+    print("%-10s jobs: %s ok: %s requests: %s cost: %.3fs max in-flight: %s max qps per app: %s" % (
+        name, len(results), ok_cnt, len(Stats.request_times), cost, Stats.max_in_flight, qps_list
+    ))
+
+    assert len(results) == JOB_COUNT
+    assert ok_cnt == JOB_COUNT, "有推送失败: %s" % [ret["errmsg"] for ret in results if ret["errcode"] != 0][:3]
+    assert len(Stats.request_times) == JOB_COUNT + RETRY_COUNT, "重试次数不正确"
+    assert Stats.max_in_flight <= max_workers * processes, "并发数超过限制"
+    assert all(qps <= QPS + 1 for qps in qps_list), "QPS 超过限制"
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeDingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    DingTalkConfig.DING_API_BASE_URL = "http://127.0.0.1:%s/" % server.server_address[1]
+
+    try:
+        run("serial", 1)
+        run("concurrent", CONCURRENCY)
+        run("2 procs", CONCURRENCY, processes=2)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
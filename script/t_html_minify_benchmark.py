@@ -0,0 +1,61 @@
+""" HTML 压缩吞吐: bs4(html5lib / html.parser) vs 流式压缩 vs 摘要缓存, 使用项目模板 """
+import sys
+import time
+import os.path
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import Config
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", Config.DJANGO_SETTINGS_MODULE)
+django.setup()
+
+from django.conf import settings
+from fosun_circle.contrib.minify_html.minify import html_minify, stream_minify, cached_html_minify
+
+ROUNDS = 20
+
+
+def get_templates():
+    template_dirs = [str(d) for tpl in settings.TEMPLATES for d in tpl.get("DIRS", [])]
+    pages = []
+
+    for template_dir in template_dirs:
+        for root, _, files in os.walk(template_dir):
+            for filename in files:
+                if filename.endswith(".html"):
+                    with open(os.path.join(root, filename), encoding="utf-8") as fp:
+                        pages.append(fp.read())
+
+    return pages
+
+
+def throughput(name, func, pages):
+    total_bytes = sum(len(page.encode()) for page in pages) * ROUNDS
+    start = time.perf_counter()
+
+    for _ in range(ROUNDS):
+        for page in pages:
+            func(page)
+
+    cost = time.perf_counter() - start
+    print("%-24s %8.2f MB/s, %8.2f pages/s" % (name, total_bytes / cost / 1024 / 1024, len(pages) * ROUNDS / cost))
+
+
+def run():
+    pages = get_templates()
+    print("templates: %s, total size: %.1f KB" % (len(pages), sum(len(p) for p in pages) / 1024))
+
+    if not pages:
+        return
+
+    throughput("bs4 + html5lib", lambda page: html_minify(page, parser="html5lib"), pages)
+    throughput("bs4 + html.parser", lambda page: html_minify(page, parser="html.parser"), pages)
+    throughput("stream", stream_minify, pages)
+    throughput("stream + digest cache", cached_html_minify, pages)
+
+
+if __name__ == "__main__":
+    run()
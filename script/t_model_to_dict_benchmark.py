@@ -0,0 +1,74 @@
+""" BaseAbstractModel.to_dict / fields: 每次重新计算字段 vs 预计算的字段元数据 (100k 行) """
+import sys
+import time
+import os.path
+from datetime import datetime
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import Config
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", Config.DJANGO_SETTINGS_MODULE)
+django.setup()
+
+from fosun_circle.core.db.base import BaseAbstractModel
+from ding_talk.models import DingMsgPushLogModel
+
+ROWS = 100000
+
+
+def legacy_fields(cls, exclude=()):
+    fields = []
+    exclude_fields = set(exclude)
+    abc_meta_cls = getattr(BaseAbstractModel, "_meta", None)
+    abc_fields = abc_meta_cls.fields if abc_meta_cls else []
+    abc_fields_name_list = [_field.name for _field in abc_fields]
+
+    for field in cls._meta.fields:
+        field_name = field.attname
+
+        if field_name in exclude_fields:
+            continue
+
+        if field_name not in abc_fields_name_list:
+            fields.append(field_name)
+
+    return fields
+
+
+def legacy_to_dict(obj, *extra, exclude=()):
+    fields = list(set(legacy_fields(obj.__class__) + list(extra)) - set(exclude))
+    return {_field: obj.default(obj.__dict__[_field]) for _field in fields}
+
+
+def bench(name, func, objects):
+    start = time.perf_counter()
+    result = [func(obj) for obj in objects]
+    print("%-28s %.1f ms" % (name, (time.perf_counter() - start) * 1000))
+    return result
+
+
+def run():
+    now = datetime.now()
+    objects = [
+        DingMsgPushLogModel(id=i, ding_msg_id=i, send_time=now, receiver_mobile="138%08d" % i, msg_uid="uid_%s" % i)
+        for i in range(ROWS)
+    ]
+
+    legacy = bench("legacy to_dict", legacy_to_dict, objects)
+    cached = bench("cached to_dict", lambda obj: obj.to_dict(), objects)
+    assert legacy == cached
+
+    legacy = bench("legacy to_dict(exclude)", lambda obj: legacy_to_dict(obj, exclude=["id"]), objects)
+    cached = bench("cached to_dict(exclude)", lambda obj: obj.to_dict(exclude=["id"]), objects)
+    assert legacy == cached
+
+    assert legacy_fields(DingMsgPushLogModel) == DingMsgPushLogModel.fields()
+    assert legacy_fields(DingMsgPushLogModel, ["id"]) == DingMsgPushLogModel.fields(exclude=["id"])
+    bench("attribute access only", lambda obj: obj.__dict__.copy(), objects)
+
+
+if __name__ == "__main__":
+    run()
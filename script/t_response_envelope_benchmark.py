@@ -0,0 +1,57 @@
+""" 标准响应结构包装耗时: 旧流程(渲染 -> json.loads -> 包装 -> 再渲染) vs StandardJSONRenderer(包装一次后渲染) """
+import sys
+import json
+import timeit
+import os.path
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import Config
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", Config.DJANGO_SETTINGS_MODULE)
+django.setup()
+
+from rest_framework.renderers import JSONRenderer
+from fosun_circle.contrib.drf.renderers import standard_response_data
+
+ROWS = 10000
+NUMBER = 10
+
+
+def get_payload():
+    return [
+        dict(id=i, title="title_%s" % i, content="content " * 10, is_del=False,
+             author=dict(user_id=i, phone_number="138%08d" % i, avatar="http://xxx/%s.png" % i),
+             tags=[dict(tag_id=t, tag_name="tag_%s" % t) for t in range(3)])
+        for i in range(ROWS)
+    ]
+
+
+def old_pipeline(renderer, payload):
+    content = renderer.render(payload)
+    raw_result = json.loads(content)
+    return renderer.render(standard_response_data(raw_result, 200))
+
+
+def new_pipeline(renderer, payload):
+    return renderer.render(standard_response_data(payload, 200))
+
+
+def run():
+    payload = get_payload()
+    renderer = JSONRenderer()
+
+    assert old_pipeline(renderer, payload) == new_pipeline(renderer, payload)
+
+    old_cost = timeit.timeit(lambda: old_pipeline(renderer, payload), number=NUMBER)
+    new_cost = timeit.timeit(lambda: new_pipeline(renderer, payload), number=NUMBER)
+
+    print("rows: %s" % ROWS)
+    print("render -> loads -> render: %.2f ms/resp" % (old_cost / NUMBER * 1000))
+    print("envelope once -> render:   %.2f ms/resp" % (new_cost / NUMBER * 1000))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,46 @@
+""" 分表 Model: 并发获取同一分表只创建一个 Model 类, 重复访问不再创建类 / deepcopy 字段 """
+import sys
+import timeit
+import os.path
+from multiprocessing.dummy import Pool as ThreadPool
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import Config
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", Config.DJANGO_SETTINGS_MODULE)
+django.setup()
+
+from fosun_circle.core.db.base import ShardRouter
+from ding_talk.models import DingMsgPushLogModel
+
+NUMBER = 100000
+
+
+def test_concurrent_get_sharding():
+    pool = ThreadPool(32)
+    models = pool.map(lambda _: DingMsgPushLogModel.get_sharding("circle_ding_msg_push_log_0"), range(1000))
+    pool.close()
+    pool.join()
+
+    assert len({id(model_cls) for model_cls in models}) == 1
+    assert models[0]._meta.db_table == "circle_ding_msg_push_log_0"
+    assert DingMsgPushLogModel._meta.db_table != "circle_ding_msg_push_log_0"
+
+
+def test_router():
+    router = ShardRouter(DingMsgPushLogModel, "circle_ding_msg_push_log_{shard}", shard_func=lambda key: key % 4)
+    model_cls, using = router.route(5)
+
+    assert model_cls._meta.db_table == "circle_ding_msg_push_log_1"
+    assert router.get_model(9) is model_cls and using is None
+
+    cost = timeit.timeit(lambda: router.route(5), number=NUMBER)
+    print("router.route: %.3f us/call" % (cost / NUMBER * 1e6))
+
+
+if __name__ == "__main__":
+    test_concurrent_get_sharding()
+    test_router()
@@ -0,0 +1,67 @@
+""" 限流并发测试: 多线程同时打同一个 key, 校验放行数量不超过限额 (no over-admission) """
+import sys
+import time
+import os.path
+from multiprocessing.dummy import Pool as ThreadPool
+
+import django
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import Config
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", Config.DJANGO_SETTINGS_MODULE)
+django.setup()
+
+from django_redis import get_redis_connection
+from fosun_circle.contrib.drf.throttling import SlidingWindowLimiter
+
+LIMIT = 50
+DURATION = 60
+THREADS = 64
+REQUESTS = 2000
+
+
+def test_no_over_admission():
+    client = get_redis_connection()
+    limiter = SlidingWindowLimiter(client)
+    key = "throttle_concurrency_test_%s" % int(time.time())
+    client.delete(key)
+
+    def hit(_):
+        allowed, hits, _oldest = limiter.hit(key, LIMIT, DURATION, time.time())
+        assert hits <= LIMIT, hits
+        return allowed
+
+    start = time.time()
+    pool = ThreadPool(THREADS)
+    results = pool.map(hit, range(REQUESTS))
+    pool.close()
+    pool.join()
+    cost = time.time() - start
+
+    admitted = sum(results)
+    stored = client.zcard(key)
+    client.delete(key)
+
+    print("requests: %s, admitted: %s, stored: %s, cost: %.3fs" % (REQUESTS, admitted, stored, cost))
+    assert admitted == LIMIT, admitted
+    assert stored == LIMIT, stored
+
+
+def test_window_slides():
+    client = get_redis_connection()
+    limiter = SlidingWindowLimiter(client)
+    key = "throttle_window_test_%s" % int(time.time())
+    client.delete(key)
+
+    now = time.time()
+    assert all(limiter.hit(key, 3, 1, now)[0] for _ in range(3))
+    assert not limiter.hit(key, 3, 1, now + 0.5)[0]
+    assert limiter.hit(key, 3, 1, now + 1.001)[0]
+    client.delete(key)
+
+
+if __name__ == "__main__":
+    test_no_over_admission()
+    test_window_slides()